@@ -0,0 +1,234 @@
+"""Benchmark GoogleCalendar and the cli flows against a local fake Google API.
+
+For each calendar size a fake API (benchmarks/fake_google.py) is started in
+its own process with generated events and tasks and a fixed round-trip
+latency. The real client is pointed at it through BOOKEY_API_ENDPOINT, with
+login swapped for a fake token. Reports, per size:
+
+  * startup: client construction plus the first (cold) week listing
+  * list latency: week of events, task list and agenda, live and from a
+    synced local store, and the `bk -l` / `bk --agenda` output paths
+  * a year of events with recurring series expanded by Google and locally
+    (local_recurrence), in time and kilobytes received
+  * mutation throughput: batched inserts, deletes and completes, and adds
+    through the offline journal
+  * `bk export` of every event and task, to ICS and NDJSON
+  * peak Python memory (tracemalloc) of the listing and export paths
+  * connections opened for all of the above, and requests sent per connection
+
+    PYTHONPATH=src python benchmarks/bench_api.py [--sizes 10,1000,10000,100000] [--recurring N] [--latency MS] [--runs N] [--mutations N]
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from google.oauth2.credentials import Credentials
+
+import bookey.google_calendar as google_calendar
+from bookey import cli
+from bookey.config import DEFAULTS
+from bookey.journal import JournaledCalendar
+from bookey.store import Store
+from bookey.transport import shared_pool
+
+
+FAKE_SERVER = os.path.join(os.path.dirname(__file__), "fake_google.py")
+
+
+def fake_login():
+    return Credentials(token="benchmark")
+
+
+@contextlib.contextmanager
+def fake_api(events, tasks, latency, recurring=0):
+    process = subprocess.Popen(
+        [sys.executable, FAKE_SERVER, "--events", str(events), "--tasks", str(tasks), "--latency", str(latency),
+         "--recurring", str(recurring)],
+        stdout=subprocess.PIPE, text=True,
+    )
+    try:
+        line = process.stdout.readline()
+        if not line.startswith("READY "):
+            raise RuntimeError("fake API didn't start")
+        os.environ["BOOKEY_API_ENDPOINT"] = line.split()[1]
+
+        # Discovery documents are memoised per process with the endpoint baked in
+
+        google_calendar._discovery_docs.clear()
+        yield
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def client(store=None, local_recurrence=False):
+    config = dict(DEFAULTS, local_recurrence=local_recurrence, rate_limits={
+        "calendar": {"per_second": 10_000, "burst": 10_000},
+        "tasks": {"per_second": 10_000, "burst": 10_000},
+    })
+    return google_calendar.GoogleCalendar(store=store, config=config)
+
+
+def timed(fn, runs=1):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def peak_memory(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def quiet(fn):
+
+    # The cli flows print their listing (and export its summary on stderr), which is part of what's measured
+    # but not worth showing
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            fn()
+    return run
+
+
+def received_kb(gc, fn):
+    before = gc.scheduler.summary().get("calendar", {}).get("bytes", 0)
+    fn()
+    return (gc.scheduler.summary()["calendar"]["bytes"] - before) / 1024
+
+
+def bench_size(events, tasks, latency, runs, mutations, recurring):
+    results = {}
+    today = datetime.now()
+    week = lambda gc: gc.getCalendarSlots(today, 7)
+
+    with fake_api(events, tasks, latency, recurring):
+        before = shared_pool().stats()
+
+        # Startup: a fresh client, its services and the first listing, all cold
+
+        def startup():
+            google_calendar._discovery_docs.clear()
+            week(client())
+        results["startup (client + first week)"] = ("ms", timed(startup, runs) * 1000)
+
+        gc = client()
+        week(gc)
+        results["list week (live)"] = ("ms", timed(lambda: week(gc), runs) * 1000)
+        results["list tasks (live)"] = ("ms", timed(gc.getTasks, runs) * 1000)
+        results["agenda (live)"] = ("ms", timed(lambda: gc.getAgenda(today), runs) * 1000)
+        results["bk -l events"] = ("ms", timed(quiet(lambda: cli._list_events(gc)), runs) * 1000)
+        results["bk -l tasks"] = ("ms", timed(quiet(lambda: cli._list_tasks(gc)), runs) * 1000)
+        results["bk --agenda"] = ("ms", timed(quiet(lambda: cli.cli_agenda(gc)), runs) * 1000)
+        results["bk -l --range 90d (piped)"] = ("ms", timed(quiet(lambda: cli.cli_list(gc, 90)), runs) * 1000)
+
+        # A year at once: every instance of every series from Google, or each series once and expanded here
+
+        year = lambda gc: gc.getCalendarSlots(today, 365)
+        for label, local in [("Google expands", False), ("local expansion", True)]:
+            expanding = client(local_recurrence=local)
+            results[f"list 365 days, {label}"] = ("ms", timed(lambda: year(expanding), runs) * 1000)
+            results[f"list 365 days, {label}, received"] = ("KB", received_kb(expanding, lambda: year(expanding)))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            for fmt in ("ics", "ndjson"):
+                path = os.path.join(tmp, f"export.{fmt}")
+                elapsed = timed(quiet(lambda: cli.cli_export(gc, path)))
+                results[f"bk export (.{fmt})"] = ("records/s", (events + tasks) / elapsed)
+            results["peak mem: bk export (.ics)"] = ("MB", peak_memory(quiet(lambda: cli.cli_export(gc, path))) / 2 ** 20)
+
+            stored = client(Store(os.path.join(tmp, "bench.db")))
+            results["store first sync + week"] = ("ms", timed(lambda: week(stored)) * 1000)
+            results["list week (store)"] = ("ms", timed(lambda: week(stored), runs) * 1000)
+            results["list tasks (store)"] = ("ms", timed(stored.getTasks, runs) * 1000)
+
+            # Peak memory of the listings, in their own pass since tracemalloc slows everything down
+
+            results["peak mem: list week (live)"] = ("MB", peak_memory(lambda: week(gc)) / 2 ** 20)
+            results["peak mem: agenda (live)"] = ("MB", peak_memory(lambda: gc.getAgenda(today)) / 2 ** 20)
+            results["peak mem: 90 days at once"] = ("MB", peak_memory(quiet(lambda: cli._fetch_events(gc, 90))) / 2 ** 20)
+            results["peak mem: bk -l --range 90d"] = ("MB", peak_memory(quiet(lambda: cli.cli_list(gc, 90))) / 2 ** 20)
+            fresh = client(Store(os.path.join(tmp, "memory.db")))
+            results["peak mem: store first sync"] = ("MB", peak_memory(lambda: week(fresh)) / 2 ** 20)
+
+            # Mutations: batched inserts, then deleting them, then completing tasks
+
+            day = (today + timedelta(days=3)).strftime("%Y-%m-%d")
+            inserts = [
+                (i, {"summary": f"Bench {i}", "start_time": f"{day}T09:00:00",
+                     "end_time": f"{day}T10:00:00", "id": f"bkbench{i:06d}"})
+                for i in range(mutations)
+            ]
+            elapsed = timed(lambda: gc.insert_events(inserts))
+            results["insert events (batched)"] = ("ops/s", mutations / elapsed)
+            elapsed = timed(lambda: gc.delete_events([("primary", f["id"]) for _, f in inserts]))
+            results["delete events (batched)"] = ("ops/s", mutations / elapsed)
+            task_ids = [("@default", t["id"]) for t in gc.getTasks()[:mutations]]
+            if task_ids:
+                elapsed = timed(lambda: gc.complete_tasks(task_ids))
+                results["complete tasks (batched)"] = ("ops/s", len(task_ids) / elapsed)
+
+            # The journal: every add returns at once, throughput is until the background flush is done
+
+            journal_store = Store(os.path.join(tmp, "journal.db"))
+            journaled = JournaledCalendar(client(journal_store), journal_store)
+
+            def journal_adds():
+                for i in range(mutations):
+                    journaled.add_calendar(f"Queued {i}", f"{day}T11:00:00", f"{day}T12:00:00")
+                failed, pending = journaled.finish(timeout=600)
+                if failed or pending:
+                    raise RuntimeError(f"journal flush left {len(failed)} failed, {pending} pending")
+            results["add events (journal, flushed)"] = ("ops/s", mutations / timed(journal_adds))
+
+        # Every client in the run shares the process's pool, so this is how many handshakes the whole size cost
+
+        after = shared_pool().stats()
+        results["connections opened"] = ("n", after["connections"] - before["connections"])
+        results["requests per connection"] = ("n", (after["requests"] - before["requests"])
+                                              / max(1, after["connections"] - before["connections"]))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10,1000,10000,100000", help="comma-separated event counts")
+    parser.add_argument("--tasks", type=int, default=500, help="tasks on the fake task list")
+    parser.add_argument("--recurring", type=int, default=50, help="weekly recurring series on the fake calendar")
+    parser.add_argument("--latency", type=float, default=20, help="ms the fake API adds to every round trip")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--mutations", type=int, default=200)
+    args = parser.parse_args()
+
+    google_calendar.login = fake_login
+    sizes = [int(s) for s in args.sizes.split(",")]
+    table = {}
+    for size in sizes:
+        print(f"  {size} events ...", file=sys.stderr)
+        for name, (unit, value) in bench_size(size, args.tasks, args.latency, args.runs, args.mutations, args.recurring).items():
+            table.setdefault((name, unit), {})[size] = value
+
+    print(f"\n{'latency ' + str(args.latency) + ' ms':<46}" + "".join(f"{s:>12}" for s in sizes))
+    for (name, unit), values in table.items():
+        cells = "".join(f"{values[s]:>12.1f}" if s in values else f"{'-':>12}" for s in sizes)
+        print(f"{name + ' (' + unit + ')':<46}{cells}")
+
+
+if __name__ == "__main__":
+    main()
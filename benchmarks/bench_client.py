@@ -0,0 +1,58 @@
+"""Time GoogleCalendar construction and first use of each service.
+
+Runs offline: login is swapped for a fake access token, and building a
+service never touches the network because discovery documents come from
+the bundled static copies or the on-disk cache.
+
+    python benchmarks/bench_client.py [--runs N]
+"""
+import argparse
+import statistics
+import time
+
+from google.oauth2.credentials import Credentials
+
+import bookey.google_calendar as google_calendar
+
+
+def fake_login():
+    return Credentials(token="benchmark")
+
+
+def measure(runs):
+    google_calendar.login = fake_login
+    timings = {"construct": [], "first task access": [], "first calendar access": []}
+
+    for _ in range(runs):
+
+        # Start each run cold so the in-process discovery memo doesn't hide the parse
+
+        google_calendar._discovery_docs.clear()
+
+        start = time.perf_counter()
+        gc = google_calendar.GoogleCalendar()
+        timings["construct"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        gc.task
+        timings["first task access"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        gc.calendar
+        timings["first calendar access"].append(time.perf_counter() - start)
+
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    for name, samples in measure(args.runs).items():
+        print(f"{name:<24} median {statistics.median(samples) * 1000:7.2f} ms"
+              f"   max {max(samples) * 1000:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Hold `bk` startup to a fixed budget.
+
+Measures three things in fresh interpreters:
+
+  * `python -X importtime -c "import bookey.app"`: total import cost, and
+    whether any Google client module got pulled in at import time
+  * wall time of `bk --help`
+  * time until the interactive menu's first paint, driven through a pty
+    and exited through its "Exit" entry (the menu never logs in before an
+    action is picked)
+
+Exits non-zero when a budget is exceeded.
+
+    python benchmarks/bench_startup.py [--runs N] [--help-budget MS] [--menu-budget MS]
+"""
+import argparse
+import os
+import pty
+import re
+import select
+import statistics
+import subprocess
+import sys
+import time
+
+
+ENV = dict(os.environ, PYTHONPATH=os.path.join(os.path.dirname(__file__), "..", "src"))
+HEAVY_PREFIXES = ("google", "googleapiclient", "google_auth_oauthlib", "httplib2", "requests")
+MENU_PROMPT = b"What would you like to do?"
+
+
+def import_profile():
+    """Return (total import µs for bookey.app, heavy modules imported)."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import bookey.app"],
+        env=ENV, capture_output=True, text=True, check=True,
+    )
+    total = 0
+    heavy = []
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)", line)
+        if not match:
+            continue
+        cumulative, indent, module = int(match[1]), match[2], match[3]
+        if module == "bookey.app" and not indent:
+            total = cumulative
+        if module.split(".")[0] in HEAVY_PREFIXES:
+            heavy.append(module)
+    return total, heavy
+
+
+def time_help():
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-m", "bookey.app", "--help"],
+                   env=ENV, stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+
+def time_menu_paint():
+    start = time.perf_counter()
+    pid, fd = pty.fork()
+    if pid == 0:
+        os.execve(sys.executable, [sys.executable, "-m", "bookey.app"], ENV)
+
+    output = b""
+    painted = None
+    try:
+        while painted is None:
+            ready, _, _ = select.select([fd], [], [], 10)
+            if not ready:
+                raise RuntimeError("menu never painted")
+            output += os.read(fd, 4096)
+
+            # First paint is done once the prompt and the whole option list are on screen
+
+            if MENU_PROMPT in output and b". Exit" in output:
+                painted = time.perf_counter() - start
+        exit_choice = re.search(rb"(\d+)\. Exit", output)[1]
+        os.write(fd, exit_choice)
+        while True:
+            try:
+                if not os.read(fd, 4096):
+                    break
+            except OSError:
+                break
+    finally:
+        os.waitpid(pid, 0)
+        os.close(fd)
+    return painted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--help-budget", type=float, default=150, help="ms, median of `bk --help`")
+    parser.add_argument("--menu-budget", type=float, default=200, help="ms, median menu first paint")
+    args = parser.parse_args()
+
+    failed = False
+
+    total, heavy = import_profile()
+    print(f"import bookey.app        {total / 1000:7.2f} ms")
+    if heavy:
+        print(f"  heavy modules imported at startup: {', '.join(sorted(set(heavy)))}")
+        failed = True
+
+    for name, fn, budget in [
+        ("bk --help", time_help, args.help_budget),
+        ("menu first paint", time_menu_paint, args.menu_budget),
+    ]:
+        samples = [fn() for _ in range(args.runs)]
+        median = statistics.median(samples) * 1000
+        status = "ok" if median <= budget else "OVER BUDGET"
+        print(f"{name:<24} {median:7.2f} ms   (budget {budget:.0f} ms) {status}")
+        failed = failed or median > budget
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,504 @@
+"""A local stand-in for the Calendar and Tasks APIs, for benchmarks.
+
+Serves the calls Bookey makes, from generated in-memory data: calendar and
+task list listings, ranged, searched (q=) and sync-token event listings, task listings with
+dueMax / updatedMin, free/busy, inserts, deletes, patches, and the multipart
+batch endpoints. Weekly recurring series are listed as instances with
+singleEvents=true and as one master each otherwise. Honours `fields=` partial responses and gzip, and can add a fixed
+latency to every round trip. Point Bookey at it with BOOKEY_API_ENDPOINT.
+
+    python benchmarks/fake_google.py [--events N] [--recurring N] [--tasks N] [--calendars N] [--latency MS] [--port P]
+
+Prints `READY <url>` once listening.
+"""
+import argparse
+import bisect
+import gzip
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+
+WORDS = ["Standup", "Review", "Planning", "Sync", "Lunch", "Dentist", "Gym", "Call", "Retro",
+         "Interview", "Design", "Budget", "Offsite", "Demo", "Onboarding", "1:1", "Workshop"]
+
+
+# ── Generated data ──────────────────────────────────────────────
+
+
+# Big meeting invites carry attendees, conference data and an HTML description, which `fields=` should skip.
+# They're shared between events so 100k of them still fit in memory
+
+_rng = random.Random(0)
+DESCRIPTIONS = ["<p>" + " ".join(_rng.choice(WORDS) for _ in range(60)) + "</p>" for _ in range(16)]
+ATTENDEES = [[{"email": f"person{i}@example.com", "responseStatus": "accepted"} for i in range(n)]
+             for n in range(26)]
+CONFERENCE = {"entryPoints": [{"entryPointType": "video", "uri": "https://meet.example.com/abc"}]}
+
+
+def _event(rng, event_id, day):
+    title = f"{rng.choice(WORDS)} {rng.choice(WORDS).lower()}"
+    event = {
+        "kind": "calendar#event",
+        "id": event_id,
+        "status": "confirmed",
+        "htmlLink": f"https://www.google.com/calendar/event?eid={event_id}",
+        "summary": title,
+        "description": rng.choice(DESCRIPTIONS),
+        "organizer": {"email": "organizer@example.com"},
+        "attendees": ATTENDEES[rng.randint(2, 25)],
+        "conferenceData": CONFERENCE,
+        "reminders": {"useDefault": True},
+    }
+    if rng.random() < 0.1:
+        event["start"] = {"date": day.strftime("%Y-%m-%d")}
+        event["end"] = {"date": (day + timedelta(days=1)).strftime("%Y-%m-%d")}
+    else:
+        start = day + timedelta(hours=rng.randint(8, 18), minutes=rng.choice([0, 15, 30, 45]))
+        end = start + timedelta(minutes=rng.choice([30, 45, 60, 90, 120]))
+        event["start"] = {"dateTime": start.strftime("%Y-%m-%dT%H:%M:%SZ")}
+        event["end"] = {"dateTime": end.strftime("%Y-%m-%dT%H:%M:%SZ")}
+    return event
+
+
+def _series(rng, series_id, today, days):
+
+    # A weekly meeting (every other week for some) that started `days / 2` ago and never ends
+
+    event = _event(rng, series_id, today - timedelta(days=days // 2))
+    if "date" in event["start"]:
+        return _series(rng, series_id, today, days)
+    event["start"]["timeZone"] = event["end"]["timeZone"] = "UTC"
+    weekday = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"][
+        datetime.strptime(event["start"]["dateTime"], "%Y-%m-%dT%H:%M:%SZ").weekday()]
+    interval = rng.choice([1, 1, 1, 2])
+    event["recurrence"] = [f"RRULE:FREQ=WEEKLY;INTERVAL={interval};BYDAY={weekday}"]
+    return event
+
+
+def _instances(series, until):
+
+    # The fake only writes rules its own generator made, so expanding them is a fixed step from the first start
+
+    step = timedelta(weeks=int(series["recurrence"][0].split("INTERVAL=")[1].split(";")[0]))
+    start = datetime.strptime(series["start"]["dateTime"], "%Y-%m-%dT%H:%M:%SZ")
+    end = datetime.strptime(series["end"]["dateTime"], "%Y-%m-%dT%H:%M:%SZ")
+    while start < until:
+        instance = {k: v for k, v in series.items() if k != "recurrence"}
+        instance["id"] = f"{series['id']}_{start:%Y%m%dT%H%M%SZ}"
+        instance["recurringEventId"] = series["id"]
+        instance["originalStartTime"] = {"dateTime": start.strftime("%Y-%m-%dT%H:%M:%SZ"), "timeZone": "UTC"}
+        instance["start"] = {"dateTime": start.strftime("%Y-%m-%dT%H:%M:%SZ"), "timeZone": "UTC"}
+        instance["end"] = {"dateTime": end.strftime("%Y-%m-%dT%H:%M:%SZ"), "timeZone": "UTC"}
+        yield instance
+        start += step
+        end += step
+
+
+def _task(rng, task_id, today):
+    task = {
+        "kind": "tasks#task",
+        "id": task_id,
+        "title": f"{rng.choice(WORDS)} follow-up",
+        "notes": " ".join(rng.choice(WORDS) for _ in range(rng.randint(0, 30))),
+        "status": "needsAction",
+        "updated": today.strftime("%Y-%m-%dT00:00:00.000Z"),
+        "links": [],
+    }
+    if rng.random() < 0.8:
+        task["due"] = (today + timedelta(days=rng.randint(-30, 60))).strftime("%Y-%m-%dT00:00:00.000Z")
+    return task
+
+
+def _when(side):
+
+    # Comparable start / end key, timezone suffixes dropped (the fake lives in UTC)
+
+    value = side.get("dateTime") or side.get("date") + "T00:00:00"
+    return value[:19]
+
+
+class FakeGoogle:
+    """In-memory Calendar and Tasks data behind a request dispatcher."""
+
+    def __init__(self, events=1000, tasks=300, calendars=1, tasklists=1, days=365, latency=0.0, seed=1, recurring=0):
+        rng = random.Random(seed)
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.version = 0
+
+        # Events are spread over `days` days centred on today, each calendar kept sorted by start
+
+        self.calendars = [f"cal{i}" for i in range(calendars)]
+        self.events = {c: {} for c in self.calendars}
+        self.order = {c: [] for c in self.calendars}
+        for n in range(events):
+            calendar = self.calendars[n % calendars]
+            day = today + timedelta(days=rng.randint(-days // 2, days // 2))
+            event = _event(rng, f"ev{n}", day)
+            event["_version"] = 0
+            self.events[calendar][event["id"]] = event
+            self.order[calendar].append((_when(event["start"]), event["id"]))
+
+        # Recurring series keep their master aside, their instances are ordinary events up to `days / 2` ahead
+
+        self.masters = {c: {} for c in self.calendars}
+        self.cancelled_instances = {c: [] for c in self.calendars}
+        for n in range(recurring):
+            calendar = self.calendars[n % calendars]
+            series = _series(rng, f"rec{n}", today, days)
+            series["_version"] = 0
+            self.masters[calendar][series["id"]] = series
+            for instance in _instances(series, today + timedelta(days=days // 2)):
+                instance["_version"] = 0
+                instance["_generated"] = True
+                self.events[calendar][instance["id"]] = instance
+                self.order[calendar].append((_when(instance["start"]), instance["id"]))
+        for order in self.order.values():
+            order.sort()
+
+        self.tasklists = [f"list{i}" for i in range(tasklists)]
+        self.tasks = {t: {} for t in self.tasklists}
+        for n in range(tasks):
+            tasklist = self.tasklists[n % tasklists]
+            self.tasks[tasklist][f"task{n}"] = _task(rng, f"task{n}", today)
+
+    def _put_event(self, calendar, event):
+
+        # A changed instance is an exception from then on, listed even without singleEvents
+
+        event.pop("_generated", None)
+        self.version += 1
+        event["_version"] = self.version
+        old = self.events[calendar].get(event["id"])
+        if old is not None and old["status"] != "cancelled":
+            order = self.order[calendar]
+            del order[bisect.bisect_left(order, (_when(old["start"]), old["id"]))]
+        self.events[calendar][event["id"]] = event
+        if event["status"] != "cancelled":
+            bisect.insort(self.order[calendar], (_when(event["start"]), event["id"]))
+
+    def _calendar(self, calendar_id):
+        return self.calendars[0] if calendar_id == "primary" else calendar_id
+
+    def _tasklist(self, tasklist_id):
+        return self.tasklists[0] if tasklist_id == "@default" else tasklist_id
+
+    # ── Dispatch ──
+
+    def dispatch(self, method, target, body):
+        """Answer one API call, returns (status, payload or None)."""
+        url = urlsplit(target)
+        path = unquote(url.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        for route_method, pattern, handler in self.routes():
+            match = re.fullmatch(pattern, path)
+            if match and route_method == method:
+                with self.lock:
+                    status, payload = handler(query, json.loads(body) if body else None, *match.groups())
+                if payload is not None and "fields" in query and status < 300:
+                    payload = _select(payload, query["fields"])
+                return status, payload
+        return 404, {"error": {"code": 404, "message": f"No route for {method} {path}"}}
+
+    def routes(self):
+        return [
+            ("GET", r"/calendar/v3/users/me/calendarList", self.calendar_list),
+            ("GET", r"/calendar/v3/calendars/([^/]+)/events", self.list_events),
+            ("POST", r"/calendar/v3/calendars/([^/]+)/events", self.insert_event),
+            ("DELETE", r"/calendar/v3/calendars/([^/]+)/events/([^/]+)", self.delete_event),
+            ("POST", r"/calendar/v3/freeBusy", self.free_busy),
+            ("GET", r"/tasks/v1/users/@me/lists", self.list_tasklists),
+            ("GET", r"/tasks/v1/lists/([^/]+)/tasks", self.list_tasks),
+            ("POST", r"/tasks/v1/lists/([^/]+)/tasks", self.insert_task),
+            ("PATCH", r"/tasks/v1/lists/([^/]+)/tasks/([^/]+)", self.patch_task),
+        ]
+
+    # ── Calendar ──
+
+    def calendar_list(self, query, body):
+        return 200, {"items": [
+            {"id": c, "summary": f"Calendar {i}", "primary": i == 0} for i, c in enumerate(self.calendars)
+        ]}
+
+    def list_events(self, query, body, calendar_id):
+        calendar = self._calendar(calendar_id)
+        if calendar not in self.events:
+            return 404, {"error": {"code": 404, "message": "Not Found"}}
+
+        single = query.get("singleEvents", "false") == "true"
+        if "syncToken" in query:
+            since = int(query["syncToken"])
+            items = [e for e in self.events[calendar].values() if e["_version"] > since]
+            if not single:
+                items = [e for e in items if "_generated" not in e]
+                items += [m for m in self.masters[calendar].values() if m["_version"] > since]
+        else:
+
+            # Events starting up to a day before timeMin can still overlap it
+
+            order = self.order[calendar]
+            time_min = query.get("timeMin", "")[:19]
+            time_max = query.get("timeMax", "9999")[:19]
+            lo = bisect.bisect_left(order, ((datetime.fromisoformat(time_min) - timedelta(days=1)).isoformat()
+                                            if time_min else "",))
+            hi = bisect.bisect_left(order, (time_max,))
+            items = []
+            for _, event_id in order[lo:hi]:
+                event = self.events[calendar][event_id]
+                if _when(event["end"]) > time_min:
+                    items.append(event)
+
+            # Without singleEvents a series comes back once, as its master when it has started by timeMax, plus its
+            # changed instances
+
+            if not single:
+                items = [e for e in items if "_generated" not in e]
+                items += [m for m in self.masters[calendar].values() if _when(m["start"]) < time_max]
+                for event_id in self.cancelled_instances[calendar]:
+                    event = self.events[calendar][event_id]
+                    if time_min <= _when(event["start"]) < time_max:
+                        items.append(event)
+
+        # Free-text search: every word has to turn up in the title, description or location
+
+        if query.get("q"):
+            words = query["q"].lower().split()
+            items = [e for e in items
+                     if all(w in " ".join(e.get(k, "") for k in ("summary", "description", "location")).lower()
+                            for w in words)]
+
+        offset = int(query.get("pageToken", 0))
+        limit = int(query.get("maxResults", 250))
+        page = items[offset:offset + limit]
+        payload = {"kind": "calendar#events", "items": [_public(e) for e in page]}
+        if offset + limit < len(items):
+            payload["nextPageToken"] = str(offset + limit)
+        else:
+            payload["nextSyncToken"] = str(self.version)
+        return 200, payload
+
+    def insert_event(self, query, body, calendar_id):
+        calendar = self._calendar(calendar_id)
+        event_id = body.get("id") or uuid.uuid4().hex
+        existing = self.events[calendar].get(event_id)
+        if existing is not None:
+            return 409, {"error": {"code": 409, "message": "The requested identifier already exists."}}
+        event = dict(body, id=event_id, status="confirmed")
+        self._put_event(calendar, event)
+        return 200, _public(event)
+
+    def delete_event(self, query, body, calendar_id, event_id):
+        calendar = self._calendar(calendar_id)
+        event = self.events[calendar].get(event_id)
+        if event is None:
+            return 404, {"error": {"code": 404, "message": "Not Found"}}
+        if event["status"] == "cancelled":
+            return 410, {"error": {"code": 410, "message": "Resource has been deleted"}}
+        self._put_event(calendar, dict(event, status="cancelled"))
+        if "recurringEventId" in event:
+            self.cancelled_instances[calendar].append(event_id)
+        return 204, None
+
+    def free_busy(self, query, body):
+
+        # Timed events only (all-day ones are left free, as Google does for most), overlapping blocks merged
+
+        time_min, time_max = body["timeMin"][:19], body["timeMax"][:19]
+        calendars = {}
+        for item in body.get("items", []):
+            calendar = self._calendar(item["id"])
+            if calendar not in self.events:
+                calendars[item["id"]] = {"errors": [{"domain": "global", "reason": "notFound"}], "busy": []}
+                continue
+            order = self.order[calendar]
+            lo = bisect.bisect_left(order, ((datetime.fromisoformat(time_min) - timedelta(days=1)).isoformat(),))
+            hi = bisect.bisect_left(order, (time_max,))
+            busy = []
+            for _, event_id in order[lo:hi]:
+                event = self.events[calendar][event_id]
+                if "dateTime" not in event["start"] or _when(event["end"]) <= time_min:
+                    continue
+                start, end = event["start"]["dateTime"], event["end"]["dateTime"]
+                if busy and start <= busy[-1]["end"]:
+                    busy[-1]["end"] = max(busy[-1]["end"], end)
+                else:
+                    busy.append({"start": start, "end": end})
+            calendars[item["id"]] = {"busy": busy}
+        return 200, {"kind": "calendar#freeBusy", "timeMin": body["timeMin"], "timeMax": body["timeMax"],
+                     "calendars": calendars}
+
+    # ── Tasks ──
+
+    def list_tasklists(self, query, body):
+        return 200, {"items": [{"id": t, "title": f"List {i}"} for i, t in enumerate(self.tasklists)]}
+
+    def list_tasks(self, query, body, tasklist_id):
+        tasks = list(self.tasks[self._tasklist(tasklist_id)].values())
+        if query.get("showCompleted", "true") == "false":
+            tasks = [t for t in tasks if t["status"] != "completed"]
+        if query.get("showDeleted", "false") == "false":
+            tasks = [t for t in tasks if not t.get("deleted")]
+        if "dueMax" in query:
+            tasks = [t for t in tasks if t.get("due") and t["due"] < query["dueMax"]]
+        if "updatedMin" in query:
+            tasks = [t for t in tasks if t["updated"] >= query["updatedMin"]]
+
+        offset = int(query.get("pageToken", 0))
+        limit = min(int(query.get("maxResults", 20)), 100)
+        payload = {"kind": "tasks#tasks", "items": tasks[offset:offset + limit]}
+        if offset + limit < len(tasks):
+            payload["nextPageToken"] = str(offset + limit)
+        return 200, payload
+
+    def insert_task(self, query, body, tasklist_id):
+        task = dict(body, id=uuid.uuid4().hex, status=body.get("status", "needsAction"), updated=_now())
+        self.tasks[self._tasklist(tasklist_id)][task["id"]] = task
+        return 200, task
+
+    def patch_task(self, query, body, tasklist_id, task_id):
+        tasks = self.tasks[self._tasklist(tasklist_id)]
+        if task_id not in tasks:
+            return 404, {"error": {"code": 404, "message": "Not Found"}}
+        tasks[task_id] = dict(tasks[task_id], **body, updated=_now())
+        return 200, tasks[task_id]
+
+    # ── Batch ──
+
+    def batch(self, content_type, body):
+        """Answer a multipart/mixed batch, returns (content type, body)."""
+        boundary = re.search(r'boundary="?([^";]+)"?', content_type)[1]
+        responses = []
+        for part in body.split(f"--{boundary}".encode())[1:]:
+            part = part.replace(b"\r\n", b"\n")
+            if part.startswith(b"--"):
+                break
+            headers, _, inner = part.strip(b"\n").partition(b"\n\n")
+            content_id = re.search(rb"Content-ID: <([^>]+)>", headers, re.I)[1].decode()
+            request_head, _, inner_body = inner.partition(b"\n\n")
+            method, target, _ = request_head.split(b"\n")[0].decode().split(" ", 2)
+            status, payload = self.dispatch(method, target, inner_body.strip())
+            responses.append(
+                f"--batch_response\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status < 300 else 'Error'}\r\nContent-Type: application/json\r\n\r\n"
+                f"{json.dumps(payload) if payload is not None else ''}\r\n"
+            )
+        return "multipart/mixed; boundary=batch_response", ("".join(responses) + "--batch_response--").encode()
+
+
+def _public(resource):
+    return {k: v for k, v in resource.items() if not k.startswith("_")}
+
+
+def _now():
+    return datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def _select(payload, fields):
+
+    # Enough of the partial-response syntax for Bookey's selectors: "a,b,items(c,d(e))"
+
+    selected = {}
+    for name, sub in _parse_fields(fields):
+        if name not in payload:
+            continue
+        value = payload[name]
+        if sub and isinstance(value, list):
+            value = [_select(v, sub) for v in value]
+        elif sub and isinstance(value, dict):
+            value = _select(value, sub)
+        selected[name] = value
+    return selected
+
+
+def _parse_fields(fields):
+    parts, depth, current = [], 0, ""
+    for ch in fields + ",":
+        if ch == "," and depth == 0:
+            if current:
+                name, _, sub = current.partition("(")
+                parts.append((name.strip(), sub[:-1]))
+            current = ""
+            continue
+        depth += (ch == "(") - (ch == ")")
+        current += ch
+    return parts
+
+
+# ── HTTP ────────────────────────────────────────────────────────
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    # Headers and body go out in one segment, otherwise Nagle and delayed ACKs add ~40 ms per kept-alive request
+
+    disable_nagle_algorithm = True
+    wbufsize = 1 << 16
+
+    def log_message(self, *args):
+        pass
+
+    def _handle(self):
+        time.sleep(self.server.fake.latency)
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.path.split("?")[0] in ("/batch", "/batch/calendar/v3"):
+            content_type, content = self.server.fake.batch(self.headers["Content-Type"], body)
+            status = 200
+        else:
+            status, payload = self.server.fake.dispatch(self.command, self.path, body)
+            content_type = "application/json; charset=UTF-8"
+            content = json.dumps(payload).encode() if payload is not None else b""
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if "gzip" in self.headers.get("Accept-Encoding", "") and len(content) > 1024:
+            content = gzip.compress(content, compresslevel=1)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST = do_PATCH = do_DELETE = _handle
+
+
+def serve(fake, port=0):
+    """Start serving `fake` on a background thread, returns the server (its URL is server.url)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    server.fake = fake
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=1000)
+    parser.add_argument("--recurring", type=int, default=0, help="weekly recurring series")
+    parser.add_argument("--tasks", type=int, default=300)
+    parser.add_argument("--calendars", type=int, default=1)
+    parser.add_argument("--tasklists", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0, help="ms added to every round trip")
+    parser.add_argument("--port", type=int, default=0)
+    args = parser.parse_args()
+
+    fake = FakeGoogle(args.events, args.tasks, args.calendars, args.tasklists, latency=args.latency / 1000,
+                      recurring=args.recurring)
+    server = serve(fake, args.port)
+    print(f"READY {server.url}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
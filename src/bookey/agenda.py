@@ -0,0 +1,22 @@
+def merge_agenda(slots, tasks, focus_date):
+    """One date-ordered view of day-bucketed events and a task list: all-day events,
+    then tasks due that day, then timed events. Tasks due before the first day are
+    `overdue`, ones without a date `undated`."""
+    agenda = {"days": {}, "overdue": [], "undated": []}
+    first_day = min(slots) if slots else focus_date.strftime("%Y-%m-%d")
+    for date_str, events in slots.items():
+        all_day = [dict(e, kind="event") for e in events if e["is_all_day"]]
+        timed = [dict(e, kind="event") for e in events if not e["is_all_day"]]
+        agenda["days"][date_str] = all_day + timed
+
+    for task in tasks:
+        entry = dict(task, kind="task")
+        if not task["due"]:
+            agenda["undated"].append(entry)
+        elif task["due"][:10] < first_day:
+            agenda["overdue"].append(entry)
+        elif task["due"][:10] in agenda["days"]:
+            day = agenda["days"][task["due"][:10]]
+            insert_at = sum(1 for e in day if e["kind"] == "task" or e["is_all_day"])
+            day.insert(insert_at, entry)
+    return agenda
@@ -1,9 +1,10 @@
 import os
 import argparse
+from datetime import datetime, timedelta
 
-from bookey.google_calendar import GoogleCalendar
-from bookey.auth import TOKEN_PATH
-from bookey.cli import select_option, cli_add, cli_delete, cli_list, MAUVE, GREEN, RED, BOLD, RESET, DIM
+from bookey import profiler
+from bookey.auth import TOKEN_PATH, logout
+from bookey.cli import select_option, cli_add, cli_delete, cli_list, cli_agenda, cli_free, cli_sources, cli_import, cli_export, cli_delete_matching, cli_complete_matching, cli_daemon, cli_journal, cli_pending, cli_stats, cli_profile, parse_range, parse_date, MAUVE, GREEN, RED, BOLD, RESET, DIM
 
 
 LOGO = f"""{MAUVE}{BOLD}
@@ -17,25 +18,94 @@ LOGO = f"""{MAUVE}{BOLD}
 """
 
 
-def change_login():
+def client():
+    with profiler.phase("client"):
+        return _client()
+
+
+def _client():
+
+    # Adds, deletes and completes are queued in the store's journal and sent in the background
+
+    from bookey.daemon import connect
+    from bookey.journal import JournaledCalendar
+    from bookey.store import Store
+
+    # A running `bk daemon` already holds a logged-in client and a fresh store, so use it when it answers
+
+    remote = connect()
+    if remote is not None:
+        return JournaledCalendar(remote, Store())
+
+    # Otherwise everything runs in this process. Google client libraries are imported on first use so
+    # `bk --help` and the menu paint without them. Reads are served from the local store and synced incrementally
+
+    with profiler.phase("import google client"):
+        from bookey.google_calendar import GoogleCalendar
+
+    store = Store()
+    return JournaledCalendar(GoogleCalendar(store=store), store)
+
+
+def change_login(gc=None):
+
+    # Changes still queued belong to the old account, so send them while it's logged in. Whatever can't go
+    # yet (offline) keeps the old account: switching would clear the journal with the cache and lose it.
+    # Returns None when it didn't switch
+
+    from bookey.store import Store
+
+    if gc is not None or Store().journal_entries():
+        cli_journal(gc or client())
+    pending = Store().journal_entries()
+    if pending:
+        print(f"\n  {RED}Not switching accounts: {len(pending)} change(s) haven't reached Google yet{RESET}\n")
+        cli_pending(pending)
+        print(f"\n  {DIM}Run `bk --change-login` again once they've been sent (bk sends them when it's back online).{RESET}")
+        return None
+
     if os.path.exists(TOKEN_PATH):
-        os.remove(TOKEN_PATH)
         print(f"  {GREEN}Logged out. Logging in with new account...{RESET}\n")
     else:
         print(f"  {DIM}No existing login found. Logging in...{RESET}\n")
-    GoogleCalendar()
+    logout()
+
+    # The cached events and tasks belong to the old account, and so does a running daemon
+
+    from bookey.daemon import stop
+
+    if stop():
+        print(f"  {DIM}Stopped the running daemon, start it again with `bk daemon`.{RESET}\n")
+
+    Store().clear()
+
+    # Building the client logs in once, and the menu keeps using it
+
+    gc = client()
     print(f"\n  {GREEN}Login successful!{RESET}")
+    return gc
 
 
 def main_menu():
     print(LOGO)
-    gc = GoogleCalendar()
+
+    # The client is built on a background thread while the menu is read, and the week's events and the task
+    # list are fetched with it, so the menu shows up straight away and its views don't start cold. Without a
+    # saved login that would mean a browser window nobody asked for yet, so then it waits for an action
+
+    from bookey.prefetch import CachedCalendar
+
+    gc = CachedCalendar(client)
 
     while True:
+        if os.path.exists(TOKEN_PATH):
+            gc.prefetch()
+
         choice = select_option("What would you like to do?", [
             "Add event or task",
             "Delete event / complete task",
             "List events or tasks",
+            "Agenda (events and tasks)",
             "Change login",
             "Exit",
         ])
@@ -47,36 +117,170 @@ def main_menu():
         elif choice == 2:
             cli_list(gc)
         elif choice == 3:
-            change_login()
-            gc = GoogleCalendar()
+            cli_agenda(gc)
         elif choice == 4:
+            new_login = change_login(gc.built())
+            if new_login is not None:
+                gc = CachedCalendar(lambda: new_login)
+        elif choice == 5:
             print(f"\n  {DIM}Goodbye!{RESET}\n")
             break
 
         print()
 
+    return gc.built()
+
 
 def main():
     parser = argparse.ArgumentParser(description="Bookey - Your calendar, in the terminal.")
+    parser.add_argument("command", nargs="?", choices=["import", "export", "complete", "daemon", "free"],
+                        help="import: add events and tasks from a CSV or ICS file. "
+                             "export: write events and tasks to an ICS or NDJSON file. "
+                             "complete: complete the tasks --overdue and/or --match picks. "
+                             "daemon: keep a logged-in client running for faster commands. "
+                             "free: show free time in working hours")
+    parser.add_argument("file", nargs="?",
+                        help="File for `bk import` / `bk export` (`-` exports to stdout), `stop` for `bk daemon`, "
+                             "or a day for `bk free` "
+                             "(today, tomorrow, a weekday or dd/mm/yyyy)")
     parser.add_argument("-a", action="store_true", help="Add an event or task")
     parser.add_argument("-d", action="store_true", help="Delete event or complete task")
     parser.add_argument("-l", action="store_true", help="List events or tasks")
+    parser.add_argument("--range", metavar="SPAN",
+                        help="With -l, list events over SPAN (e.g. 30d, 12w, 3m) a week at a time. "
+                             "With -d --match, how far ahead to look (default 7d)")
+    parser.add_argument("--agenda", action="store_true", help="Show events and tasks for the next 7 days")
+    parser.add_argument("--calendars", action="store_true", help="Pick which calendars and task lists to show")
     parser.add_argument("--change-login", action="store_true", help="Switch Google account")
+    parser.add_argument("--match", metavar="TEXT",
+                        help="With -d, delete the events whose title contains TEXT without the picker. "
+                             "With complete, only tasks whose title contains TEXT")
+    parser.add_argument("--overdue", action="store_true", help="With complete, the tasks due before today")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="With -d --match or complete, list what would change and stop")
+    parser.add_argument("--from", dest="from_date", metavar="DATE",
+                        help="With export or -d --match, only events from DATE (dd/mm/yyyy), "
+                             "default the earliest for export and today for -d")
+    parser.add_argument("--to", dest="to_date", metavar="DATE",
+                        help="With export or -d --match, only events up to DATE (dd/mm/yyyy, inclusive), "
+                             "default the latest for export and the end of --range for -d")
+    parser.add_argument("--only", choices=["events", "tasks"], help="With export, leave out the other kind")
+    parser.add_argument("--format", choices=["ics", "ndjson"],
+                        help="With export, the format, when the file extension doesn't say")
+    parser.add_argument("--stats", action="store_true", help="Show API calls and retries used by the command")
+    parser.add_argument("--profile", action="store_true",
+                        help="Time each phase and HTTP request, and print a summary on exit")
+    parser.add_argument("--trace", metavar="FILE", help="With --profile, also write a Chrome trace (JSON) to FILE")
     args = parser.parse_args()
 
-    if args.a:
-        gc = GoogleCalendar()
+    # BOOKEY_PROFILE=1 does the same as --profile, a path ending in .json also writes the trace there
+
+    env_profile = os.environ.get("BOOKEY_PROFILE", "")
+    if env_profile.endswith(".json"):
+        args.trace = args.trace or env_profile
+    if args.profile or args.trace or env_profile not in ("", "0"):
+        run = profiler.start()
+        try:
+            _run(parser, args)
+        finally:
+            cli_profile(run, args.trace)
+    else:
+        _run(parser, args)
+
+
+def _run(parser, args):
+    gc = None
+    bulk_delete = args.d and args.match is not None
+    if args.range and not (args.l or bulk_delete):
+        parser.error("--range goes with -l or -d --match")
+    if (args.from_date or args.to_date) and not (args.command == "export" or bulk_delete):
+        parser.error("--from and --to go with export or -d --match")
+    if (args.only or args.format) and args.command != "export":
+        parser.error("--only and --format go with export")
+    if args.match is not None and not (args.d or args.command == "complete"):
+        parser.error("--match goes with -d or complete")
+    if args.overdue and args.command != "complete":
+        parser.error("--overdue goes with complete")
+    if args.dry_run and not (bulk_delete or args.command == "complete"):
+        parser.error("--dry-run goes with -d --match or complete")
+    if args.command == "import":
+        if not args.file:
+            parser.error("bk import needs a CSV or ICS file")
+        gc = client()
+        cli_import(gc, args.file)
+    elif args.command == "export":
+        if not args.file:
+            parser.error("bk export needs a file to write (or - for stdout)")
+        try:
+            start = parse_date(args.from_date) if args.from_date else None
+            end = parse_date(args.to_date) + timedelta(days=1) if args.to_date else None
+        except ValueError as e:
+            parser.error(str(e))
+        gc = client()
+        cli_export(gc, args.file, start, end, args.only, args.format)
+    elif args.command == "complete":
+        if args.file:
+            parser.error("bk complete takes --overdue and --match, not a file")
+        if not (args.overdue or args.match):
+            parser.error("bk complete needs --overdue, --match TEXT or both")
+        gc = client()
+        cli_complete_matching(gc, args.match, args.overdue, args.dry_run)
+    elif args.command == "daemon":
+        if args.file not in (None, "stop"):
+            parser.error("use `bk daemon` to start it or `bk daemon stop` to stop it")
+        cli_daemon(stop=args.file == "stop")
+    elif args.command == "free":
+        gc = client()
+        cli_free(gc, args.file)
+    elif args.a:
+        gc = client()
         cli_add(gc)
+    elif bulk_delete:
+        if not args.match.strip():
+            parser.error("--match needs some text")
+
+        # From --from (or today) to --to, or over --range (7 days by default, like the picker), --to inclusive
+
+        try:
+            start = parse_date(args.from_date) if args.from_date else datetime.now().replace(
+                hour=0, minute=0, second=0, microsecond=0)
+            if args.to_date:
+                end = parse_date(args.to_date) + timedelta(days=1)
+            else:
+                end = start + timedelta(days=parse_range(args.range, start) if args.range else 7)
+        except ValueError as e:
+            parser.error(str(e))
+        if end <= start:
+            parser.error("--to is before --from")
+        gc = client()
+        cli_delete_matching(gc, args.match.strip(), start, end, args.dry_run)
     elif args.d:
-        gc = GoogleCalendar()
+        gc = client()
         cli_delete(gc)
     elif args.l:
-        gc = GoogleCalendar()
-        cli_list(gc)
+        days = None
+        if args.range:
+            try:
+                days = parse_range(args.range)
+            except ValueError as e:
+                parser.error(str(e))
+        gc = client()
+        cli_list(gc, days)
+    elif args.agenda:
+        gc = client()
+        cli_agenda(gc)
+    elif args.calendars:
+        gc = client()
+        cli_sources(gc)
     elif args.change_login:
-        change_login()
+        gc = change_login()
     else:
-        main_menu()
+        gc = main_menu()
+
+    if gc is not None:
+        cli_journal(gc)
+    if args.stats and gc is not None:
+        cli_stats(gc)
 
 
 if __name__ == "__main__":
@@ -1,8 +1,7 @@
 import os
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
 
 
 # If you change these scopes, you must delete token.json and log in again.
@@ -16,26 +15,118 @@ CONFIG_DIR = os.path.join(os.path.expanduser("~"), ".config", "bookey")
 TOKEN_PATH = os.path.join(CONFIG_DIR, "token.json")
 CREDS_PATH = os.path.join(CONFIG_DIR, "credentials.json")
 
-def login():
-    os.makedirs(CONFIG_DIR, exist_ok=True)
+# Access tokens with less than this left are refreshed before they are handed out
 
-    if os.path.exists(TOKEN_PATH):
-        creds = Credentials.from_authorized_user_file(TOKEN_PATH, SCOPES)
+REFRESH_MARGIN = timedelta(minutes=5)
 
-    # If the user has valid credentials and they are logging in again, we should just refresh the creds, and update our existing json with the new creds
 
-        creds.refresh(Request())
-        with open(TOKEN_PATH, "w") as token:
-            token.write(creds.to_json())
-    else:
-        flow = InstalledAppFlow.from_client_secrets_file(CREDS_PATH, SCOPES)
+class CredentialManager:
+    """Owns the process's one credential object. A stored token is reused while
+    it's valid, refreshed only near expiry, and written back atomically."""
+
+    def __init__(self, token_path=TOKEN_PATH, creds_path=CREDS_PATH):
+        self.token_path = token_path
+        self.creds_path = creds_path
+        self.creds = None
+        self.lock = threading.Lock()
+        self.refresher = None
+
+    def get(self, background=False):
+
+        # With `background`, a token that is near expiry but still valid is refreshed on a thread
+        # while the caller carries on (building services, loading discovery)
+
+        with self.lock:
+            if self.creds is None:
+                self.creds = self._load()
+            creds = self.creds
+
+            if self._needs_refresh(creds):
+                if background and creds.valid:
+                    if self.refresher is None or not self.refresher.is_alive():
+                        self.refresher = threading.Thread(
+                            target=self._refresh, kwargs={"relogin": False}, daemon=True)
+                        self.refresher.start()
+                else:
+                    self._refresh()
+                    creds = self.creds
+        return creds
+
+    def logout(self):
+        with self.lock:
+            self.creds = None
+            if os.path.exists(self.token_path):
+                os.remove(self.token_path)
+
+    def _load(self):
+        from google.oauth2.credentials import Credentials
+
+        if os.path.exists(self.token_path):
+            creds = Credentials.from_authorized_user_file(self.token_path, SCOPES)
+            if creds.valid or creds.refresh_token:
+                return creds
+
+        # No usable token, so the user has to log in through google
+
+        return self._login()
+
+    def _login(self):
+        from google_auth_oauthlib.flow import InstalledAppFlow
+
+        flow = InstalledAppFlow.from_client_secrets_file(self.creds_path, SCOPES)
         creds = flow.run_local_server(port=0)
 
-    # When the user is logging in through google, we need to write a token.json file so we can log them in without asking again.
+        # When the user is logging in through google, we need to write a token.json file so we can log them in without asking again.
+
+        self._save(creds)
+        return creds
+
+    def _needs_refresh(self, creds):
+        if not creds.expiry:
+            return not creds.valid
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return creds.expiry - now < REFRESH_MARGIN
+
+    def _refresh(self, relogin=True):
+        from google.auth.exceptions import RefreshError
+        from google.auth.transport.requests import Request
+
+        try:
+            self.creds.refresh(Request())
+        except RefreshError:
+
+            # The refresh token was revoked or expired, start over with a fresh login.
+            # A background refresh leaves that to the next request, which fails loudly
+
+            if relogin:
+                self.creds = self._login()
+            return
+        self._save(self.creds)
+
+    def _save(self, creds):
+
+        # Write to a temp file and rename over the old token, so a crash never leaves a half-written token.json
+
+        os.makedirs(os.path.dirname(self.token_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.token_path), prefix=".token-")
+        try:
+            with os.fdopen(fd, "w") as token:
+                token.write(creds.to_json())
+                token.flush()
+                os.fsync(token.fileno())
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, self.token_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+
+_manager = CredentialManager()
 
-        with open(TOKEN_PATH, "w") as token:
-            token.write(creds.to_json())
 
-    return creds
+def login(background=True):
+    return _manager.get(background=background)
 
 
+def logout():
+    _manager.logout()
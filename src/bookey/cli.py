@@ -1,8 +1,16 @@
+import os
+import re
+import calendar
+import json
 import sys
 import tty
+import shutil
 import termios
 from datetime import datetime, timedelta
 
+from bookey import profiler
+from bookey.intervals import IntervalIndex, local_time
+
 
 # ── Interactive Selector ────────────────────────────────────────
 
@@ -20,141 +28,336 @@ HIDE_CURSOR = "\033[?25l"
 SHOW_CURSOR = "\033[?25h"
 
 
-def select_option(prompt, options):
-    """Arrow-key interactive selector. Returns chosen index."""
-    sys.stdout.write(f"\n{MAUVE}?{RESET} {BOLD}{prompt}{RESET}\n")
-    sys.stdout.flush()
-    selected = 0
-    count = len(options)
+# Escape sequences the selectors understand, anything else is dropped
+
+ESCAPE_KEYS = {
+    "[A": "up", "OA": "up",
+    "[B": "down", "OB": "down",
+    "[C": "right", "OC": "right",
+    "[D": "left", "OD": "left",
+    "[5~": "pageup", "[6~": "pagedown",
+    "[H": "home", "OH": "home", "[1~": "home",
+    "[F": "end", "OF": "end", "[4~": "end",
+}
+ANSI_RE = re.compile(r"(\033\[[0-9;?]*[A-Za-z])")
+
+
+def _read_keys(fd):
+    """Every key waiting on stdin, so a held arrow key becomes one batch and one
+    redraw rather than a redraw per repeat."""
+    data = os.read(fd, 1024).decode("utf-8", "ignore")
+    keys = []
+    i = 0
+    while i < len(data):
+        if data[i] == "\x1b" and data[i + 1:i + 2] in ("[", "O"):
+            end = i + 2
+            while end < len(data) and not ("@" <= data[end] <= "~"):
+                end += 1
+            key = ESCAPE_KEYS.get(data[i + 1:end + 1])
+            if key:
+                keys.append(key)
+            i = end + 1
+        else:
+            keys.append(data[i])
+            i += 1
+    return keys
+
+
+def _fit(line, width):
+    """Cut `line` to `width` visible characters, leaving its colour codes intact."""
+    out = []
+    left = width
+    for part in ANSI_RE.split(line):
+        if part.startswith("\033["):
+            out.append(part)
+        elif left > 0:
+            if len(part) > left:
+                out.append(part[:left - 1] + "…")
+                left = 0
+            else:
+                out.append(part)
+                left -= len(part)
+    return "".join(out) + RESET
 
-    fd = sys.stdin.fileno()
-    old = termios.tcgetattr(fd)
 
-    def render():
-        for i, opt in enumerate(options):
-            if i == selected:
-                sys.stdout.write(f"\r{CLEAR_LINE}  {MAUVE}> {i + 1}. {opt}{RESET}\r\n")
-            else:
-                sys.stdout.write(f"\r{CLEAR_LINE}    {DIM}{i + 1}. {opt}{RESET}\r\n")
+class _Viewport:
+    """A window of option lines drawn in place under a prompt, sized to the terminal
+    and scrolled to follow the cursor. The cursor rests on the window's top row
+    between frames; each frame is a single write of just the rows that changed."""
+
+    def __init__(self, count, reserve=3, status=False):
+        size = shutil.get_terminal_size()
+        self.width = size.columns - 1
+        self.height = max(1, min(count, size.lines - reserve - int(status)))
+
+        # Lists taller than the window get an extra row saying where in the list we are
+
+        self.rows = self.height + (1 if status or count > self.height else 0)
+        self.top = 0
+        self.screen = [None] * self.rows
+
+        # Reserve space so cursor-up always works even at terminal bottom
+
+        sys.stdout.write("\n" * self.rows + f"\033[{self.rows}A")
+        sys.stdout.flush()
+
+    def draw(self, render, cursor, count, status=""):
+        """`render(i)` gives the line for option i, only called for visible options.
+        `status` goes in front of the position on the status row."""
+        if cursor < self.top:
+            self.top = cursor
+        elif cursor >= self.top + self.height:
+            self.top = cursor - self.height + 1
+        self.top = max(0, min(self.top, count - self.height))
+
+        lines = [render(i) for i in range(self.top, min(count, self.top + self.height))]
+        lines += [""] * (self.height - len(lines))
+        if self.rows > self.height:
+            lines.append(f"    {status}{DIM}{min(cursor + 1, count)}/{count}{RESET}")
+
+        out = []
+        row = 0
+        for i, line in enumerate(lines):
+            line = _fit(line, self.width)
+            if self.screen[i] == line:
+                continue
+            if i > row:
+                out.append(f"\033[{i - row}B")
+            out.append(f"\r{CLEAR_LINE}{line}")
+            self.screen[i] = line
+            row = i
+        if row:
+            out.append(f"\033[{row}A")
+        if out:
+            sys.stdout.write("".join(out) + "\r")
+            sys.stdout.flush()
+
+    def clear(self):
+        """Blank the window, leaving the cursor on its top row."""
+        sys.stdout.write(f"\r{CLEAR_LINE}\n" * self.rows + f"\033[{self.rows}A")
         sys.stdout.flush()
 
+    def below(self):
+        """Move the cursor past the window, for leaving it on screen."""
+        sys.stdout.write(f"\033[{self.rows}B\r")
+
+
+def _interact(viewport, draw, handle):
+    """Raw-mode key loop shared by the selectors. `handle(key)` returns True once the
+    choice is made; `draw()` paints a frame after each batch of keys."""
+    fd = sys.stdin.fileno()
+    old = termios.tcgetattr(fd)
     sys.stdout.write(HIDE_CURSOR)
-    # Reserve space so cursor-up always works even at terminal bottom
-    sys.stdout.write("\n" * count)
-    sys.stdout.write(f"\033[{count}A")
-    sys.stdout.flush()
     try:
         tty.setraw(fd)
-        render()
+        draw()
         while True:
-            ch = sys.stdin.read(1)
-            if ch == "\r":
-                break
-            elif ch == "\x1b":
-                sys.stdin.read(1)  # skip [
-                arrow = sys.stdin.read(1)
-                if arrow == "A" and selected > 0:
-                    selected -= 1
-                elif arrow == "B" and selected < count - 1:
-                    selected += 1
-            elif ch.isdigit():
-                idx = int(ch) - 1
-                if 0 <= idx < count:
-                    selected = idx
-                    break
-            elif ch == "\x03":  # Ctrl+C
-                termios.tcsetattr(fd, termios.TCSADRAIN, old)
-                sys.stdout.write(f"\r{SHOW_CURSOR}\r\n{RESET}")
-                sys.stdout.flush()
-                sys.exit(0)
-            # Move cursor up to redraw in place
-            sys.stdout.write(f"\033[{count}A")
-            render()
+            for key in _read_keys(fd):
+                if key == "\x03":  # Ctrl+C
+                    termios.tcsetattr(fd, termios.TCSADRAIN, old)
+                    viewport.below()
+                    sys.stdout.write(f"{SHOW_CURSOR}\r\n{RESET}")
+                    sys.stdout.flush()
+                    sys.exit(0)
+                if handle(key):
+                    return
+            draw()
     finally:
         termios.tcsetattr(fd, termios.TCSADRAIN, old)
         sys.stdout.write(SHOW_CURSOR)
         sys.stdout.flush()
 
+
+def _move(cursor, key, count, page):
+    if key == "up":
+        return max(0, cursor - 1)
+    if key == "down":
+        return min(count - 1, cursor + 1)
+    if key == "pageup":
+        return max(0, cursor - page)
+    if key == "pagedown":
+        return min(count - 1, cursor + page)
+    if key == "home":
+        return 0
+    if key == "end":
+        return count - 1
+    return cursor
+
+
+def select_option(prompt, options):
+    """Arrow-key interactive selector. Returns chosen index."""
+    sys.stdout.write(f"\n{MAUVE}?{RESET} {BOLD}{prompt}{RESET}\n")
+    sys.stdout.flush()
+    selected = 0
+    count = len(options)
+    viewport = _Viewport(count)
+
+    def render(i):
+        if i == selected:
+            return f"  {MAUVE}> {i + 1}. {options[i]}{RESET}"
+        return f"    {DIM}{i + 1}. {options[i]}{RESET}"
+
+    def handle(key):
+        nonlocal selected
+        if key == "\r":
+            return True
+        if len(key) == 1 and key.isdigit():
+            idx = int(key) - 1
+            if 0 <= idx < count:
+                selected = idx
+                return True
+            return False
+        selected = _move(selected, key, count, viewport.height)
+        return False
+
+    with profiler.phase("input"):
+        _interact(viewport, lambda: viewport.draw(render, selected, count), handle)
+
     # Clear the options list and print only the chosen one
-    sys.stdout.write(f"\033[{count}A")
-    for _ in range(count):
-        sys.stdout.write(f"{CLEAR_LINE}\n")
-    sys.stdout.write(f"\033[{count}A")
+    viewport.clear()
     sys.stdout.write(f"{CLEAR_LINE}  {MAUVE}{selected + 1}. {options[selected]}{RESET}\n")
     sys.stdout.flush()
     return selected
 
 
-def select_multiple(prompt, options, selectable=None):
-    """Arrow-key multi-select with checkboxes. Space to toggle, Enter to confirm.
-    Returns list of selected indices. `selectable` is a list of bools indicating
-    which options can be toggled (headers are not selectable)."""
+class _FilterIndex:
+    """Type-to-filter over a fixed list of labels. Built once: the labels without
+    colour codes, lowercased, and for every character the labels containing it.
+    A query starts from the smallest of those lists for its characters, and each
+    query's matches are kept so that typing one more character only re-checks what
+    the shorter query matched, and backspace is a lookup."""
+
+    def __init__(self, options, selectable):
+        self.selectable = selectable
+        self.plain = [ANSI_RE.sub("", opt).lower() for opt in options]
+        self.postings = {}
+        for i, text in enumerate(self.plain):
+            if selectable[i]:
+                for ch in set(text):
+                    self.postings.setdefault(ch, []).append(i)
+
+        # Which header each option sits under, so a section only shows when something in it matches
+
+        self.header = []
+        current = None
+        for i, can_select in enumerate(selectable):
+            if not can_select:
+                current = i
+            self.header.append(current)
+
+        self.cache = {"": [i for i, can_select in enumerate(selectable) if can_select]}
+
+    def matches(self, query):
+        """Selectable option indices whose label has `query` as a subsequence, in order."""
+        query = query.lower()
+        if query in self.cache:
+            return self.cache[query]
+
+        base = query[:-1]
+        while base not in self.cache:
+            base = base[:-1]
+        candidates = self.cache[base]
+        if not base:
+            candidates = min((self.postings.get(ch, []) for ch in set(query)), key=len)
+
+        found = [i for i in candidates if self._contains(self.plain[i], query)]
+        self.cache[query] = found
+        return found
+
+    def visible(self, query):
+        """Option indices to show for `query`: the matches plus the headers above them."""
+        if not query:
+            return list(range(len(self.plain)))
+        rows = []
+        for i in self.matches(query):
+            header = self.header[i]
+            if header is not None and (not rows or rows[-1] < header):
+                rows.append(header)
+            rows.append(i)
+        return rows
+
+    def _contains(self, text, query):
+
+        # Plain substring is the common case and runs in C, only fall back to the subsequence walk
+
+        if query in text:
+            return True
+        position = 0
+        for ch in query:
+            position = text.find(ch, position) + 1
+            if not position:
+                return False
+        return True
+
+
+def select_multiple(prompt, options, selectable=None, checked=None):
+    """Arrow-key multi-select with checkboxes. Space to toggle, Enter to confirm,
+    typing filters the list and backspace / Esc edit the filter. Returns list of
+    selected indices. `selectable` is a list of bools indicating which options can
+    be toggled (headers are not selectable). `checked` holds indices that start out
+    ticked."""
     if selectable is None:
         selectable = [True] * len(options)
 
-    sys.stdout.write(f"\n{MAUVE}?{RESET} {BOLD}{prompt}{RESET} {DIM}(space = toggle, enter = confirm){RESET}\n")
+    sys.stdout.write(f"\n{MAUVE}?{RESET} {BOLD}{prompt}{RESET} "
+                     f"{DIM}(type to filter, space = toggle, enter = confirm){RESET}\n")
     sys.stdout.flush()
     cursor = 0
-    checked = set()
-    count = len(options)
+    checked = set(checked or ())
+    index = _FilterIndex(options, selectable)
+    query = ""
+    rows = index.visible(query)
+    viewport = _Viewport(len(options), status=True)
+
+    def render(row):
+        i = rows[row]
+        if selectable[i]:
+            box = f"{GREEN}[x]{RESET}" if i in checked else f"{DIM}[ ]{RESET}"
+        else:
+            box = "   "
+        if row == cursor:
+            return f"  {MAUVE}>{RESET} {box} {MAUVE}{options[i]}{RESET}"
+        return f"    {box} {DIM}{options[i]}{RESET}"
 
-    fd = sys.stdin.fileno()
-    old = termios.tcgetattr(fd)
+    def refilter(new_query):
+        nonlocal query, rows, cursor
 
-    def render():
-        for i, opt in enumerate(options):
-            if selectable[i]:
-                box = f"{GREEN}[x]{RESET}" if i in checked else f"{DIM}[ ]{RESET}"
-            else:
-                box = "   "
-            if i == cursor:
-                sys.stdout.write(f"\r{CLEAR_LINE}  {MAUVE}>{RESET} {box} {MAUVE}{opt}{RESET}\r\n")
-            else:
-                sys.stdout.write(f"\r{CLEAR_LINE}    {box} {DIM}{opt}{RESET}\r\n")
-        sys.stdout.flush()
+        # Stay on the same option if it survives the new filter, otherwise go to the first match
 
-    sys.stdout.write(HIDE_CURSOR)
-    # Reserve space so cursor-up always works even at terminal bottom
-    sys.stdout.write("\n" * count)
-    sys.stdout.write(f"\033[{count}A")
-    sys.stdout.flush()
-    try:
-        tty.setraw(fd)
-        render()
-        while True:
-            ch = sys.stdin.read(1)
-            if ch == "\r":
-                break
-            elif ch == " ":
-                if selectable[cursor]:
-                    if cursor in checked:
-                        checked.discard(cursor)
-                    else:
-                        checked.add(cursor)
-            elif ch == "\x1b":
-                sys.stdin.read(1)  # skip [
-                arrow = sys.stdin.read(1)
-                if arrow == "A" and cursor > 0:
-                    cursor -= 1
-                elif arrow == "B" and cursor < count - 1:
-                    cursor += 1
-            elif ch == "\x03":  # Ctrl+C
-                termios.tcsetattr(fd, termios.TCSADRAIN, old)
-                sys.stdout.write(f"\r{SHOW_CURSOR}\r\n{RESET}")
-                sys.stdout.flush()
-                sys.exit(0)
-            sys.stdout.write(f"\033[{count}A")
-            render()
-    finally:
-        termios.tcsetattr(fd, termios.TCSADRAIN, old)
-        sys.stdout.write(SHOW_CURSOR)
-        sys.stdout.flush()
+        current = rows[cursor] if rows else None
+        query = new_query
+        rows = index.visible(query)
+        if current in rows and selectable[current]:
+            cursor = rows.index(current)
+        else:
+            cursor = next((r for r, i in enumerate(rows) if selectable[i]), 0)
+
+    def handle(key):
+        nonlocal cursor
+        if key == "\r":
+            return True
+        if key == " ":
+            if rows and selectable[rows[cursor]]:
+                checked.symmetric_difference_update({rows[cursor]})
+        elif key in ("\x7f", "\x08"):
+            refilter(query[:-1])
+        elif key == "\x1b":
+            refilter("")
+        elif len(key) == 1 and key.isprintable():
+            refilter(query + key)
+        elif rows:
+            cursor = _move(cursor, key, len(rows), viewport.height)
+        return False
+
+    def draw():
+        status = f"{MAUVE}/{RESET} {query}  " if query else ""
+        viewport.draw(render, cursor, len(rows), status)
+
+    with profiler.phase("input"):
+        _interact(viewport, draw, handle)
 
     # Clear the options and show selected ones
-    sys.stdout.write(f"\033[{count}A")
-    for _ in range(count):
-        sys.stdout.write(f"{CLEAR_LINE}\n")
-    sys.stdout.write(f"\033[{count}A")
+    viewport.clear()
     selected_labels = [options[i] for i in sorted(checked)]
     if selected_labels:
         for label in selected_labels:
@@ -169,12 +372,60 @@ def ask(prompt, required=True, hint=""):
     """Simple input prompt with Catppuccin styling."""
     suffix = f" {DIM}{hint}{RESET}" if hint else ""
     while True:
-        val = input(f"{MAUVE}?{RESET} {BOLD}{prompt}{RESET}{suffix}: ")
+        with profiler.phase("input"):
+            val = input(f"{MAUVE}?{RESET} {BOLD}{prompt}{RESET}{suffix}: ")
         if val or not required:
             return val
         print(f"  {RED}This field is required.{RESET}")
 
 
+DATE_FORMAT_ERROR = "Invalid date format. Use dd/mm/yyyy"
+TIME_FORMAT_ERROR = "Invalid time format. Use hh:mm (24hr)"
+
+
+def parse_date(date_str):
+    """Parse a dd/mm/yyyy date, raising ValueError with the prompt's message."""
+    try:
+        return datetime.strptime(date_str, "%d/%m/%Y")
+    except ValueError:
+        raise ValueError(DATE_FORMAT_ERROR) from None
+
+
+def parse_time(time_str):
+    """Check an hh:mm (24hr) time, raising ValueError with the prompt's message."""
+    try:
+        datetime.strptime(time_str, "%H:%M")
+    except ValueError:
+        raise ValueError(TIME_FORMAT_ERROR) from None
+    return time_str
+
+
+def _fetch_events(gc, days, unique=False):
+    """Fetch the next `days` days in one ranged call per calendar and flatten the
+    day buckets. Each entry is a copy tagged with its `_date_str`. With `unique`,
+    events spanning several days are only kept on their first day."""
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    slots = gc.getCalendarSlots(today, days)
+    all_events = []
+    seen = set()
+    for date_str, events in slots.items():
+        for event in events:
+            if unique:
+                key = (event["calendar_id"], event["id"])
+                if key in seen:
+                    continue
+                seen.add(key)
+            all_events.append(dict(event, _date_str=date_str))
+    return all_events
+
+
+def _calendar_label(event, all_events):
+    """Source calendar suffix, only shown when events come from more than one calendar."""
+    if len({e["calendar_id"] for e in all_events}) > 1:
+        return f"  {DIM}[{event['calendar']}]{RESET}"
+    return ""
+
+
 # ── Add Flow ────────────────────────────────────────────────────
 
 
@@ -199,28 +450,41 @@ def _add_event(gc):
     if not is_all_day:
         # Validate start time format
         try:
-            datetime.strptime(time_str, "%H:%M")
-        except ValueError:
-            print(f"  {RED}Invalid time format. Use hh:mm (24hr){RESET}")
+            parse_time(time_str)
+        except ValueError as e:
+            print(f"  {RED}{e}{RESET}")
             return
         end_str = ask("End time (hh:mm)")
         # Validate end time format
         try:
-            datetime.strptime(end_str, "%H:%M")
-        except ValueError:
-            print(f"  {RED}Invalid time format. Use hh:mm (24hr){RESET}")
+            parse_time(end_str)
+        except ValueError as e:
+            print(f"  {RED}{e}{RESET}")
             return
 
     desc = ask("Description", required=False)
 
     try:
-        dt = datetime.strptime(date_str, "%d/%m/%Y")
-    except ValueError:
-        print(f"  {RED}Invalid date format. Use dd/mm/yyyy{RESET}")
+        dt = parse_date(date_str)
+    except ValueError as e:
+        print(f"  {RED}{e}{RESET}")
         return
 
     date_iso = dt.strftime("%Y-%m-%d")
 
+    # Warn before double-booking, against that day's events on every shown calendar
+
+    if not is_all_day:
+        conflicts = _conflicts(gc, dt, time_str, end_str)
+        if conflicts:
+            print(f"\n  {RED}This overlaps with:{RESET}")
+            for event in conflicts:
+                print(f"  {TEXT}{_clock(event['start'])}-{_clock(event['end'])}  |  {event['title']}{RESET}"
+                      f"{_calendar_label(event, conflicts)}")
+            if select_option("Add it anyway?", ["Yes", "No"]) == 1:
+                print(f"\n  {DIM}Event not added{RESET}")
+                return
+
     try:
         if is_all_day:
             end_date = (dt + timedelta(days=1)).strftime("%Y-%m-%d")
@@ -235,6 +499,24 @@ def _add_event(gc):
         print(f"\n  {RED}Failed to add event: {e}{RESET}")
 
 
+def _conflicts(gc, day, start_str, end_str):
+    """Timed events on `day` overlapping start_str-end_str (hh:mm). The check is best
+    effort, an add doesn't fail because the day's events couldn't be fetched."""
+    start = datetime.combine(day.date(), datetime.strptime(start_str, "%H:%M").time())
+    end = datetime.combine(day.date(), datetime.strptime(end_str, "%H:%M").time())
+    try:
+        events = gc.getCalendarSlots(day, 1).get(day.strftime("%Y-%m-%d"), [])
+    except Exception:
+        return []
+    index = IntervalIndex(
+        (local_time(e["start"]), local_time(e["end"]), e) for e in events if not e["is_all_day"])
+    return index.overlapping(start, end)
+
+
+def _clock(value):
+    return local_time(value).strftime("%H:%M")
+
+
 def _add_task(gc):
     today_str = datetime.now().strftime("%d/%m/%Y")
     name = ask("Name")
@@ -246,10 +528,10 @@ def _add_task(gc):
     due = None
     if date_str:
         try:
-            dt = datetime.strptime(date_str, "%d/%m/%Y")
+            dt = parse_date(date_str)
             due = dt.strftime("%Y-%m-%dT00:00:00.000Z")
-        except ValueError:
-            print(f"  {RED}Invalid date format. Use dd/mm/yyyy{RESET}")
+        except ValueError as e:
+            print(f"  {RED}{e}{RESET}")
             return
 
     try:
@@ -279,16 +561,8 @@ def cli_delete(gc):
 
 
 def _delete_event(gc):
-    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    all_events = []
     try:
-        for i in range(7):
-            day = today + timedelta(days=i)
-            slots = gc.getCalendarSlots(day, 1)
-            for date_str, events in slots.items():
-                for event in events:
-                    event["_date_str"] = date_str
-                    all_events.append(event)
+        all_events = _fetch_events(gc, 7, unique=True)
     except Exception as e:
         print(f"\n  {RED}Failed to fetch events: {e}{RESET}")
         return
@@ -297,28 +571,30 @@ def _delete_event(gc):
         print(f"\n  {DIM}No events in the next 7 days.{RESET}")
         return
 
-    labels = []
-    for event in all_events:
-        dt = datetime.strptime(event["_date_str"], "%Y-%m-%d")
-        day_label = dt.strftime("%a, %b %d")
-        if event["is_all_day"]:
-            labels.append(f"{day_label} | {event['title']} (all day)")
-        else:
-            start_time = event["start"][11:16] if len(event["start"]) > 11 else ""
-            labels.append(f"{day_label} | {event['title']} ({start_time})")
-
+    labels = [_event_choice(event, all_events) for event in all_events]
     selected = select_multiple("Select events to delete:", labels)
     if not selected:
         print(f"  {DIM}No events selected.{RESET}")
         return
 
-    for idx in selected:
-        event = all_events[idx]
-        try:
-            gc.delete_calendar(event["id"])
+    chosen = [all_events[idx] for idx in selected]
+    _report_deletes(chosen, gc.delete_events([(event["calendar_id"], event["id"]) for event in chosen]))
+
+
+def _event_choice(event, all_events):
+    day_label = datetime.strptime(event["_date_str"], "%Y-%m-%d").strftime("%a, %b %d")
+    if event["is_all_day"]:
+        return f"{day_label} | {event['title']} (all day){_calendar_label(event, all_events)}"
+    start_time = event["start"][11:16] if len(event["start"]) > 11 else ""
+    return f"{day_label} | {event['title']} ({start_time}){_calendar_label(event, all_events)}"
+
+
+def _report_deletes(chosen, results):
+    for event, (_, error) in zip(chosen, results):
+        if error is None:
             print(f"  {GREEN}Event \"{event['title']}\" deleted{RESET}")
-        except Exception as e:
-            print(f"  {RED}Failed to delete \"{event['title']}\": {e}{RESET}")
+        else:
+            print(f"  {RED}Failed to delete \"{event['title']}\": {error}{RESET}")
 
 
 def _complete_task(gc):
@@ -344,8 +620,7 @@ def _complete_task(gc):
         task_indices.append(None)
         selectable.append(False)
         for task in overdue:
-            dt = datetime.strptime(task["due"][:10], "%Y-%m-%d")
-            labels.append(f"{dt.strftime('%b %d')} | {task['title']}")
+            labels.append(_task_choice(task))
             task_indices.append(task)
             selectable.append(True)
 
@@ -354,11 +629,7 @@ def _complete_task(gc):
         task_indices.append(None)
         selectable.append(False)
         for task in current:
-            if task["due"]:
-                dt = datetime.strptime(task["due"][:10], "%Y-%m-%d")
-                labels.append(f"{dt.strftime('%b %d')} | {task['title']}")
-            else:
-                labels.append(task["title"])
+            labels.append(_task_choice(task))
             task_indices.append(task)
             selectable.append(True)
 
@@ -367,19 +638,104 @@ def _complete_task(gc):
         print(f"  {DIM}No tasks selected.{RESET}")
         return
 
-    for idx in selected:
-        task = task_indices[idx]
-        try:
-            gc.complete_task(task["id"])
+    chosen = [task_indices[idx] for idx in selected]
+    _report_completes(chosen, gc.complete_tasks([(task["tasklist"], task["id"]) for task in chosen]))
+
+
+def _task_choice(task):
+    if not task["due"]:
+        return task["title"]
+    return f"{datetime.strptime(task['due'][:10], '%Y-%m-%d').strftime('%b %d')} | {task['title']}"
+
+
+def _report_completes(chosen, results):
+    for task, (_, error) in zip(chosen, results):
+        if error is None:
             print(f"  {GREEN}Task \"{task['title']}\" completed{RESET}")
-        except Exception as e:
-            print(f"  {RED}Failed to complete \"{task['title']}\": {e}{RESET}")
+        else:
+            print(f"  {RED}Failed to complete \"{task['title']}\": {error}{RESET}")
+
+
+# ── Bulk Delete / Complete ──────────────────────────────────────
+
+
+def cli_delete_matching(gc, match, start, end, dry_run=False):
+    """Delete every event starting from `start` up to (not including) `end` whose title
+    contains `match`, without the picker. Google does most of the filtering, and the
+    deletes go out in batched requests. A dry run only lists what would go."""
+    try:
+        events = gc.find_events(start, end, match)
+    except Exception as e:
+        print(f"\n  {RED}Failed to fetch events: {e}{RESET}")
+        return
+
+    last = end - timedelta(days=1)
+    if not events:
+        print(f"\n  {DIM}No events matching \"{match}\" from {start.strftime('%b %d')} to "
+              f"{last.strftime('%b %d, %Y')}.{RESET}")
+        return
+
+    for event in events:
+        event["_date_str"] = event["start"][:10]
+    if not _confirm_bulk("delete", "event", [_event_choice(event, events) for event in events], dry_run):
+        return
+    _report_deletes(events, gc.delete_events([(event["calendar_id"], event["id"]) for event in events]))
+
+
+def cli_complete_matching(gc, match=None, overdue=False, dry_run=False):
+    """Complete every open task whose title contains `match` and, with `overdue`, that
+    was due before today, checked against the synced task list, and the completes go out
+    in batched requests. A dry run only lists what would be done."""
+    due_before = datetime.now().strftime("%Y-%m-%d") if overdue else None
+    try:
+        tasks = gc.find_tasks(match, due_before)
+    except Exception as e:
+        print(f"\n  {RED}Failed to fetch tasks: {e}{RESET}")
+        return
+
+    if not tasks:
+        which = " ".join(filter(None, ["overdue" if overdue else "", "tasks",
+                                       f"matching \"{match}\"" if match else ""]))
+        print(f"\n  {DIM}No {which}.{RESET}")
+        return
+
+    if not _confirm_bulk("complete", "task", [_task_choice(task) for task in tasks], dry_run):
+        return
+    _report_completes(tasks, gc.complete_tasks([(task["tasklist"], task["id"]) for task in tasks]))
+
+
+def _confirm_bulk(verb, noun, labels, dry_run):
+
+    # A dry run lists what would change and stops. In a terminal the list is shown and has to be confirmed,
+    # piped (a script, cron) it goes ahead
+
+    count = f"{len(labels)} {noun}{'s' if len(labels) != 1 else ''}"
+    if not dry_run and not sys.stdin.isatty():
+        return True
+    heading = f"Would {verb} {count}" if dry_run else f"About to {verb} {count}"
+    print(f"\n  {LAVENDER}{BOLD}{heading}:{RESET}\n")
+    for label in labels:
+        print(f"  {MAUVE}{label}{RESET}")
+    print()
+    if dry_run:
+        return False
+    if ask(f"{verb.capitalize()} {count}?", required=False, hint="y/N").strip().lower() in ("y", "yes"):
+        return True
+    print(f"  {DIM}Nothing {verb}d.{RESET}")
+    return False
 
 
 # ── List Flow ───────────────────────────────────────────────────
 
 
-def cli_list(gc):
+def cli_list(gc, days=None):
+
+    # A --range is only for events, so it skips the question
+
+    if days:
+        _list_event_range(gc, days)
+        return
+
     choice = select_option("What would you like to list?", ["Events", "Tasks"])
 
     if choice == 0:
@@ -389,16 +745,8 @@ def cli_list(gc):
 
 
 def _list_events(gc):
-    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    all_events = []
     try:
-        for i in range(7):
-            day = today + timedelta(days=i)
-            slots = gc.getCalendarSlots(day, 1)
-            for date_str, events in slots.items():
-                for event in events:
-                    event["_date_str"] = date_str
-                    all_events.append(event)
+        all_events = _fetch_events(gc, 7)
     except Exception as e:
         print(f"\n  {RED}Failed to fetch events: {e}{RESET}")
         return
@@ -407,47 +755,504 @@ def _list_events(gc):
         print(f"\n  {DIM}No events in the next 7 days.{RESET}")
         return
 
-    print(f"\n  {LAVENDER}{BOLD}Events (next 7 days){RESET}\n")
-    for event in all_events:
-        dt = datetime.strptime(event["_date_str"], "%Y-%m-%d")
-        day_label = dt.strftime("%a, %b %d")
-        if event["is_all_day"]:
-            time_label = "All Day"
-        else:
-            time_label = event["start"][11:16] if len(event["start"]) > 11 else ""
-        print(f"  {TEXT}{day_label}  |  {event['title']}  |  {time_label}{RESET}")
-    print()
+    with profiler.phase("render"):
+        print(f"\n  {LAVENDER}{BOLD}Events (next 7 days){RESET}\n")
+        for event in all_events:
+            print(_event_line(event, all_events))
+        print()
 
 
-def _list_tasks(gc):
+def _event_line(event, all_events):
+    dt = datetime.strptime(event["_date_str"], "%Y-%m-%d")
+    day_label = dt.strftime("%a, %b %d")
+    if event["is_all_day"]:
+        time_label = "All Day"
+    else:
+        time_label = event["start"][11:16] if len(event["start"]) > 11 else ""
+    return f"  {TEXT}{day_label}  |  {event['title']}  |  {time_label}{RESET}{_calendar_label(event, all_events)}"
+
+
+RANGE_UNITS = {"d": 1, "w": 7}
+
+
+def parse_range(text, start=None):
+    """Days in a span like 90d, 12w or 3m (calendar months from `start`, default today). A bare number is days."""
+    match = re.fullmatch(r"(\d+)([dwm]?)", text.strip().lower())
+    if not match or int(match.group(1)) < 1:
+        raise ValueError(f"Invalid range \"{text}\", use something like 30d, 12w or 3m")
+    count, unit = int(match.group(1)), match.group(2) or "d"
+    if unit != "m":
+        return count * RANGE_UNITS[unit]
+    today = (start or datetime.now()).date()
+    year, month = divmod(today.year * 12 + today.month - 1 + count, 12)
+    month += 1
+
+    # The same day of the month, or the month's last day when it's shorter (Jan 31 + 1m is Feb 28)
+
+    day = min(today.day, calendar.monthrange(year, month)[1])
+    return (today.replace(year=year, month=month, day=day) - today).days
+
+
+def _list_event_range(gc, days):
+    """Events for the next `days` days, a week at a time. In a terminal n and p page
+    between weeks while the next one loads in the background; piped, every week is
+    printed in turn. Only a few weeks are held at once either way."""
+    from bookey.windows import EventWindows
+
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    windows = EventWindows(gc, today, days)
     try:
-        tasks = gc.getTasks()
+        if sys.stdin.isatty() and sys.stdout.isatty():
+            _page_windows(windows)
+        else:
+            for index in range(windows.count):
+                _print_window(windows, index)
+            print()
     except Exception as e:
-        print(f"\n  {RED}Failed to fetch tasks: {e}{RESET}")
-        return
+        print(f"\n  {RED}Failed to fetch events: {e}{RESET}")
+    finally:
+        windows.close()
 
-    if not tasks:
-        print(f"\n  {DIM}No incomplete tasks.{RESET}")
-        return
+
+def _print_window(windows, index):
+    slots = windows.get(index)
+    first, last = windows.span(index)
+    events = [dict(event, _date_str=date_str) for date_str, day in slots.items() for event in day]
+    with profiler.phase("render"):
+        print(f"\n  {LAVENDER}{BOLD}Events {first.strftime('%a, %b %d')} – {last.strftime('%a, %b %d')}{RESET}"
+              f"  {DIM}week {index + 1} of {windows.count}{RESET}\n")
+        if not events:
+            print(f"  {DIM}No events.{RESET}")
+        for event in events:
+            print(_event_line(event, events))
+
+
+def _page_windows(windows):
+    index = 0
+    _print_window(windows, index)
+    fd = sys.stdin.fileno()
+    while True:
+        sys.stdout.write(f"\n  {DIM}n next week  ·  p previous  ·  q quit{RESET}")
+        sys.stdout.flush()
+        old = termios.tcgetattr(fd)
+        try:
+            tty.setraw(fd)
+            keys = _read_keys(fd)
+        finally:
+            termios.tcsetattr(fd, termios.TCSADRAIN, old)
+
+        # Clear the hint so the next week prints where it was
+
+        sys.stdout.write(f"\r{CLEAR_LINE}")
+        key = keys[-1] if keys else ""
+        if key in ("n", " ", "right", "pagedown") and index + 1 < windows.count:
+            index += 1
+        elif key in ("p", "left", "pageup") and index > 0:
+            index -= 1
+        elif key in ("q", "\r", "\x1b", "\x03"):
+            print()
+            return
+        else:
+            sys.stdout.write("\033[1A")
+            continue
+        _print_window(windows, index)
+
+
+def _list_tasks(gc):
+
+    # One listing, split here. Pages only come sorted on their own (in position order from the API), so both
+    # sections are held back and sorted once every page is in, with a running count shown meanwhile
 
     today = datetime.now().strftime("%Y-%m-%d")
-    overdue = [t for t in tasks if t["due"] and t["due"][:10] < today]
-    current = [t for t in tasks if not t["due"] or t["due"][:10] >= today]
+    progress = sys.stdout.isatty()
+    overdue = []
+    current = []
+    try:
+        for page in gc.iter_task_pages():
+            overdue.extend(t for t in page if t["due"] and t["due"][:10] < today)
+            current.extend(t for t in page if not t["due"] or t["due"][:10] >= today)
+            if progress:
+                sys.stdout.write(f"\r  {DIM}{len(overdue) + len(current)} tasks ...{RESET}{CLEAR_LINE}")
+                sys.stdout.flush()
+    except Exception as e:
+        print(f"\r{CLEAR_LINE}\n  {RED}Failed to fetch tasks: {e}{RESET}")
+        return
+    if progress:
+        sys.stdout.write(f"\r{CLEAR_LINE}")
 
     if overdue:
         print(f"\n  {RED}{BOLD}Overdue{RESET}\n")
-        for task in overdue:
-            dt = datetime.strptime(task["due"][:10], "%Y-%m-%d")
-            date_label = dt.strftime("%b %d")
-            print(f"  {TEXT}{date_label}  |  {task['title']}{RESET}")
+    for task in sorted(overdue, key=lambda t: t["due"]):
+        dt = datetime.strptime(task["due"][:10], "%Y-%m-%d")
+        date_label = dt.strftime("%b %d")
+        print(f"  {TEXT}{date_label}  |  {task['title']}{RESET}")
 
     if current:
         print(f"\n  {LAVENDER}{BOLD}Current Tasks{RESET}\n")
-        for task in current:
-            if task["due"]:
+    for task in sorted(current, key=lambda t: t["due"] or "9999-12-31"):
+        if task["due"]:
+            dt = datetime.strptime(task["due"][:10], "%Y-%m-%d")
+            print(f"  {TEXT}{dt.strftime('%b %d')}  |  {task['title']}{RESET}")
+        else:
+            print(f"  {TEXT}{task['title']}{RESET}")
+
+    if not overdue and not current:
+        print(f"\n  {DIM}No incomplete tasks.{RESET}")
+        return
+    print()
+
+
+# ── Agenda Flow ─────────────────────────────────────────────────
+
+
+def cli_agenda(gc):
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    try:
+        agenda = gc.getAgenda(today, 7)
+    except Exception as e:
+        print(f"\n  {RED}Failed to fetch agenda: {e}{RESET}")
+        return
+
+    with profiler.phase("render"):
+        if agenda["overdue"]:
+            print(f"\n  {RED}{BOLD}Overdue{RESET}\n")
+            for task in agenda["overdue"]:
                 dt = datetime.strptime(task["due"][:10], "%Y-%m-%d")
-                date_label = dt.strftime("%b %d")
-                print(f"  {TEXT}{date_label}  |  {task['title']}{RESET}")
-            else:
+                print(f"  {TEXT}{dt.strftime('%b %d')}  |  {task['title']}{RESET}")
+
+        print(f"\n  {LAVENDER}{BOLD}Agenda (next 7 days){RESET}")
+        for date_str, entries in agenda["days"].items():
+            if not entries:
+                continue
+            dt = datetime.strptime(date_str, "%Y-%m-%d")
+            print(f"\n  {MAUVE}{dt.strftime('%a, %b %d')}{RESET}")
+            for entry in entries:
+                if entry["kind"] == "task":
+                    time_label = "Task"
+                elif entry["is_all_day"]:
+                    time_label = "All Day"
+                else:
+                    time_label = entry["start"][11:16] if len(entry["start"]) > 11 else ""
+                print(f"  {TEXT}{time_label:>7}  |  {entry['title']}{RESET}")
+
+        if agenda["undated"]:
+            print(f"\n  {LAVENDER}{BOLD}No Due Date{RESET}\n")
+            for task in agenda["undated"]:
                 print(f"  {TEXT}{task['title']}{RESET}")
+        print()
+
+
+# ── Free Flow ───────────────────────────────────────────────────
+
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+
+def _parse_day(text):
+    """today, tomorrow, a weekday (the next one, today included) or dd/mm/yyyy."""
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    word = text.lower()
+    if word == "today":
+        return today
+    if word == "tomorrow":
+        return today + timedelta(days=1)
+    for i, name in enumerate(WEEKDAYS):
+        if len(word) >= 3 and name.startswith(word):
+            return today + timedelta(days=(i - today.weekday()) % 7)
+    return parse_date(text)
+
+
+def _duration(delta):
+    hours, minutes = divmod(int(delta.total_seconds()) // 60, 60)
+    if hours and minutes:
+        return f"{hours}h {minutes}m"
+    return f"{hours}h" if hours else f"{minutes}m"
+
+
+def cli_free(gc, when=None):
+    """Show the gaps in working hours on one day, or over the next 7 days."""
+    from bookey.config import load_config
+
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    if when:
+        try:
+            first = _parse_day(when)
+        except ValueError:
+            print(f"\n  {RED}Unknown day \"{when}\". Use today, tomorrow, a weekday or dd/mm/yyyy{RESET}")
+            return
+        days = 1
+    else:
+        first, days = today, 7
+
+    hours = load_config()["free_time"]
+    day_from = datetime.strptime(hours["from"], "%H:%M") - datetime.strptime("00:00", "%H:%M")
+    day_to = datetime.strptime(hours["to"], "%H:%M") - datetime.strptime("00:00", "%H:%M")
+    minimum = timedelta(minutes=hours["minimum_minutes"])
+
+    # One free/busy query for the whole range and every shown calendar, then each day is a lookup in the index
+
+    try:
+        busy = gc.free_busy(first, first + timedelta(days=days))
+    except Exception as e:
+        print(f"\n  {RED}Failed to fetch free/busy: {e}{RESET}")
+        return
+    index = IntervalIndex((local_time(b["start"]), local_time(b["end"]), b) for b in busy)
+
+    span = "next 7 days" if days == 7 else first.strftime("%a, %b %d")
+    print(f"\n  {LAVENDER}{BOLD}Free time ({hours['from']}-{hours['to']}, {span}){RESET}")
+    now = datetime.now().replace(second=0, microsecond=0)
+    for n in range(days):
+        day = first + timedelta(days=n)
+        start, end = max(day + day_from, now), day + day_to
+        gaps = index.free(start, end, minimum) if start < end else []
+        print(f"\n  {MAUVE}{day.strftime('%a, %b %d')}{RESET}")
+        if not gaps:
+            print(f"  {DIM}No free time{RESET}")
+        for gap_start, gap_end in gaps:
+            print(f"  {TEXT}{gap_start:%H:%M} - {gap_end:%H:%M}{RESET}  {DIM}{_duration(gap_end - gap_start)}{RESET}")
     print()
+
+
+# ── Sources Flow ────────────────────────────────────────────────
+
+
+def cli_sources(gc):
+    """Pick which calendars and task lists Bookey reads from."""
+    from bookey.config import load_config, save_config
+
+    try:
+        calendars = gc.list_calendars()
+        tasklists = gc.list_tasklists()
+    except Exception as e:
+        print(f"\n  {RED}Failed to fetch calendars: {e}{RESET}")
+        return
+
+    config = load_config()
+
+    # The primary calendar is kept as the "primary" alias so its sync state survives picking again
+
+    for c in calendars:
+        if c["primary"]:
+            c["id"] = "primary"
+    configured = {c["id"] for c in config["calendars"]}
+    picked = select_multiple(
+        "Calendars to include:",
+        [c["name"] for c in calendars],
+        checked=[i for i, c in enumerate(calendars) if c["id"] in configured],
+    )
+    if picked:
+        config["calendars"] = [{"id": calendars[i]["id"], "name": calendars[i]["name"]} for i in picked]
+
+    # Google lists the default task list first. It keeps the "@default" alias too, which is where new tasks
+    # are added, so they land in a list that is read
+
+    configured = {t["id"] for t in config["tasklists"]}
+    if tasklists:
+        if tasklists[0]["id"] in configured:
+            configured.add("@default")
+        tasklists[0]["id"] = "@default"
+    picked = select_multiple(
+        "Task lists to include:",
+        [t["name"] for t in tasklists],
+        checked=[i for i, t in enumerate(tasklists) if t["id"] in configured],
+    )
+    if picked:
+        config["tasklists"] = [{"id": tasklists[i]["id"], "name": tasklists[i]["name"]} for i in picked]
+        if 0 not in picked:
+            print(f"\n  {DIM}New tasks still go to {tasklists[0]['name']}, which won't be shown{RESET}")
+
+    save_config(config)
+    print(f"\n  {GREEN}Showing {len(config['calendars'])} calendar(s) and {len(config['tasklists'])} task list(s){RESET}")
+
+
+# ── Import Flow ─────────────────────────────────────────────────
+
+
+def cli_import(gc, path):
+    from bookey.importer import import_file, resume_point
+
+    try:
+        resumed = resume_point(path)
+    except OSError as e:
+        print(f"\n  {RED}Can't read {path}: {e.strerror}{RESET}")
+        return
+    if resumed:
+        print(f"\n  {DIM}Resuming after row {resumed}{RESET}")
+    print()
+
+    counts = {"imported": 0, "failed": 0}
+    try:
+        for result in import_file(gc, path):
+            label = f"Row {result['row']}: {result['kind'].capitalize() or 'Row'} \"{result['name']}\""
+            if result["error"]:
+                counts["failed"] += 1
+                print(f"  {RED}{label} failed: {result['error']}{RESET}")
+            elif result["duplicate"]:
+                counts["imported"] += 1
+                print(f"  {DIM}{label} was already imported{RESET}")
+            else:
+                counts["imported"] += 1
+                print(f"  {GREEN}{label} imported{RESET}")
+    except Exception as e:
+        print(f"\n  {RED}Import stopped: {e}{RESET}")
+        print(f"  {DIM}Run the same command again to resume.{RESET}")
+        return
+
+    print(f"\n  {LAVENDER}{BOLD}{counts['imported']} imported, {counts['failed']} failed{RESET}\n")
+
+
+# ── Export Flow ─────────────────────────────────────────────────
+
+
+def cli_export(gc, path, start=None, end=None, only=None, fmt=None):
+    """Export events between start and end, and every task, to `path` (`-` for stdout)
+    as ICS or NDJSON. Progress goes to stderr so it never mixes with the export."""
+    from bookey.exporter import export, export_format
+
+    try:
+        fmt = fmt or ("ndjson" if path == "-" else export_format(path))
+    except ValueError as e:
+        print(f"\n  {RED}{e}{RESET}\n", file=sys.stderr)
+        return
+
+    # newline="" keeps ICS's CRLF line endings as written on every platform
+
+    try:
+        out = sys.stdout if path == "-" else open(path, "w", encoding="utf-8", newline="")
+    except OSError as e:
+        print(f"\n  {RED}Can't write {path}: {e.strerror}{RESET}\n", file=sys.stderr)
+        return
+
+    progress = sys.stderr.isatty()
+    counts = (0, 0)
+    try:
+        for counts in export(gc, out, fmt, start, end, events=only != "tasks", tasks=only != "events"):
+            if progress:
+                sys.stderr.write(f"\r  {DIM}{counts[0]} events, {counts[1]} tasks ...{RESET}{CLEAR_LINE}")
+                sys.stderr.flush()
+    except Exception as e:
+        print(f"\r{CLEAR_LINE}\n  {RED}Export stopped after {counts[0]} events and {counts[1]} tasks: {e}{RESET}\n",
+              file=sys.stderr)
+        return
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    where = "stdout" if path == "-" else path
+    print(f"\r{CLEAR_LINE}\n  {GREEN}Exported {counts[0]} events and {counts[1]} tasks to {where}{RESET}\n",
+          file=sys.stderr)
+
+
+# ── Daemon ──────────────────────────────────────────────────────
+
+
+def cli_daemon(stop=False):
+    """Run the daemon in the foreground, or stop the one that's running."""
+    from bookey.daemon import SOCKET_PATH, connect, serve, stop as stop_daemon
+
+    if stop:
+        if stop_daemon():
+            print(f"  {GREEN}Daemon stopped{RESET}")
+        else:
+            print(f"  {DIM}No daemon running.{RESET}")
+        return
+
+    if connect() is not None:
+        print(f"  {DIM}A daemon is already running.{RESET}")
+        return
+
+    print(f"  {GREEN}Daemon listening on {SOCKET_PATH}{RESET} {DIM}(Ctrl+C to stop){RESET}")
+    try:
+        serve()
+    except RuntimeError as e:
+        print(f"  {RED}{e}{RESET}")
+    except KeyboardInterrupt:
+        print(f"\n  {DIM}Daemon stopped{RESET}")
+
+
+# ── Journal ─────────────────────────────────────────────────────
+
+
+JOURNAL_VERBS = {
+    "add_event": "add event",
+    "delete_event": "delete event",
+    "add_task": "add task",
+    "complete_task": "complete task",
+}
+
+
+def cli_journal(gc):
+    """Give queued changes a moment to reach Google, then report what was refused or is still queued."""
+    with profiler.phase("journal wait"):
+        failed, pending = gc.finish()
+    for entry, error in failed:
+        print(f"  {RED}Couldn't {JOURNAL_VERBS[entry['op']]} \"{_journal_name(entry)}\": {error}{RESET}")
+    if pending:
+        print(f"  {DIM}{pending} change(s) saved offline, they'll be sent the next time bk runs{RESET}")
+
+
+def cli_pending(entries):
+    """List queued changes that haven't reached Google yet."""
+    for entry in entries:
+        print(f"  {MAUVE}{JOURNAL_VERBS[entry['op']].capitalize()} \"{_journal_name(entry)}\"{RESET}")
+
+
+def _journal_name(entry):
+    fields = json.loads(entry["body"]) if entry["body"] else {}
+    return fields.get("summary") or fields.get("title") or entry["item_id"]
+
+
+# ── Stats ───────────────────────────────────────────────────────
+
+
+def cli_stats(gc):
+    """Print the API calls, units, retries, throttled responses and bytes received this command used,
+    and how well connections were reused."""
+    summary = gc.scheduler.summary()
+    if not summary:
+        print(f"  {DIM}No API calls made.{RESET}")
+        return
+    print(f"\n  {LAVENDER}{BOLD}{'API':<10}{'Calls':>7}{'Units':>7}{'Retries':>9}{'Throttled':>11}"
+          f"{'KB':>9}{'Gzipped':>9}{RESET}")
+    for api, counts in sorted(summary.items()):
+        print(f"  {TEXT}{api:<10}{counts['calls']:>7}{counts['units']:>7}"
+              f"{counts['retries']:>9}{counts['throttled']:>11}"
+              f"{counts['bytes'] / 1024:>9.1f}{counts['compressed']:>9}{RESET}")
+
+    # Connections are pooled per process, so under the daemon these count everything since it started
+
+    connections = gc.connection_stats()
+    print(f"\n  {DIM}{connections['requests']} request(s) over {connections['connections']} connection(s), "
+          f"{connections['reused']} reused{RESET}")
+    print()
+
+
+# ── Profile ─────────────────────────────────────────────────────
+
+
+def cli_profile(run, trace_path=None):
+    """Print where the time went: phases (nested ones indented) and HTTP requests
+    grouped by URL template. Goes to stderr so it stays out of piped output."""
+    out = sys.stderr
+    phases, requests = run.summary()
+    print(f"\n  {LAVENDER}{BOLD}{'Phase':<34}{'Count':>7}{'Total ms':>11}{'Max ms':>10}{RESET}", file=out)
+    for p in phases:
+        name = "  " * p["depth"] + p["name"]
+        print(f"  {TEXT}{name:<34}{p['count']:>7}{p['total'] * 1000:>11.1f}{p['max'] * 1000:>10.1f}{RESET}", file=out)
+    print(f"  {DIM}{'wall time':<34}{'':>7}{run.elapsed() * 1000:>11.1f}{RESET}", file=out)
+
+    if requests:
+        print(f"\n  {LAVENDER}{BOLD}{'Request':<54}{'Count':>7}{'Status':>12}{'KB':>9}"
+              f"{'Total ms':>11}{'Max ms':>10}{RESET}", file=out)
+        for r in sorted(requests, key=lambda r: -r["total"]):
+            name = f"{r['method']} {r['template']}"
+            statuses = ",".join(f"{s}" if n == 1 else f"{s}x{n}" for s, n in r["statuses"].items())
+            print(f"  {TEXT}{name:<54}{r['count']:>7}{statuses:>12}{r['bytes'] / 1024:>9.1f}"
+                  f"{r['total'] * 1000:>11.1f}{r['max'] * 1000:>10.1f}{RESET}", file=out)
+    else:
+        print(f"\n  {DIM}No HTTP requests made.{RESET}", file=out)
+
+    if trace_path:
+        run.write_trace(trace_path)
+        print(f"\n  {DIM}Trace written to {trace_path} (open it in chrome://tracing or ui.perfetto.dev){RESET}", file=out)
+    print(file=out)
@@ -0,0 +1,48 @@
+import os
+import json
+import tempfile
+
+from bookey.auth import CONFIG_DIR
+
+
+CONFIG_PATH = os.path.join(CONFIG_DIR, "config.json")
+
+# Which calendars and task lists are shown, how many listing calls may run at once,
+# how fast each API may be called (units per second, with bursts up to `burst`),
+# the hours `bk free` looks for gaps in, and whether recurring events are expanded here or by Google
+
+DEFAULTS = {
+    "calendars": [{"id": "primary", "name": "Primary"}],
+    "tasklists": [{"id": "@default", "name": "My Tasks"}],
+    "max_concurrency": 4,
+    "max_retries": 5,
+    "rate_limits": {
+        "calendar": {"per_second": 10, "burst": 50},
+        "tasks": {"per_second": 10, "burst": 50},
+    },
+    "free_time": {"from": "09:00", "to": "18:00", "minimum_minutes": 30},
+    "local_recurrence": False,
+}
+
+
+def load_config(path=CONFIG_PATH):
+    config = {key: value for key, value in DEFAULTS.items()}
+    if os.path.exists(path):
+        with open(path) as f:
+            config.update(json.load(f))
+    return config
+
+
+def save_config(config, path=CONFIG_PATH):
+
+    # Same temp-file-and-rename dance as the token, so a crash never leaves half a config
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".config-")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(config, f, indent=2)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
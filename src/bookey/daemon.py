@@ -0,0 +1,306 @@
+import os
+import json
+import socket
+import threading
+import socketserver
+from datetime import datetime
+from types import SimpleNamespace
+
+from bookey import profiler
+from bookey.auth import CONFIG_DIR
+from bookey.config import CONFIG_PATH
+
+
+SOCKET_PATH = os.path.join(CONFIG_DIR, "bookey.sock")
+
+# What clients may call on the daemon's GoogleCalendar. Streams send one message per page
+
+METHODS = {
+    "list_calendars", "list_tasklists", "getAgenda", "getTasks", "getCalendarSlots", "free_busy",
+    "find_events", "find_tasks", "connection_stats",
+    "add_calendar", "add_task", "insert_events", "insert_tasks",
+    "delete_calendar", "delete_events", "complete_task", "complete_tasks",
+}
+STREAMS = {"iter_task_pages", "iter_event_export", "iter_task_export"}
+MUTATIONS = {
+    "add_calendar", "add_task", "insert_events", "insert_tasks",
+    "delete_calendar", "delete_events", "complete_task", "complete_tasks",
+}
+ATTRIBUTES = {"calendars", "tasklists"}
+
+# How often the daemon pulls changes into its store; reads in between are answered straight from it
+
+REFRESH_SECONDS = 60
+
+
+class RemoteError(Exception):
+    """An exception raised inside the daemon. API errors keep their HTTP status on
+    `resp.status` like HttpError does, so callers can still tell them apart from
+    transport failures."""
+
+    def __init__(self, message, status=None, content=None):
+        super().__init__(message)
+        if status is not None:
+            self.resp = SimpleNamespace(status=status)
+            self.content = content
+
+
+# ── Wire format ─────────────────────────────────────────────────
+
+
+# One JSON message per line. Datetimes, tuples and exceptions don't survive plain JSON, so they're tagged
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, tuple):
+        return {"__tuple__": [_encode(v) for v in value]}
+    if isinstance(value, list):
+        return [_encode(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _encode(v) for k, v in value.items()}
+    if isinstance(value, BaseException):
+        return {"__error__": _error(value)}
+    return value
+
+
+def _decode(value):
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    if isinstance(value, dict):
+        if "__datetime__" in value:
+            return datetime.fromisoformat(value["__datetime__"])
+        if "__tuple__" in value:
+            return tuple(_decode(v) for v in value["__tuple__"])
+        if "__error__" in value:
+            return RemoteError(**value["__error__"])
+        return {k: _decode(v) for k, v in value.items()}
+    return value
+
+
+def _error(e):
+    content = getattr(e, "content", None)
+    if isinstance(content, bytes):
+        content = content.decode("utf-8", "replace")
+    return {
+        "message": str(e),
+        "status": getattr(getattr(e, "resp", None), "status", None),
+        "content": content,
+    }
+
+
+def _send(f, message):
+    f.write(json.dumps(_encode(message)).encode() + b"\n")
+    f.flush()
+
+
+# ── Server ──────────────────────────────────────────────────────
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if line:
+            self.server.bookey.handle(_decode(json.loads(line)), self.wfile)
+
+
+class Daemon:
+    """Holds one logged-in GoogleCalendar with its warm transports and local store,
+    and answers calls for it on a Unix socket. The store is refreshed in the
+    background, so reads come straight from SQLite."""
+
+    def __init__(self, gc, path=SOCKET_PATH):
+        self.gc = gc
+        self.gc.sync_max_age = REFRESH_SECONDS
+        self.path = path
+        self.config_mtime = self._config_mtime()
+        self.stopped = threading.Event()
+        self.server = _Server(path, _Handler)
+        self.server.bookey = self
+
+        # The socket hands out calendar access, so only this user may connect
+
+        os.chmod(path, 0o600)
+
+    def serve_forever(self):
+        refresher = threading.Thread(target=self._refresh_loop, daemon=True)
+        refresher.start()
+        try:
+            self.server.serve_forever()
+        finally:
+            self.stopped.set()
+            self.server.server_close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def handle(self, request, f):
+        method = request.get("method")
+        try:
+            if method == "ping":
+                _send(f, {"result": self.gc.scheduler.summary()})
+            elif method == "shutdown":
+                _send(f, {"result": None})
+                threading.Thread(target=self.server.shutdown).start()
+            elif request.get("attr") in ATTRIBUTES:
+                self._reload_config()
+                _send(f, {"result": getattr(self.gc, request["attr"])})
+            elif method in METHODS or method in STREAMS:
+                self._reload_config()
+                call = getattr(self.gc, method)(*request.get("args", []), **request.get("kwargs", {}))
+                if method in MUTATIONS:
+                    self.gc.mark_stale()
+                if method in STREAMS:
+                    for page in call:
+                        _send(f, {"page": page})
+                    call = None
+                _send(f, {"result": call})
+            else:
+                _send(f, {"error": _error(ValueError(f"Unknown call {method or request.get('attr')!r}"))})
+        except BrokenPipeError:
+            pass
+        except Exception as e:
+            _send(f, {"error": _error(e)})
+
+    def _reload_config(self):
+
+        # `bk --calendars` rewrites config.json in its own process, pick the new sources up on the next call
+
+        mtime = self._config_mtime()
+        if mtime != self.config_mtime:
+            from bookey.config import load_config
+
+            config = load_config()
+            self.gc.calendars = config["calendars"]
+            self.gc.tasklists = config["tasklists"]
+            self.gc.mark_stale()
+            self.config_mtime = mtime
+
+    def _config_mtime(self):
+        try:
+            return os.path.getmtime(CONFIG_PATH)
+        except OSError:
+            return None
+
+    def _refresh_loop(self):
+
+        # A failed refresh (offline, say) is left to the next read, which syncs and reports it
+
+        while True:
+            try:
+                self._reload_config()
+                self.gc.refresh_store()
+            except Exception:
+                pass
+            if self.stopped.wait(REFRESH_SECONDS):
+                return
+
+
+def serve(path=SOCKET_PATH):
+    """Run the daemon in the foreground until stopped. Raises RuntimeError when one is already running."""
+    if connect(path) is not None:
+        raise RuntimeError(f"A daemon is already listening on {path}")
+    if os.path.exists(path):
+        os.remove(path)
+
+    from bookey.google_calendar import GoogleCalendar
+    from bookey.store import Store
+
+    Daemon(GoogleCalendar(store=Store()), path).serve_forever()
+
+
+# ── Client ──────────────────────────────────────────────────────
+
+
+class RemoteCalendar:
+    """Stands in for GoogleCalendar by forwarding calls to a running daemon, one
+    connection per call."""
+
+    def __init__(self, path=SOCKET_PATH):
+        self.path = path
+        self.scheduler = _RemoteScheduler(self)
+
+    def __getattr__(self, name):
+        if name in ATTRIBUTES:
+            return self._call({"attr": name})
+        if name in METHODS:
+            return lambda *args, **kwargs: self._call({"method": name, "args": args, "kwargs": kwargs})
+        if name in STREAMS:
+            return lambda *args, **kwargs: self._stream({"method": name, "args": list(args), "kwargs": kwargs})
+        raise AttributeError(name)
+
+    def ping(self):
+        return self._call({"method": "ping"})
+
+    def shutdown(self):
+        return self._call({"method": "shutdown"})
+
+    def _call(self, request):
+        pages = self._stream(request)
+        with profiler.phase(f"daemon {request.get('method') or request.get('attr')}"):
+            while True:
+                try:
+                    next(pages)
+                except StopIteration as done:
+                    return done.value
+
+    def _stream(self, request):
+
+        # Pages are yielded as they arrive, the final message carries the result or the error
+
+        request = dict(request, args=list(request.get("args", [])))
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(self.path)
+            with sock.makefile("rwb") as f:
+                _send(f, request)
+                for line in f:
+                    message = _decode(json.loads(line))
+                    if "page" in message:
+                        yield message["page"]
+                    elif "error" in message:
+                        raise RemoteError(**message["error"])
+                    else:
+                        return message["result"]
+        raise ConnectionError("The daemon closed the connection without answering")
+
+
+class _RemoteScheduler:
+    """What `--stats` reads: the daemon's counters, minus where they stood when this
+    client connected. Calls made meanwhile by other clients are counted too."""
+
+    def __init__(self, remote):
+        self.remote = remote
+        self.baseline = {}
+
+    def summary(self):
+        summary = {}
+        for api, counts in self.remote.ping().items():
+            before = self.baseline.get(api, {})
+            counts = {name: value - before.get(name, 0) for name, value in counts.items()}
+            if counts["calls"]:
+                summary[api] = counts
+        return summary
+
+
+def connect(path=SOCKET_PATH):
+    """A RemoteCalendar when a daemon answers on `path`, otherwise None."""
+    if not os.path.exists(path):
+        return None
+    remote = RemoteCalendar(path)
+    try:
+        remote.scheduler.baseline = remote.ping()
+    except OSError:
+        return None
+    return remote
+
+
+def stop(path=SOCKET_PATH):
+    """Ask a running daemon to exit. Returns whether one was running."""
+    remote = connect(path)
+    if remote is None:
+        return False
+    remote.shutdown()
+    return True
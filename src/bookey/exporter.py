@@ -0,0 +1,213 @@
+import json
+import queue
+import threading
+from datetime import datetime, timezone
+
+from bookey.intervals import rfc3339_time
+
+
+FORMATS = {".ics": "ics", ".ndjson": "ndjson", ".jsonl": "ndjson", ".json": "ndjson"}
+
+# Pages fetched ahead of the one being written, so the next request is in flight while this page is
+# formatted. Memory is this many pages, whatever the size of the export
+
+READ_AHEAD = 2
+
+
+def export_format(path):
+    """ics or ndjson, from the output file's extension."""
+    for extension, fmt in FORMATS.items():
+        if path.lower().endswith(extension):
+            return fmt
+    raise ValueError(f"Can't tell the export format from \"{path}\", use .ics or .ndjson (or --format)")
+
+
+def export(gc, out, fmt, start=None, end=None, events=True, tasks=True):
+    """Write events between start and end and every task to the text stream `out`,
+    as ICS or NDJSON, a record at a time as pages arrive. Yields running
+    (events, tasks) counts after each page."""
+    writer = _IcsWriter(out) if fmt == "ics" else _NdjsonWriter(out)
+    counts = [0, 0]
+    writer.begin()
+    if events:
+        for page in _read_ahead(gc.iter_event_export(start, end)):
+            for event in page:
+                writer.event(event)
+            counts[0] += len(page)
+            yield tuple(counts)
+    if tasks:
+        for page in _read_ahead(gc.iter_task_export()):
+            for task in page:
+                writer.task(task)
+            counts[1] += len(page)
+            yield tuple(counts)
+    writer.end()
+
+
+def _read_ahead(pages, depth=READ_AHEAD):
+    """The pages of `pages`, fetched on a background thread up to `depth` ahead of the consumer."""
+    slots = queue.Queue(maxsize=depth)
+    done = object()
+    stopped = threading.Event()
+
+    def put(item):
+
+        # Gives up once the consumer has stopped (an error writing, Ctrl+C), rather than waiting on a full queue
+
+        while not stopped.is_set():
+            try:
+                slots.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def fetch():
+        try:
+            for page in pages:
+                if not put(page):
+                    return
+            put(done)
+        except Exception as e:
+            put(e)
+
+    threading.Thread(target=fetch, name="bookey-export", daemon=True).start()
+    try:
+        while True:
+            page = slots.get()
+            if page is done:
+                return
+            if isinstance(page, Exception):
+                raise page
+            yield page
+    finally:
+        stopped.set()
+
+
+# ── NDJSON ──────────────────────────────────────────────────────
+
+
+class _NdjsonWriter:
+    """One JSON object per line, the API's own fields plus `type` and where it came from."""
+
+    def __init__(self, out):
+        self.out = out
+
+    def begin(self):
+        pass
+
+    def event(self, event):
+        self.out.write(json.dumps(dict(event, type="event"), ensure_ascii=False) + "\n")
+
+    def task(self, task):
+        self.out.write(json.dumps(dict(task, type="task"), ensure_ascii=False) + "\n")
+
+    def end(self):
+        pass
+
+
+# ── ICS ─────────────────────────────────────────────────────────
+
+
+class _IcsWriter:
+    """An RFC 5545 calendar with a VEVENT per event and a VTODO per task. Timed events
+    are written in UTC, all-day ones as dates. `bk import` reads the file back."""
+
+    def __init__(self, out):
+        self.out = out
+        self.stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+    def begin(self):
+        self._lines(["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//Bookey//Bookey export//EN", "CALSCALE:GREGORIAN"])
+
+    def event(self, event):
+        lines = ["BEGIN:VEVENT", f"UID:{event['id']}@google.com", f"DTSTAMP:{self.stamp}"]
+        lines.append(_ics_when("DTSTART", event.get("start", {})))
+        if event.get("end"):
+            lines.append(_ics_when("DTEND", event["end"]))
+        lines.append(f"SUMMARY:{_ics_escape(event.get('summary', ''))}")
+        if event.get("description"):
+            lines.append(f"DESCRIPTION:{_ics_escape(event['description'])}")
+        if event.get("location"):
+            lines.append(f"LOCATION:{_ics_escape(event['location'])}")
+        if event.get("status") in ("confirmed", "tentative"):
+            lines.append(f"STATUS:{event['status'].upper()}")
+        if event.get("transparency") == "transparent":
+            lines.append("TRANSP:TRANSPARENT")
+        if event.get("updated"):
+            lines.append(f"LAST-MODIFIED:{_ics_stamp(event['updated'])}")
+        lines.append(f"CATEGORIES:{_ics_escape(event.get('calendar', ''))}")
+        lines.append("END:VEVENT")
+        self._lines(lines)
+
+    def task(self, task):
+        lines = ["BEGIN:VTODO", f"UID:{task['id']}@tasks.google.com", f"DTSTAMP:{self.stamp}",
+                 f"SUMMARY:{_ics_escape(task.get('title', ''))}"]
+        if task.get("notes"):
+            lines.append(f"DESCRIPTION:{_ics_escape(task['notes'])}")
+
+        # Tasks only have a due date, Google sends it as midnight UTC
+
+        if task.get("due"):
+            lines.append(f"DUE;VALUE=DATE:{task['due'][:10].replace('-', '')}")
+        if task.get("status") == "completed":
+            lines.append("STATUS:COMPLETED")
+            if task.get("completed"):
+                lines.append(f"COMPLETED:{_ics_stamp(task['completed'])}")
+        else:
+            lines.append("STATUS:NEEDS-ACTION")
+        if task.get("updated"):
+            lines.append(f"LAST-MODIFIED:{_ics_stamp(task['updated'])}")
+        lines.append(f"CATEGORIES:{_ics_escape(task.get('tasklist_name', ''))}")
+        lines.append("END:VTODO")
+        self._lines(lines)
+
+    def end(self):
+        self._lines(["END:VCALENDAR"])
+
+    def _lines(self, lines):
+        self.out.write("".join(_ics_fold(line) + "\r\n" for line in lines))
+
+
+def _ics_when(name, when):
+    if "dateTime" not in when:
+        return f"{name};VALUE=DATE:{when.get('date', '').replace('-', '')}"
+    return f"{name}:{_ics_stamp(when['dateTime'])}"
+
+
+def _ics_stamp(value):
+    moment = rfc3339_time(value)
+    if moment.tzinfo is None:
+        moment = moment.astimezone()
+    return moment.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def _ics_escape(value):
+    return (value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def _ics_fold(line):
+
+    # Content lines are at most 75 octets, longer ones continue on lines starting with a space.
+    # Cuts never land inside a multi-byte character
+
+    if line.isascii():
+        if len(line) <= 75:
+            return line
+        return "\r\n ".join([line[:75]] + [line[i:i + 74] for i in range(75, len(line), 74)])
+    if len(line.encode("utf-8")) <= 75:
+        return line
+    parts = []
+    current = ""
+    size = 0
+    limit = 75
+    for ch in line:
+        width = len(ch.encode("utf-8"))
+        if size + width > limit:
+            parts.append(current)
+            current, size, limit = "", 0, 74
+        current += ch
+        size += width
+    parts.append(current)
+    return "\r\n ".join(parts)
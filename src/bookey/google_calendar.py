@@ -1,32 +1,293 @@
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta, timezone
-from googleapiclient.discovery import build
-from bookey.auth import login
+from functools import cached_property
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import DISCOVERY_URI, build_from_document
+from googleapiclient.errors import HttpError
+from bookey import profiler, recurrence
+from bookey.agenda import merge_agenda
+from bookey.auth import CONFIG_DIR, login
+from bookey.config import load_config
+from bookey.intervals import event_days
+from bookey.journal import item_ref
+from bookey.scheduler import Scheduler
+from bookey.store import SYNC_PAST_DAYS
+from bookey.transport import shared_pool
+
+
+# Batches are capped at 50 calls; Google accepts more per request but throttles the inner calls of larger batches
+
+BATCH_LIMIT = 50
+
+# Partial responses: list calls only ask for what _parse_event / _parse_task read, plus paging, sync
+# and deletion markers. Mutations only get the new id back, nothing reads the rest
+
+EVENT_FIELDS = "nextPageToken,nextSyncToken,items(id,summary,start,end,status)"
+RECURRING_EVENT_FIELDS = "nextPageToken,nextSyncToken,items(id,summary,start,end,status,recurrence,recurringEventId)"
+TASK_FIELDS = "nextPageToken,items(id,title,notes,due,status,deleted)"
+CALENDAR_LIST_FIELDS = "nextPageToken,items(id,summary,summaryOverride,primary)"
+TASKLIST_FIELDS = "nextPageToken,items(id,title)"
+MUTATION_FIELDS = "id"
+FREEBUSY_FIELDS = "calendars"
+
+# Exports keep everything a backup or a report could want, still leaving out attendee lists and attachments
+
+EXPORT_EVENT_FIELDS = ("nextPageToken,items(id,status,summary,description,location,start,end,"
+                       "created,updated,recurringEventId,transparency,htmlLink)")
+EXPORT_TASK_FIELDS = "nextPageToken,items(id,title,notes,due,status,completed,updated,parent)"
+
+# One free/busy query covers at most 50 calendars, and Google turns down long ranges, so windows stay under 60 days
+
+FREEBUSY_MAX_CALENDARS = 50
+FREEBUSY_MAX_DAYS = 60
+
+# Discovery documents fetched from the network are kept here, parsed ones are shared for the process
+
+DISCOVERY_CACHE_DIR = os.path.join(CONFIG_DIR, "discovery")
+_discovery_docs = {}
+
+
+def discovery_document(name, version):
+    """Parsed discovery document, from the bundled static copy or the on-disk cache.
+    Only fetched over the network when neither has it, and then cached."""
+    key = (name, version)
+    if key in _discovery_docs:
+        return _discovery_docs[key]
+
+    path = os.path.join(DISCOVERY_CACHE_DIR, f"{name}.{version}.json")
+    doc = discovery_cache.get_static_doc(name, version)
+    if doc is None and os.path.exists(path):
+        with open(path) as f:
+            doc = f.read()
+    if doc is None:
+        resp, content = shared_pool().request(
+            DISCOVERY_URI.format(api=name, apiVersion=version))
+        if resp.status >= 400:
+            raise RuntimeError(f"Could not fetch the {name} {version} discovery document ({resp.status})")
+        doc = content.decode("utf-8")
+        os.makedirs(DISCOVERY_CACHE_DIR, exist_ok=True)
+        with open(path, "w") as f:
+            f.write(doc)
+
+    doc = json.loads(doc)
+
+    # BOOKEY_API_ENDPOINT points every call, batches included, at another server (the benchmark's fake API)
+
+    endpoint = os.environ.get("BOOKEY_API_ENDPOINT")
+    if endpoint:
+        endpoint = endpoint.rstrip("/") + "/"
+        doc = dict(doc, rootUrl=endpoint, mtlsRootUrl=endpoint)
+
+    _discovery_docs[key] = doc
+    return doc
 
 
 class GoogleCalendar:
-    def __init__(self):
-        self.creds = login()
+    def __init__(self, store=None, config=None):
+        with profiler.phase("auth.login"):
+            self.creds = login()
+
+        # The calendars and task lists to read from, and how many listing calls may run at once
+
+        config = config or load_config()
+        self.calendars = config["calendars"]
+        self.tasklists = config["tasklists"]
+
+        # Retries, pacing and call accounting for every request this client makes
+
+        self.scheduler = Scheduler(config, BATCH_LIMIT)
+
+        # With local_recurrence, recurring events are fetched once as masters and expanded here instead of by Google
+
+        self.local_recurrence = config["local_recurrence"]
+
+        # Optional local Store, when set the read methods sync incrementally and answer from it
+
+        self.store = store
+
+        # How long, in seconds, a sync of the store counts as current. 0 syncs before every read;
+        # the daemon raises it and keeps the store fresh in the background instead
+
+        self.sync_max_age = 0
+        self._synced_at = {}
+        self._generation = 0
+
+        # One authorized transport for every service and thread, over the process's shared connection pool
+
+        self._transport = AuthorizedHttp(self.creds, http=shared_pool())
+
+    # Creating objects for the calendars and tasks on first use, so a command only pays for the services it touches
+
+    @cached_property
+    def calendar(self):
+        return self._build('calendar', 'v3')
+
+    @cached_property
+    def task(self):
+        return self._build('tasks', 'v1')
+
+    # Helper function to build a service from its discovery document, which also names the profiler's URL templates
+
+    def _build(self, name, version):
+        with profiler.phase(f"build {name}"):
+            doc = discovery_document(name, version)
+            if profiler.active is not None:
+                profiler.active.add_templates(doc)
+            return build_from_document(doc, http=self._transport)
+
+    # Every API call goes through the scheduler here, on the shared transport
+
+    def _execute(self, request):
+        return self.scheduler.execute(request, self._transport)
+
+    # Requests sent, connections opened and connections reused by this process so far
+
+    def connection_stats(self):
+        return shared_pool().stats()
 
-        # Creating objects for the calendars and tasks
+    # Helper function to run fn(item, *args) for every item on a bounded thread pool, results in item order.
+    # The pool is as wide as the scheduler currently allows, which narrows when the API starts throttling
 
-        self.calendar = build('calendar', 'v3', credentials=self.creds)
-        self.task = build('tasks', 'v1', credentials=self.creds)
+    def _fan_out(self, fn, items, *args):
+        if len(items) == 1:
+            return [fn(items[0], *args)]
+        with ThreadPoolExecutor(max_workers=min(self.scheduler.concurrency.value, len(items))) as pool:
+            return list(pool.map(lambda item: fn(item, *args), items))
+
+    def list_calendars(self):
+
+        # Every calendar on the user's calendar list, for picking which ones to show
+
+        calendars = []
+        page_token = None
+        while True:
+            results = self._execute(self.calendar.calendarList().list(
+                maxResults=250, pageToken=page_token, fields=CALENDAR_LIST_FIELDS))
+            for c in results.get('items', []):
+                calendars.append({
+                    "id": c.get('id'),
+                    "name": c.get('summaryOverride') or c.get('summary', '(No Title)'),
+                    "primary": c.get('primary', False),
+                })
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                break
+        return calendars
+
+    def list_tasklists(self):
+        tasklists = []
+        page_token = None
+        while True:
+            results = self._execute(self.task.tasklists().list(
+                maxResults=100, pageToken=page_token, fields=TASKLIST_FIELDS))
+            for t in results.get('items', []):
+                tasklists.append({"id": t.get('id'), "name": t.get('title', '(No Title)')})
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                break
+        return tasklists
+
+    def getAgenda(self, focus_date: datetime, days=7):
+
+        # Events and tasks are fetched at the same time, so this takes as long as the slower of the two
+
+        with profiler.phase("getAgenda"), ThreadPoolExecutor(max_workers=2) as pool:
+            slots_future = pool.submit(self.getCalendarSlots, focus_date, days)
+            tasks_future = pool.submit(self.getTasks)
+            slots = slots_future.result()
+            tasks = tasks_future.result()
+
+        return merge_agenda(slots, tasks, focus_date)
 
     def getTasks(self):
 
-        # Fetching raw tasks
+        # The full list, sorted by due date with undated tasks last
+
+        with profiler.phase("getTasks"):
+            cleanTasks = [t for page in self.iter_task_pages() for t in page]
+        return sorted(cleanTasks, key=self._task_sort_key)
+
+    def iter_task_pages(self, due_max=None):
+
+        # Yields parsed tasks a page at a time (each page sorted), so callers can render before the last page lands.
+        # `due_max` (YYYY-MM-DD) keeps only tasks due before that day
+
+        if len(self.tasklists) == 1:
+            yield from self._iter_tasklist_pages(self.tasklists[0], due_max)
+            return
+
+        # Several lists are drained on their own workers, each yielded whole as soon as it's done
+
+        def drain(tasklist):
+            return [t for page in self._iter_tasklist_pages(tasklist, due_max) for t in page]
+
+        with ThreadPoolExecutor(max_workers=min(self.scheduler.concurrency.value, len(self.tasklists))) as pool:
+            futures = [pool.submit(drain, tasklist) for tasklist in self.tasklists]
+            for future in as_completed(futures):
+                yield sorted(future.result(), key=self._task_sort_key)
+
+    def _iter_tasklist_pages(self, tasklist, due_max=None):
+        for page in self._iter_raw_tasklist_pages(tasklist['id'], due_max):
+            for task in page:
+                task["tasklist"] = tasklist['id']
+                task["tasklist_name"] = tasklist['name']
+            yield page
+
+    def _iter_raw_tasklist_pages(self, tasklist_id, due_max=None):
+        if self.store is not None:
+
+            # A cold store fills from a full listing, whose pages are passed on as they're stored. A warm one
+            # only pulls changes, so the answer is the store's copy once they're in
+
+            streamed = False
+            for page in self._sync_task_pages(tasklist_id):
+                streamed = True
+                if due_max:
+                    page = [t for t in page if t['due'] and t['due'][:10] < due_max]
+                yield sorted(page, key=self._task_sort_key)
+            if streamed:
+                return
+            tasks = self.store.tasks(tasklist=tasklist_id)
+            if due_max:
+                tasks = [t for t in tasks if t['due'] and t['due'][:10] < due_max]
+            yield tasks
+            return
 
-        results = self.task.tasks().list(
-            tasklist='@default',
-            showCompleted=False
-        ).execute()
+        params = {}
+        if due_max:
+            params['dueMax'] = f"{due_max}T00:00:00.000Z"
 
-        raw_tasks = results.get('items', [])
+        page_token = None
+        while True:
 
-        # cleaned up version of the tasks being returned using list comprehension
+            # Fetching raw tasks, 100 per page is the most the Tasks API hands out
 
-        cleanTasks = [self._parse_task(t) for t in raw_tasks]
-        return sorted(cleanTasks, key=lambda x: x['due'] if x['due'] else '9999-12-31')
+            results = self._execute(self.task.tasks().list(
+                tasklist=tasklist_id,
+                showCompleted=False,
+                maxResults=100,
+                pageToken=page_token,
+                fields=TASK_FIELDS,
+                **params
+            ))
+
+            # cleaned up version of the tasks being returned using list comprehension
+
+            cleanTasks = [self._parse_task(t) for t in results.get('items', [])]
+            if due_max:
+                cleanTasks = [t for t in cleanTasks if t['due'] and t['due'][:10] < due_max]
+            yield sorted(cleanTasks, key=self._task_sort_key)
+
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                break
+
+    def _task_sort_key(self, task):
+        return task['due'] if task['due'] else '9999-12-31'
 
     # Helper function to parse through the tasks into only necessary data
 
@@ -38,6 +299,7 @@ class GoogleCalendar:
             "due": task.get("due"),
             "status": task.get("status")
         }
+
     # Helper function to parse events
 
     def _parse_event(self, event):
@@ -63,23 +325,262 @@ class GoogleCalendar:
             startDate = focus_date - timedelta(days=1)
             endDate = focus_date + timedelta(days=1)
         else:
+
+            # Any other span starts at the focus date and covers `days` days
+
             startDate = focus_date
-            endDate = focus_date
-        time_min = startDate.replace(
-            hour=0, minute=0, second=0).isoformat() + 'Z'
-        time_max = endDate.replace(
-            hour=23, minute=59, second=59).isoformat() + 'Z'
-        events = self.calendar.events().list(
-            calendarId='primary',
-            timeMin=time_min,
-            timeMax=time_max,
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
-        raw_events = events.get('items', [])
-
-        # Putting data in dictionary for organization { "YYYY-MM-DD": [events] }
+            endDate = focus_date + timedelta(days=max(days, 1) - 1)
+
+        # Each configured calendar is listed on its own worker, then merged into the same day buckets
+
+        with profiler.phase("getCalendarSlots"):
+            events = []
+            for calendar_events in self._fan_out(self._calendar_events, self.calendars, startDate, endDate):
+                events.extend(calendar_events)
+            events.sort(key=lambda e: e["start"])
+            return self._bucket_events(events, startDate, endDate)
+
+    def free_busy(self, start: datetime, end: datetime):
+
+        # Busy times across every configured calendar, from freeBusy.query, which only sends back start and end
+        # times and never event bodies. Long ranges and many calendars become several queries run side by side
+
+        ids = [c['id'] for c in self.calendars]
+        queries = []
+        window = start
+        while window < end:
+            window_end = min(end, window + timedelta(days=FREEBUSY_MAX_DAYS))
+            for i in range(0, len(ids), FREEBUSY_MAX_CALENDARS):
+                queries.append((window, window_end, ids[i:i + FREEBUSY_MAX_CALENDARS]))
+            window = window_end
+
+        busy = []
+        for part in self._fan_out(self._free_busy, queries):
+            busy.extend(part)
+        return busy
+
+    # Helper function to run one free/busy query, a calendar Google couldn't answer for is an error, not free time
+
+    def _free_busy(self, query):
+        start, end, ids = query
+        results = self._execute(self.calendar.freebusy().query(body={
+            "timeMin": start.astimezone().isoformat(),
+            "timeMax": end.astimezone().isoformat(),
+            "items": [{"id": i} for i in ids],
+        }, fields=FREEBUSY_FIELDS))
+
+        names = {c['id']: c['name'] for c in self.calendars}
+        busy = []
+        for calendar_id, info in results.get('calendars', {}).items():
+            if info.get('errors'):
+                reason = info['errors'][0].get('reason', 'unknown error')
+                raise RuntimeError(f"No free/busy information for {names.get(calendar_id, calendar_id)} ({reason})")
+            for block in info.get('busy', []):
+                busy.append({"start": block['start'], "end": block['end'], "calendar_id": calendar_id})
+        return busy
+
+    def find_events(self, start: datetime, end: datetime, match=None):
+
+        # Events on every shown calendar starting between start and end whose title contains `match`, for bulk
+        # deletes. Google narrows the listing with `q` (which also searches descriptions, locations and
+        # attendees) and the time range, and the title and start checks here finish the job
+
+        def search(calendar):
+            params = {'q': match} if match else {}
+            found = []
+            page_token = None
+            while True:
+                results = self._execute(self.calendar.events().list(
+                    calendarId=calendar['id'],
+                    timeMin=start.astimezone().isoformat(),
+                    timeMax=end.astimezone().isoformat(),
+                    singleEvents=True,
+                    orderBy='startTime',
+                    maxResults=2500,
+                    pageToken=page_token,
+                    fields=EVENT_FIELDS,
+                    **params
+                ))
+                for raw in results.get('items', []):
+                    if raw.get('status') == 'cancelled':
+                        continue
+                    event = self._parse_event(raw)
 
+                    # The listing also has events that started earlier and are still running at `start`
+
+                    if event['start'][:10] < start.strftime("%Y-%m-%d"):
+                        continue
+                    if match and match.lower() not in event['title'].lower():
+                        continue
+                    event["calendar_id"] = calendar['id']
+                    event["calendar"] = calendar['name']
+                    found.append(event)
+                page_token = results.get('nextPageToken')
+                if not page_token:
+                    break
+            return found
+
+        with profiler.phase("find events"):
+            found = [e for events in self._fan_out(search, self.calendars) for e in events]
+        return sorted(found, key=lambda e: e['start'])
+
+    def find_tasks(self, match=None, due_before=None):
+
+        # Open tasks whose title contains `match` and, with `due_before` (YYYY-MM-DD), that are due before that
+        # day. With the store both are checked against its synced copy, so nothing is downloaded twice; without
+        # it the due date goes to the Tasks API as dueMax. It has no text search, so titles are always checked here
+
+        tasks = [t for page in self.iter_task_pages(due_before) for t in page]
+        if match:
+            tasks = [t for t in tasks if match.lower() in t['title'].lower()]
+        return sorted(tasks, key=self._task_sort_key)
+
+    def iter_event_export(self, start=None, end=None):
+
+        # Every event on every shown calendar between start and end (either can be left open), raw from
+        # events.list a page at a time and never kept, so a range of years costs one page of memory.
+        # Straight from Google rather than the store, which only holds the weeks around today
+
+        params = {}
+        if start is not None:
+            params['timeMin'] = start.astimezone().isoformat()
+        if end is not None:
+            params['timeMax'] = end.astimezone().isoformat()
+
+        for calendar in self.calendars:
+            page_token = None
+            while True:
+                results = self._execute(self.calendar.events().list(
+                    calendarId=calendar['id'],
+                    singleEvents=True,
+                    orderBy='startTime',
+                    maxResults=2500,
+                    pageToken=page_token,
+                    fields=EXPORT_EVENT_FIELDS,
+                    **params
+                ))
+                page = [e for e in results.get('items', []) if e.get('status') != 'cancelled']
+                for event in page:
+                    event["calendar_id"] = calendar['id']
+                    event["calendar"] = calendar['name']
+                yield page
+                page_token = results.get('nextPageToken')
+                if not page_token:
+                    break
+
+    def iter_task_export(self):
+
+        # Every task on every shown list, completed and hidden ones included, raw and a page at a time
+
+        for tasklist in self.tasklists:
+            page_token = None
+            while True:
+                results = self._execute(self.task.tasks().list(
+                    tasklist=tasklist['id'],
+                    showCompleted=True,
+                    showHidden=True,
+                    maxResults=100,
+                    pageToken=page_token,
+                    fields=EXPORT_TASK_FIELDS,
+                ))
+                page = results.get('items', [])
+                for task in page:
+                    task["tasklist"] = tasklist['id']
+                    task["tasklist_name"] = tasklist['name']
+                yield page
+                page_token = results.get('nextPageToken')
+                if not page_token:
+                    break
+
+    # Helper function to get one calendar's parsed events for the window, tagged with where they came from
+
+    def _calendar_events(self, calendar, startDate, endDate):
+        events = None
+
+        # Answer from the local store when it covers the window, after pulling what changed
+
+        if self.store is not None:
+            with profiler.phase("sync events"):
+                synced_from = self._sync_events(calendar['id'])
+            if startDate.strftime("%Y-%m-%d") >= synced_from:
+                events = self.store.events_between(
+                    startDate.strftime("%Y-%m-%d"), endDate.strftime("%Y-%m-%d"), calendar['id'])
+                if self.local_recurrence:
+                    events += self._expand_recurring(
+                        calendar['id'], self.store.recurring(calendar['id']),
+                        self.store.overridden(calendar['id']), startDate, endDate)
+
+        if events is None:
+            time_min = startDate.replace(
+                hour=0, minute=0, second=0).isoformat() + 'Z'
+            time_max = endDate.replace(
+                hour=23, minute=59, second=59).isoformat() + 'Z'
+
+            # One ranged listing for the whole window, following nextPageToken so long windows stay a few requests.
+            # Google expands recurring events here even with local_recurrence: a window's listing only holds the
+            # exceptions that now fall inside it, not those moved out of it, and only the store knows every one
+
+            raw_events = []
+            page_token = None
+            while True:
+                results = self._execute(self.calendar.events().list(
+                    calendarId=calendar['id'],
+                    timeMin=time_min,
+                    timeMax=time_max,
+                    singleEvents=True,
+                    orderBy='startTime',
+                    maxResults=2500,
+                    pageToken=page_token,
+                    fields=EVENT_FIELDS
+                ))
+                raw_events.extend(results.get('items', []))
+                page_token = results.get('nextPageToken')
+                if not page_token:
+                    break
+            events = [self._parse_event(e) for e in raw_events]
+
+        for event in events:
+            event["calendar_id"] = calendar['id']
+            event["calendar"] = calendar['name']
+        return events
+
+    # Helper function to expand recurring masters over the window, leaving out instances that were changed or
+    # cancelled on their own. A rule the expander doesn't handle (or can't parse) is expanded by Google, for that
+    # series only
+
+    def _expand_recurring(self, calendar_id, masters, overridden, startDate, endDate):
+        window_start = startDate.replace(hour=0, minute=0, second=0, microsecond=0)
+        window_end = endDate.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        events = []
+        for master in masters:
+            try:
+                found = recurrence.instances(master, window_start, window_end)
+            except (ValueError, KeyError):
+                found = self._server_instances(calendar_id, master['id'], window_start, window_end)
+            events.extend(e for e in found if e['id'] not in overridden)
+        return events
+
+    def _server_instances(self, calendar_id, event_id, window_start, window_end):
+        found = []
+        page_token = None
+        while True:
+            results = self._execute(self.calendar.events().instances(
+                calendarId=calendar_id,
+                eventId=event_id,
+                timeMin=window_start.astimezone().isoformat(),
+                timeMax=window_end.astimezone().isoformat(),
+                maxResults=2500,
+                pageToken=page_token,
+                fields=EVENT_FIELDS
+            ))
+            found.extend(self._parse_event(e) for e in results.get('items', []) if e.get('status') != 'cancelled')
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                return found
+
+    # Helper function to put parsed events in dictionary for organization { "YYYY-MM-DD": [events] }
+
+    def _bucket_events(self, events, startDate, endDate):
         organized_data = {}
 
         current = startDate
@@ -88,24 +589,188 @@ class GoogleCalendar:
             organized_data[date_str] = []
             current += timedelta(days=1)
 
-        # Sort each event into its day bucket
+        # Sort each event into every day bucket it covers
 
-        for event in raw_events:
+        window_start = startDate.replace(hour=0, minute=0, second=0, microsecond=0)
+        for event in events:
+            first, last = event_days(event["start"], event["end"], event["is_all_day"])
+            day = max(datetime.strptime(first, "%Y-%m-%d"), window_start)
+            last = datetime.strptime(last, "%Y-%m-%d")
+            while day <= last:
+                date_str = day.strftime("%Y-%m-%d")
+                if date_str not in organized_data:
+                    break
+                organized_data[date_str].append(event)
+                day += timedelta(days=1)
 
-            # Google provides 'dateTime' (specific time) or 'date' (all-day event)
+        return organized_data
 
-            start_raw = event['start'].get(
-                'dateTime') or event['start'].get('date')
-            event_date = start_raw[:10]  # Extract the YYYY-MM-DD part
+    # Helper function to bring the store's events up to date, returns the first day the store covers
 
-            # adding events to the dates that we are looking into.
+    def _sync_events(self, calendar_id='primary'):
+        token_key = f"events_sync_token:{calendar_id}"
+        from_key = f"events_synced_from:{calendar_id}"
+        if self._fresh(token_key):
+            return self.store.get_meta(from_key)
+        generation = self._generation
+        token = self.store.get_meta(token_key)
 
-            if event_date in organized_data:
-                organized_data[event_date].append(self._parse_event(event))
+        # A token from the other recurrence mode would leave instances or masters behind, so switching starts over
 
-        return organized_data
+        mode_key = f"events_sync_mode:{calendar_id}"
+        mode = "local" if self.local_recurrence else "server"
+        if token and (self.store.get_meta(mode_key) or "server") != mode:
+            token = None
+
+        if token:
+            params = {'syncToken': token}
+        else:
+
+            # No token yet, so start over with a full sync from SYNC_PAST_DAYS ago
+
+            synced_from = datetime.now().replace(
+                hour=0, minute=0, second=0, microsecond=0) - timedelta(days=SYNC_PAST_DAYS)
+            params = {'timeMin': synced_from.isoformat() + 'Z'}
+            self.store.clear_events(calendar_id)
+            self.store.set_meta(from_key, None)
+
+        page_token = None
+        try:
+            while True:
+                events = self._execute(self.calendar.events().list(
+                    calendarId=calendar_id,
+                    singleEvents=not self.local_recurrence,
+                    maxResults=2500,
+                    pageToken=page_token,
+                    fields=RECURRING_EVENT_FIELDS if self.local_recurrence else EVENT_FIELDS,
+                    **params
+                ))
+                self._store_events(calendar_id, events.get('items', []))
+                page_token = events.get('nextPageToken')
+                if not page_token:
+                    break
+        except HttpError as e:
+
+            # 410 Gone means the sync token was invalidated, drop it and do a full resync
+
+            if e.resp.status == 410 and token:
+                self.store.set_meta(token_key, None)
+                return self._sync_events(calendar_id)
+            raise
+
+        self.store.set_meta(token_key, events.get('nextSyncToken'))
+        self.store.set_meta(mode_key, mode)
+        if not token:
+            self.store.set_meta(from_key, synced_from.strftime("%Y-%m-%d"))
+        self._mark_synced(token_key, generation)
+        return self.store.get_meta(from_key)
+
+    # Helper function to apply one page of synced events, cancelled ones are removed
+
+    def _store_events(self, calendar_id, raw_events):
+        gone = [e['id'] for e in raw_events if e.get('status') == 'cancelled']
+        live = [e for e in raw_events if e.get('status') != 'cancelled']
+
+        # Expanding locally, masters are kept whole and instances changed on their own hide the generated copy
+
+        masters = []
+        if self.local_recurrence:
+            masters = [e for e in live if e.get('recurrence')]
+            live = [e for e in live if not e.get('recurrence')]
+            self.store.override_instances(calendar_id, [e['id'] for e in live if e.get('recurringEventId')])
+            self.store.delete_recurring(calendar_id, [e['id'] for e in live])
+
+        parsed = []
+        for event in live:
+            event = self._parse_event(event)
+            event["start_date"], event["end_date"] = event_days(event["start"], event["end"], event["is_all_day"])
+            parsed.append(event)
+        self.store.delete_events(calendar_id, gone)
+        self.store.upsert_events(calendar_id, parsed)
+        self.store.upsert_recurring(calendar_id, masters)
+
+    # Helper function to bring the store's tasks up to date using updatedMin
+
+    def _sync_tasks(self, tasklist='@default'):
+        for _ in self._sync_task_pages(tasklist):
+            pass
+
+    # The same, yielding each page's open tasks as it's stored when the sync is a full listing (a cold store)
+
+    def _sync_task_pages(self, tasklist='@default'):
+        key = f"tasks_updated_min:{tasklist}"
+        if self._fresh(key):
+            return
+        generation = self._generation
+        updated_min = self.store.get_meta(key)
+
+        # Leave a few minutes of slack for clock skew, re-reading a change is harmless
+
+        started = (datetime.now(timezone.utc) - timedelta(minutes=5)).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+        if updated_min:
+
+            # Completed and deleted tasks have to come back too, so the store can drop them
+
+            params = {'updatedMin': updated_min, 'showCompleted': True, 'showHidden': True, 'showDeleted': True}
+        else:
+            params = {'showCompleted': False}
+            self.store.clear_tasks(tasklist)
+
+        page_token = None
+        while True:
+            with profiler.phase("sync tasks"):
+                results = self._execute(self.task.tasks().list(
+                    tasklist=tasklist,
+                    maxResults=100,
+                    pageToken=page_token,
+                    fields=TASK_FIELDS,
+                    **params
+                ))
+                items = results.get('items', [])
+                stored = [self._parse_task(t) for t in items if not t.get('deleted')]
+                self.store.delete_tasks(tasklist, [t['id'] for t in items if t.get('deleted')])
+                self.store.upsert_tasks(tasklist, stored)
+            if not updated_min:
+                yield stored
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                break
+
+        self.store.set_meta(key, started)
+        self._mark_synced(key, generation)
+
+    # Helper function to tell whether a sync (by its meta key) happened within sync_max_age
+
+    def _fresh(self, key):
+        synced_at = self._synced_at.get(key)
+        return synced_at is not None and time.monotonic() - synced_at < self.sync_max_age
+
+    # A sync that started before a mark_stale may have missed the change, so it doesn't count as current
+
+    def _mark_synced(self, key, generation):
+        if generation == self._generation:
+            self._synced_at[key] = time.monotonic()
+
+    def mark_stale(self):
+        """Make the next read sync again, after a change the store hasn't seen yet."""
+        self._generation += 1
+        self._synced_at.clear()
+
+    def refresh_store(self):
+        """Pull what changed for every configured calendar and task list into the store."""
+        self.mark_stale()
+        self._fan_out(self._sync_events, [c['id'] for c in self.calendars])
+        self._fan_out(self._sync_tasks, [t['id'] for t in self.tasklists])
 
     def add_calendar(self, summary, start_time, end_time, description="", all_day=False):
+        event = self._event_body(summary, start_time, end_time, description, all_day)
+        return self._execute(self.calendar.events().insert(
+            calendarId="primary", body=event, fields=MUTATION_FIELDS))
+
+    # Helper function to build an event resource, shared by single and batched inserts
+
+    def _event_body(self, summary, start_time, end_time, description="", all_day=False):
         if all_day:
             event = {
                 'summary': summary,
@@ -120,26 +785,92 @@ class GoogleCalendar:
                 'start': {'dateTime': start_time, 'timeZone': 'America/Toronto'},
                 'end': {'dateTime': end_time, 'timeZone': 'America/Toronto'},
             }
-        return self.calendar.events().insert(calendarId="primary", body=event).execute()
+        return event
+
+    def insert_events(self, events):
+
+        # Inserting many events in batched requests. `events` are (key, fields) pairs, fields being add_calendar's
+        # arguments plus an optional client-chosen 'id', which makes replaying an insert harmless (409 instead of a copy).
+        # Returns (key, exception or None, response) triples, the response holding the new event's id
 
-    def delete_calendar(self, eventID):
-        return self.calendar.events().delete(calendarId='primary', eventId=eventID).execute()
+        requests = []
+        for _, fields in events:
+            fields = dict(fields)
+            event_id = fields.pop('id', None)
+            body = self._event_body(**fields)
+            if event_id:
+                body['id'] = event_id
+            requests.append(self.calendar.events().insert(calendarId='primary', body=body, fields=MUTATION_FIELDS))
+        return self._execute_batch(self.calendar, [key for key, _ in events], requests)
+
+    def delete_calendar(self, eventID, calendarID='primary'):
+        return self._execute(self.calendar.events().delete(calendarId=calendarID, eventId=eventID))
+
+    def delete_events(self, eventIDs):
+
+        # Deleting many events in batched requests, one round trip per chunk.
+        # Each entry is an event id on the primary calendar or a (calendar id, event id) pair
+
+        requests = [
+            self.calendar.events().delete(calendarId=calendarID, eventId=eventID)
+            for calendarID, eventID in (item_ref(e, 'primary') for e in eventIDs)
+        ]
+        return [(key, error) for key, error, _ in self._execute_batch(self.calendar, eventIDs, requests)]
 
     def add_task(self, title, notes, due=None):
+        t_body = self._task_body(title, notes, due)
+        return self._execute(self.task.tasks().insert(
+            tasklist='@default', body=t_body, fields=MUTATION_FIELDS))
+
+    # Helper function to build a task resource, shared by single and batched inserts
+
+    def _task_body(self, title, notes, due=None):
         t_body = {
             'title': title,
             'notes': notes
         }
         if due:
             t_body['due'] = due
-        return self.task.tasks().insert(tasklist='@default', body=t_body).execute()
+        return t_body
+
+    def insert_tasks(self, tasks):
+
+        # Inserting many tasks in batched requests, `tasks` are (key, fields) pairs of add_task's arguments.
+        # Returns (key, exception or None, response) triples, the response holding the id Google gave the task
 
-    def complete_task(self, taskID):
+        requests = [
+            self.task.tasks().insert(
+                tasklist='@default', body=self._task_body(**fields), fields=MUTATION_FIELDS)
+            for _, fields in tasks
+        ]
+        return self._execute_batch(self.task, [key for key, _ in tasks], requests)
+
+    def complete_task(self, taskID, tasklistID='@default'):
         t_body = {
             'status': 'completed'
         }
-        return self.task.tasks().patch(
-            tasklist='@default',
+        return self._execute(self.task.tasks().patch(
+            tasklist=tasklistID,
             task=taskID,
-            body=t_body
-        ).execute()
+            body=t_body,
+            fields=MUTATION_FIELDS
+        ))
+
+    def complete_tasks(self, taskIDs):
+
+        # Completing many tasks in batched requests, one round trip per chunk.
+        # Each entry is a task id on the default list or a (tasklist id, task id) pair
+
+        requests = [
+            self.task.tasks().patch(
+                tasklist=tasklistID, task=taskID, body={'status': 'completed'}, fields=MUTATION_FIELDS)
+            for tasklistID, taskID in (item_ref(t, '@default') for t in taskIDs)
+        ]
+        return [(key, error) for key, error, _ in self._execute_batch(self.task, taskIDs, requests)]
+
+    # Helper function to run requests in batches (at most BATCH_LIMIT, fewer while throttled), returning
+    # [(id, exception or None, response)] in order
+
+    def _execute_batch(self, service, ids, requests):
+        outcomes = self.scheduler.execute_batch(service, requests, self._transport)
+        return [(ids[i], *outcomes[i]) for i in range(len(requests))]
@@ -0,0 +1,332 @@
+import os
+import csv
+import json
+import hashlib
+from datetime import datetime, timedelta, timezone
+
+from bookey.auth import CONFIG_DIR
+from bookey.cli import parse_date, parse_time
+from bookey.google_calendar import BATCH_LIMIT
+from bookey.journal import landed_tasks, new_event_id
+
+
+# Progress of interrupted imports, one file per imported path
+
+CHECKPOINT_DIR = os.path.join(CONFIG_DIR, "imports")
+
+CSV_COLUMNS = ["type", "name", "date", "start", "end", "description"]
+
+
+# ── Reading ─────────────────────────────────────────────────────
+
+
+def read_rows(path):
+    """Stream (row number, row) pairs from a CSV or ICS file. Rows are dicts with
+    the CSV_COLUMNS keys, the same fields the add prompts ask for."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith(".ics"):
+            yield from _read_ics(f)
+        else:
+            yield from _read_csv(f)
+
+
+def _read_csv(f):
+    reader = csv.DictReader(f)
+    for row in reader:
+        row = {(k or "").strip().lower(): (v or "").strip() for k, v in row.items()}
+        yield reader.line_num, {column: row.get(column, "") for column in CSV_COLUMNS}
+
+
+def _read_ics(f):
+
+    # Unfold continuation lines on the fly and turn each VEVENT / VTODO into a row
+
+    number = 0
+    component = None
+    for line in _unfold(f):
+        if line in ("BEGIN:VEVENT", "BEGIN:VTODO"):
+            component = {"type": "event" if line == "BEGIN:VEVENT" else "task"}
+        elif line in ("END:VEVENT", "END:VTODO") and component is not None:
+            number += 1
+            yield number, _ics_row(component)
+            component = None
+        elif component is not None and ":" in line:
+            name, value = line.split(":", 1)
+            name, _, params = name.partition(";")
+            component[name.upper()] = (value, params.upper())
+
+
+def _unfold(f):
+    current = None
+    for raw in f:
+        raw = raw.rstrip("\r\n")
+        if raw[:1] in (" ", "\t") and current is not None:
+            current += raw[1:]
+            continue
+        if current is not None:
+            yield current
+        current = raw
+    if current is not None:
+        yield current
+
+
+def _ics_text(value):
+    return (value.replace("\\n", "\n").replace("\\N", "\n")
+            .replace("\\,", ",").replace("\\;", ";").replace("\\\\", "\\"))
+
+
+def _ics_row(component):
+    row = {column: "" for column in CSV_COLUMNS}
+    row["type"] = component["type"]
+    row["name"] = _ics_text(component.get("SUMMARY", ("", ""))[0])
+    row["description"] = _ics_text(component.get("DESCRIPTION", ("", ""))[0])
+
+    # ICS stamps are YYYYMMDD or YYYYMMDDTHHMMSS[Z], turned into the prompts' dd/mm/yyyy and hh:mm
+
+    start = _ics_local(component.get("DTSTART" if row["type"] == "event" else "DUE", ("", ""))[0])
+    if len(start) >= 8:
+        row["date"] = f"{start[6:8]}/{start[4:6]}/{start[0:4]}"
+    if row["type"] == "event":
+        end = _ics_local(component.get("DTEND", ("", ""))[0])
+        if "T" in start:
+            row["start"] = f"{start[9:11]}:{start[11:13]}"
+            row["end"] = f"{end[9:11]}:{end[11:13]}" if "T" in end else ""
+            if end[:8] and end[:8] != start[:8]:
+                row["error"] = "Events spanning several days can't be imported"
+        else:
+            row["start"] = "a"
+            if end[:8] and _ics_date(end) - _ics_date(start) > timedelta(days=1):
+                row["error"] = "Events spanning several days can't be imported"
+    return row
+
+
+def _ics_local(value):
+
+    # A UTC stamp (trailing Z, as `bk export` writes them) is moved to local time, which is what the prompts take
+
+    if value.endswith("Z") and "T" in value:
+        moment = datetime.strptime(value, "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc).astimezone()
+        return moment.strftime("%Y%m%dT%H%M%S")
+    return value
+
+
+def _ics_date(value):
+    return parse_date(f"{value[6:8]}/{value[4:6]}/{value[0:4]}")
+
+
+# ── Validation ──────────────────────────────────────────────────
+
+
+def validate_row(row):
+    """Check a row with the add prompts' rules. Returns ("event" | "task", fields)
+    where fields are add_calendar / add_task arguments, or raises ValueError."""
+    if row.get("error"):
+        raise ValueError(row["error"])
+    if not row["name"]:
+        raise ValueError("Name is required")
+
+    kind = row["type"].lower() or "event"
+    if kind == "task":
+        due = None
+        if row["date"]:
+            due = parse_date(row["date"]).strftime("%Y-%m-%dT00:00:00.000Z")
+        return "task", {"title": row["name"], "notes": row["description"], "due": due}
+    if kind != "event":
+        raise ValueError(f"Unknown type \"{row['type']}\", use event or task")
+
+    # Same as the event prompt: a date (dd/mm/yyyy), then hh:mm start and end or 'a' for all day
+
+    if not row["date"]:
+        raise ValueError("Date is required")
+    dt = parse_date(row["date"])
+    date_iso = dt.strftime("%Y-%m-%d")
+    if row["start"].lower() == "a":
+        end_date = (dt + timedelta(days=1)).strftime("%Y-%m-%d")
+        return "event", {"summary": row["name"], "start_time": date_iso, "end_time": end_date,
+                         "description": row["description"], "all_day": True}
+    parse_time(row["start"])
+    parse_time(row["end"])
+    return "event", {"summary": row["name"], "start_time": f"{date_iso}T{row['start']}:00",
+                     "end_time": f"{date_iso}T{row['end']}:00", "description": row["description"]}
+
+
+# ── Importing ───────────────────────────────────────────────────
+
+
+def import_file(gc, path, chunk_size=BATCH_LIMIT):
+    """Import a CSV or ICS file in batched inserts, yielding one result per row:
+    {"row", "name", "kind", "error", "duplicate"}. Progress is checkpointed after
+    every chunk so an interrupted import resumes where it stopped. Every row has a
+    key derived from the file and row. Events use it as their id, so a chunk that
+    is replayed after a crash, or a whole import run again, comes back as 409
+    duplicates rather than copies. Tasks can't take a client id, so the key and the
+    id Google gave the task go in a ledger kept for the file, and rows already in
+    it are skipped."""
+    path = os.path.abspath(path)
+    checkpoint = _load_checkpoint(path)
+    done = checkpoint["done"]
+    ledger = _load_ledger(path)
+
+    pending = []
+    for number, row in read_rows(path):
+        if number <= done:
+            continue
+        try:
+            kind, fields = validate_row(row)
+            key = _event_id(path, number, row)
+            if kind == "event":
+                fields["id"] = key
+            pending.append({"row": number, "name": row["name"], "kind": kind, "fields": fields, "error": None,
+                            "key": key})
+        except ValueError as e:
+            pending.append({"row": number, "name": row["name"], "kind": row["type"], "fields": None, "error": str(e)})
+
+        if sum(1 for p in pending if p["fields"]) >= chunk_size:
+            yield from _flush(gc, pending, path, ledger)
+            checkpoint["done"] = number
+            _save_checkpoint(path, checkpoint)
+            pending = []
+
+    yield from _flush(gc, pending, path, ledger)
+    _clear_checkpoint(path)
+
+
+def _flush(gc, pending, path, ledger):
+
+    # A chunk whose round trip never made it (no HTTP status) stops the import before the
+    # checkpoint moves, so those rows are sent again on resume instead of being reported lost
+
+    results = list(_results(gc, pending, path, ledger))
+    for result in results:
+        error = result["error"]
+        if error is not None and not isinstance(error, str) and not hasattr(error, "resp"):
+            raise error
+    return results
+
+
+def _results(gc, pending, path, ledger):
+    events = [(p["row"], p["fields"]) for p in pending if p["fields"] and p["kind"] == "event"]
+    tasks = [p for p in pending if p["fields"] and p["kind"] == "task"]
+    errors = {}
+    if events:
+        errors.update((key, error) for key, error, _ in gc.insert_events(events))
+    imported = _imported_tasks(gc, tasks, ledger)
+    if tasks:
+        errors.update(_insert_tasks(gc, [p for p in tasks if p["key"] not in imported], path, ledger))
+
+    for p in pending:
+        error = p["error"] or errors.get(p["row"])
+        duplicate = p.get("key") in imported or getattr(getattr(error, "resp", None), "status", None) == 409
+        yield {
+            "row": p["row"],
+            "name": p["name"],
+            "kind": p["kind"],
+            "error": None if duplicate else error,
+            "duplicate": duplicate,
+        }
+
+
+def _event_id(path, number, row):
+    return new_event_id(f"{path}:{number}:{json.dumps(row, sort_keys=True)}")
+
+
+# ── Task Ledger ─────────────────────────────────────────────────
+
+
+def _imported_tasks(gc, tasks, ledger):
+
+    # Keys of task rows imported before. A row sent but never answered (the import stopped) may have gone
+    # through, so it's looked for the same way the journal looks for its unconfirmed adds
+
+    imported = {p["key"] for p in tasks if ledger.get(p["key"])}
+    unsure = [p for p in tasks if p["key"] in ledger and not ledger[p["key"]]]
+    if unsure:
+        for p, task_id in zip(unsure, landed_tasks(gc, [p["fields"] for p in unsure])):
+            if task_id:
+                ledger[p["key"]] = task_id
+                imported.add(p["key"])
+    return imported
+
+
+def _insert_tasks(gc, tasks, path, ledger):
+
+    # Rows are written to the ledger as sent before they go out and get their task's id once Google answers.
+    # One refused outright is taken off it, so importing again retries it
+
+    if not tasks:
+        return {}
+    for p in tasks:
+        ledger[p["key"]] = None
+    _save_ledger(path, ledger)
+    errors = {}
+    try:
+        for p, (_, error, response) in zip(tasks, gc.insert_tasks([(p["key"], p["fields"]) for p in tasks])):
+            errors[p["row"]] = error
+            if error is None:
+                ledger[p["key"]] = response["id"]
+            elif hasattr(error, "resp"):
+                del ledger[p["key"]]
+    finally:
+        _save_ledger(path, ledger)
+    return errors
+
+
+# ── Checkpoints ─────────────────────────────────────────────────
+
+
+def _checkpoint_path(path):
+    return os.path.join(CHECKPOINT_DIR, hashlib.sha1(path.encode()).hexdigest()[:16] + ".json")
+
+
+def _load_checkpoint(path):
+
+    # A checkpoint only counts if the file hasn't changed since it was written
+
+    stat = os.stat(path)
+    fresh = {"path": path, "size": stat.st_size, "mtime": stat.st_mtime, "done": 0}
+    try:
+        with open(_checkpoint_path(path)) as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return fresh
+    if checkpoint.get("size") != stat.st_size or checkpoint.get("mtime") != stat.st_mtime:
+        return fresh
+    return checkpoint
+
+
+def _save_checkpoint(path, checkpoint):
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    tmp_path = _checkpoint_path(path) + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, _checkpoint_path(path))
+
+
+def _ledger_path(path):
+    return os.path.join(CHECKPOINT_DIR, hashlib.sha1(path.encode()).hexdigest()[:16] + ".tasks.json")
+
+
+def _load_ledger(path):
+    try:
+        with open(_ledger_path(path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_ledger(path, ledger):
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    tmp_path = _ledger_path(path) + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(ledger, f)
+    os.replace(tmp_path, _ledger_path(path))
+
+
+def _clear_checkpoint(path):
+    if os.path.exists(_checkpoint_path(path)):
+        os.remove(_checkpoint_path(path))
+
+
+def resume_point(path):
+    """Last row already imported from `path`, 0 when starting fresh."""
+    return _load_checkpoint(os.path.abspath(path))["done"]
@@ -0,0 +1,87 @@
+import bisect
+from datetime import datetime, timedelta
+
+
+def rfc3339_time(value):
+    """An RFC 3339 date-time from Google as a datetime, aware when it has an offset or Z."""
+
+    # fromisoformat only takes a trailing Z from Python 3.11
+
+    if value.endswith("Z"):
+        value = value[:-1] + "+00:00"
+    return datetime.fromisoformat(value)
+
+
+def local_time(value):
+    """An RFC 3339 date-time from Google (or a plain local one from the CLI) as a
+    naive local datetime, so the two compare."""
+    dt = rfc3339_time(value)
+    if dt.tzinfo is not None:
+        dt = dt.astimezone().replace(tzinfo=None)
+    return dt
+
+
+def event_days(start, end, all_day):
+    """The first and last day (YYYY-MM-DD) an event from `start` to `end` covers."""
+    first = start[:10]
+    last = end[:10] if end else first
+
+    # All-day end dates are exclusive, and a timed event ending at midnight doesn't touch the next day
+
+    if last > first and (all_day or end[11:19] == "00:00:00"):
+        last = (datetime.strptime(last, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+    return first, last
+
+
+class IntervalIndex:
+    """Busy time as sorted, disjoint blocks, each holding the (start, end, item)
+    intervals that overlap to make it up. Built once in O(n log n); overlap and
+    free-time queries bisect to the first block that can matter, so each costs
+    O(log n) plus what it returns."""
+
+    def __init__(self, intervals):
+        self.starts = []
+        self.ends = []
+        self.members = []
+        for start, end, item in sorted(intervals, key=lambda i: (i[0], i[1])):
+            if end < start:
+                continue
+
+            # Intervals that overlap or touch the last block join it
+
+            if self.ends and start <= self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], end)
+                self.members[-1].append((start, end, item))
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+                self.members.append([(start, end, item)])
+
+    def overlapping(self, start, end):
+        """Items whose interval overlaps [start, end), in start order."""
+        found = []
+        i = bisect.bisect_right(self.ends, start)
+        while i < len(self.starts) and self.starts[i] < end:
+            found.extend(item for s, e, item in self.members[i] if s < end and e > start)
+            i += 1
+        return found
+
+    def busy(self, start, end):
+        """Merged busy blocks overlapping [start, end), clipped to it."""
+        blocks = []
+        i = bisect.bisect_right(self.ends, start)
+        while i < len(self.starts) and self.starts[i] < end:
+            blocks.append((max(self.starts[i], start), min(self.ends[i], end)))
+            i += 1
+        return blocks
+
+    def free(self, start, end, minimum=timedelta(0)):
+        """Gaps in [start, end) with nothing booked, as (start, end) pairs at least `minimum` long."""
+        gaps = []
+        cursor = start
+        for block_start, block_end in self.busy(start, end) + [(end, end)]:
+            gap = block_start - cursor
+            if gap > timedelta(0) and gap >= minimum:
+                gaps.append((cursor, block_start))
+            cursor = max(cursor, block_end)
+        return gaps
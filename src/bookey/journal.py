@@ -0,0 +1,316 @@
+import json
+import uuid
+import base64
+import hashlib
+import threading
+
+from bookey import profiler
+from bookey.intervals import event_days
+
+
+# Tasks have no client-chosen ids, so a queued task lives in the store under a local one until it's sent
+
+LOCAL_PREFIX = "local-"
+
+# Answers that mean a replayed mutation had already taken effect
+
+DONE_STATUSES = {
+    "add_event": {409},
+    "delete_event": {404, 410},
+    "add_task": set(),
+    "complete_task": {404, 410},
+}
+
+# How long `bk` waits on exit for queued changes to go out before leaving them for the next run
+
+FLUSH_WAIT = 10
+
+
+def new_event_id(seed=None):
+    """A client-chosen event id. The same `seed` always gives the same id (imports, so a
+    replayed row comes back 409), without one it's random."""
+
+    # Calendar accepts client ids made of base32hex characters (0-9, a-v)
+
+    digest = hashlib.sha1(seed.encode()).digest() if seed is not None else uuid.uuid4().bytes
+    return "bk" + base64.b32hexencode(digest).decode().lower().rstrip("=")
+
+
+def landed_tasks(gc, adds):
+    """For each of `adds` (add_task's fields), the id of a task already there with the
+    same title, notes and due date, else None. Tasks take no client ids, so this is how
+    an add that was sent but never confirmed is told apart from one that was lost."""
+    existing = {
+        (t["title"], t["notes"], t["due"]): t["id"]
+        for t in gc.getTasks() if not t["id"].startswith(LOCAL_PREFIX)
+    }
+    return [existing.get((fields["title"], fields["notes"], fields["due"])) for fields in adds]
+
+
+def item_ref(item, default):
+    """(calendar or task list, id) for an item of a batched delete or complete, which is
+    either that pair or a bare id on `default`."""
+    return item if isinstance(item, tuple) else (default, item)
+
+
+class JournaledCalendar:
+    """Stands in for a GoogleCalendar (or RemoteCalendar) with add, delete and
+    complete going through a durable journal in the store. They return at once,
+    after updating the store so listings show the change, and a background thread
+    sends the journal in batches. Anything left when offline goes out on the next
+    run. Every entry carries an idempotency key: events get a client id (a replay
+    comes back 409), deletes and completes are keyed by their target, and a task
+    add that may have landed before a crash is looked up before it's sent again.
+
+    Queued entries coalesce: deleting an event, or completing a task, that was
+    added but not sent yet drops both, and repeating a delete or complete is a
+    no-op. Completing a task whose add was sent but not confirmed waits for it,
+    then goes out with the id Google gave the task. Everything else is forwarded
+    to the wrapped client."""
+
+    def __init__(self, gc, store):
+        self.gc = gc
+        self.store = store
+        self.failed = []
+
+        # Local stand-in ids of tasks Google has confirmed, and the ids it gave them, for completes that still
+        # hold a stand-in (a listing from before the add went out)
+
+        self.created = {}
+
+        # journal_lock covers check-then-change on the journal, flush_lock allows one flush at a time. Other
+        # bk processes share the journal, so a flush also claims it in the store before reading what to send
+
+        self.journal_lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.thread_lock = threading.Lock()
+        self.thread = None
+        self.again = False
+
+        # Whatever an earlier run couldn't send goes out now
+
+        if store.journal_entries():
+            self.flush_soon()
+
+    def __getattr__(self, name):
+        return getattr(self.gc, name)
+
+    # ── Mutations ──
+
+    def add_calendar(self, summary, start_time, end_time, description="", all_day=False):
+        event_id = new_event_id()
+        fields = {"summary": summary, "start_time": start_time, "end_time": end_time,
+                  "description": description, "all_day": all_day, "id": event_id}
+        self.store.journal_add(event_id, "add_event", "primary", event_id, json.dumps(fields))
+
+        first, last = event_days(start_time, end_time, all_day)
+        self.store.upsert_events("primary", [{
+            "id": event_id, "title": summary, "start": start_time, "end": end_time,
+            "is_all_day": all_day, "start_date": first, "end_date": last,
+        }])
+        self.flush_soon()
+        return {"id": event_id}
+
+    def delete_calendar(self, eventID, calendarID='primary'):
+        self.delete_events([(calendarID, eventID)])
+
+    def delete_events(self, eventIDs):
+        with self.journal_lock:
+            for item in eventIDs:
+                calendar_id, event_id = item_ref(item, 'primary')
+                queued = self.store.journal_find("add_event", event_id)
+                if queued and not queued["sent"]:
+                    self.store.journal_remove([queued["key"]])
+                else:
+                    self.store.journal_add(f"delete:{calendar_id}:{event_id}", "delete_event", calendar_id, event_id)
+                self.store.delete_events(calendar_id, [event_id])
+        self.flush_soon()
+        return [(item, None) for item in eventIDs]
+
+    def add_task(self, title, notes, due=None):
+        key = f"task:{uuid.uuid4().hex}"
+        local_id = LOCAL_PREFIX + key
+        fields = {"title": title, "notes": notes, "due": due}
+        self.store.journal_add(key, "add_task", "@default", local_id, json.dumps(fields))
+        self.store.upsert_tasks("@default", [
+            {"id": local_id, "title": title, "notes": notes, "due": due, "status": "needsAction"}
+        ])
+        self.flush_soon()
+        return {"id": local_id}
+
+    def complete_task(self, taskID, tasklistID='@default'):
+        self.complete_tasks([(tasklistID, taskID)])
+
+    def complete_tasks(self, taskIDs):
+        with self.journal_lock:
+            for item in taskIDs:
+                tasklist_id, task_id = item_ref(item, '@default')
+                task_id = self.created.get(task_id, task_id)
+                queued = self.store.journal_find("add_task", task_id)
+                if queued and not queued["sent"]:
+                    self.store.journal_remove([queued["key"]])
+                else:
+                    self.store.journal_add(
+                        f"complete:{tasklist_id}:{task_id}", "complete_task", tasklist_id, task_id)
+                self.store.delete_tasks(tasklist_id, [task_id])
+        self.flush_soon()
+        return [(item, None) for item in taskIDs]
+
+    def confirmed_id(self, task_id):
+        """The id Google gave a task added through the journal, once it's confirmed, else `task_id`."""
+        with self.journal_lock:
+            return self.created.get(task_id, task_id)
+
+    # ── Flushing ──
+
+    def flush_soon(self):
+        """Flush on a background thread. A flush already running picks up new entries when it's done."""
+        with self.thread_lock:
+            self.again = True
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._flush_loop, daemon=True)
+                self.thread.start()
+
+    def wait(self, timeout=FLUSH_WAIT):
+        """Wait up to `timeout` seconds for the background flush, leaving what it refused for finish()."""
+        thread = self.thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def finish(self, timeout=FLUSH_WAIT):
+        """Wait up to `timeout` seconds for the background flush. Returns the
+        (entry, error) pairs Google refused, and how many entries are still queued."""
+        self.wait(timeout)
+        failed, self.failed = self.failed, []
+        return failed, len(self.store.journal_entries())
+
+    def _flush_loop(self):
+        while True:
+            with self.thread_lock:
+                if not self.again:
+                    self.thread = None
+                    return
+                self.again = False
+            try:
+                sent = self.flush()
+            except Exception:
+                sent = False
+            if not sent:
+                with self.thread_lock:
+                    self.thread = None
+                return
+
+    def flush(self):
+        """Send everything queued, one batched call per kind of change. Returns False
+        when a transport failure stopped it, leaving the rest queued."""
+        with self.flush_lock, self.store.journal_claim(), profiler.phase("journal flush"):
+            for op, send in [
+                ("add_event", lambda batch: self.gc.insert_events(
+                    [(e["key"], json.loads(e["body"])) for e in batch])),
+                ("delete_event", lambda batch: self.gc.delete_events(
+                    [(e["target"], e["item_id"]) for e in batch])),
+                ("add_task", lambda batch: self.gc.insert_tasks(
+                    [(e["key"], json.loads(e["body"])) for e in batch])),
+                ("complete_task", lambda batch: self.gc.complete_tasks(
+                    [(e["target"], e["item_id"]) for e in batch])),
+            ]:
+
+                # Entries are marked sent just before going out, `sent` on the rows read here is from before
+
+                with self.journal_lock:
+                    batch = [e for e in self.store.journal_entries() if e["op"] == op]
+                    if op == "complete_task":
+                        batch = self._hold_stand_ins(batch)
+                    for entry in batch:
+                        if not entry["sent"]:
+                            self.store.journal_update(entry["key"], sent=True)
+                if op == "add_task":
+                    batch = self._drop_landed(batch)
+                if batch and not self._apply(op, batch, send(batch)):
+                    return False
+            return True
+
+    def _apply(self, op, batch, results):
+        done = []
+        created = {}
+        offline = False
+        for entry, (_, error, *response) in zip(batch, results):
+            status = getattr(getattr(error, "resp", None), "status", None)
+            if error is None or status in DONE_STATUSES[op]:
+                done.append(entry)
+                if op == "add_task" and response and response[0]:
+                    created[entry["item_id"]] = response[0]["id"]
+            elif status is None or (op == "add_task" and status >= 500):
+
+                # Left queued for the next flush. A task add that got a 5xx may have landed, so like one that
+                # timed out it's looked up before going again (the scheduler doesn't retry it). An error from
+                # before a connection was made means the entry can still be coalesced. The scheduler (and
+                # httplib2 with it) is only loaded on this path, queuing stays light
+
+                from bookey.scheduler import never_sent
+
+                offline = True
+                if never_sent(error):
+                    self.store.journal_update(entry["key"], sent=False)
+            else:
+                self.failed.append((entry, error))
+                self._undo(entry)
+                done.append(entry)
+
+        # A sent task replaces its local stand-in, the next sync brings the real one. A complete queued
+        # against the stand-in is pointed at the real task, in the same step as the add leaves the journal
+
+        with self.journal_lock:
+            self.created.update(created)
+            for local_id, task_id in created.items():
+                queued = self.store.journal_find("complete_task", local_id)
+                if queued:
+                    self.store.journal_update(queued["key"], item_id=task_id)
+            self.store.delete_tasks("@default", [e["item_id"] for e in done if e["op"] == "add_task"])
+            self.store.journal_remove([e["key"] for e in done])
+        return not offline
+
+    def _hold_stand_ins(self, entries):
+
+        # A complete queued against a task's local stand-in waits for the add, which points it at the real
+        # task once Google confirms it. Sent as is it would 404, and a 404 reads as already completed.
+        # If the add has left the journal without doing that, Google refused it (and that was reported),
+        # so there's no task to complete
+
+        ready = []
+        for entry in entries:
+            if not entry["item_id"].startswith(LOCAL_PREFIX):
+                ready.append(entry)
+            elif not self.store.journal_find("add_task", entry["item_id"]):
+                self.store.journal_remove([entry["key"]])
+        return ready
+
+    def _undo(self, entry):
+
+        # Google refused the change, so the store's optimistic copy is wrong. A dropped add is removed,
+        # a delete or complete forgets the sync state so the next read reloads the real data
+
+        if entry["op"] == "add_event":
+            self.store.delete_events(entry["target"], [entry["item_id"]])
+        elif entry["op"] == "delete_event":
+            self.store.set_meta(f"events_sync_token:{entry['target']}", None)
+        elif entry["op"] == "complete_task":
+            self.store.set_meta(f"tasks_updated_min:{entry['target']}", None)
+
+    def _drop_landed(self, entries):
+
+        # A task add that was sent before but never confirmed may have gone through. Tasks take no
+        # client ids, so look for one with the same title, notes and due date before sending it again
+
+        unconfirmed = [e for e in entries if e["sent"]]
+        if not unconfirmed:
+            return entries
+        landed = []
+        results = []
+        found = landed_tasks(self.gc, [json.loads(e["body"]) for e in unconfirmed])
+        for entry, task_id in zip(unconfirmed, found):
+            if task_id:
+                landed.append(entry)
+                results.append((entry["key"], None, {"id": task_id}))
+        self._apply("add_task", landed, results)
+        return [e for e in entries if e not in landed]
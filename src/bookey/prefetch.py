@@ -0,0 +1,260 @@
+import bisect
+import threading
+import time
+from datetime import datetime
+
+from bookey import profiler
+from bookey.agenda import merge_agenda
+from bookey.intervals import event_days
+from bookey.journal import item_ref
+
+
+# What the menu's views show, and so what's fetched while the menu is up
+
+PREFETCH_DAYS = 7
+
+# How long, in seconds, prefetched events and tasks are shown without asking the server again
+
+CACHE_TTL = 60
+
+# After a change, how long the refresh waits for the journal to send it, so the server's answer includes it
+
+RECONCILE_WAIT = 10
+
+
+class CachedCalendar:
+    """The interactive menu's client. `prefetch()` builds the wrapped client with
+    `factory` and fetches the next 7 days of events and the task list on a
+    background thread, and the menu's views read those copies for CACHE_TTL
+    seconds. Adds, deletes and completes patch the copies straight away, then a
+    refresh replaces them with the server's answer once the journal has sent the
+    change. An added task is cached under the journal's stand-in id until Google
+    confirms it, and under Google's id from then on. Everything else is forwarded
+    to the wrapped client."""
+
+    def __init__(self, factory, ttl=CACHE_TTL):
+        self.factory = factory
+        self.ttl = ttl
+        self.client = None
+        self.build_lock = threading.Lock()
+
+        # events is (day, loaded at, slots) and tasks is (loaded at, tasks). generation counts changes, so a
+        # refresh that started before one doesn't overwrite the patched copies with an answer missing it
+
+        self.events = None
+        self.tasks = None
+        self.generation = 0
+        self.lock = threading.Lock()
+
+        # What's being fetched right now, so a view opened meanwhile waits for it rather than asking twice
+
+        self.loading = set()
+        self.loaded = threading.Condition(self.lock)
+        self.thread = None
+        self.again = False
+        self.reconcile = False
+
+    def __getattr__(self, name):
+        return getattr(self.gc, name)
+
+    @property
+    def gc(self):
+        with self.build_lock:
+            if self.client is None:
+                self.client = self.factory()
+            return self.client
+
+    def built(self):
+        """The wrapped client, waiting for a build under way, or None if it was never built."""
+        with self.build_lock:
+            return self.client
+
+    # ── Prefetching ──
+
+    def prefetch(self):
+        """Fetch whatever isn't cached, or is older than the TTL, on a background thread."""
+        with self.lock:
+            if self._fresh_events(_today()) is not None and self._fresh_tasks() is not None:
+                return
+        self._schedule(reconcile=False)
+
+    def _schedule(self, reconcile):
+        with self.lock:
+            self.again = True
+            self.reconcile = self.reconcile or reconcile
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._refresh_loop, name="bookey-prefetch", daemon=True)
+                self.thread.start()
+
+    def _refresh_loop(self):
+        while True:
+            with self.lock:
+                if not self.again:
+                    self.thread = None
+                    return
+                self.again = False
+                reconcile, self.reconcile = self.reconcile, False
+            try:
+                if reconcile:
+                    self.gc.wait(RECONCILE_WAIT)
+                    self._swap_stand_ins()
+                self._load_events(_today())
+                self._load_tasks()
+            except Exception:
+
+                # Left for the view that needs it, which fetches in the foreground and shows the error
+
+                pass
+
+    def _swap_stand_ins(self):
+
+        # Added tasks the journal has sent take the id Google gave them, so the cached copy is right even if the
+        # refresh after it fails and the copy lives out its TTL
+
+        with self.lock:
+            if self.tasks:
+                for task in self.tasks[1]:
+                    task["id"] = self.gc.confirmed_id(task["id"])
+
+    def _fresh_events(self, day):
+        if self.events and self.events[0] == day and time.monotonic() - self.events[1] < self.ttl:
+            return self.events[2]
+        return None
+
+    def _fresh_tasks(self):
+        if self.tasks and time.monotonic() - self.tasks[0] < self.ttl:
+            return self.tasks[1]
+        return None
+
+    def _load_events(self, day):
+        return self._load("events", lambda: self.gc.getCalendarSlots(day, PREFETCH_DAYS),
+                          lambda now, slots: (day, now, slots))
+
+    def _load_tasks(self):
+        return self._load("tasks", self.gc.getTasks, lambda now, tasks: (now, tasks))
+
+    def _load(self, kind, fetch, entry):
+        with self.lock:
+            generation = self.generation
+            self.loading.add(kind)
+        try:
+            with profiler.phase(f"prefetch {kind}"):
+                result = fetch()
+            with self.lock:
+                if generation == self.generation:
+                    setattr(self, kind, entry(time.monotonic(), result))
+            return result
+        finally:
+            with self.lock:
+                self.loading.discard(kind)
+                self.loaded.notify_all()
+
+    def _cached(self, kind, fresh):
+
+        # A fetch already under way (the menu's prefetch) is waited for. If it fails, or a change lands
+        # while it runs, there's still nothing fresh and the caller fetches for itself
+
+        with self.lock:
+            value = fresh()
+            while value is None and kind in self.loading:
+                self.loaded.wait()
+                value = fresh()
+        return value
+
+    # ── Reads ──
+
+    def getCalendarSlots(self, focus_date, days):
+        day = _today()
+        if days != PREFETCH_DAYS or focus_date != day:
+            return self.gc.getCalendarSlots(focus_date, days)
+        slots = self._cached("events", lambda: self._fresh_events(day))
+        if slots is None:
+            slots = self._load_events(day)
+
+        # Callers get their own lists, so nothing they do reaches the cache
+
+        return {date_str: list(events) for date_str, events in slots.items()}
+
+    def getTasks(self):
+        tasks = self._cached("tasks", self._fresh_tasks)
+        if tasks is None:
+            tasks = self._load_tasks()
+        return list(tasks)
+
+    def iter_task_pages(self, due_max=None):
+        tasks = self.getTasks()
+        if due_max:
+            tasks = [t for t in tasks if t["due"] and t["due"][:10] < due_max]
+        yield tasks
+
+    def getAgenda(self, focus_date, days=PREFETCH_DAYS):
+        if days != PREFETCH_DAYS or focus_date != _today():
+            return self.gc.getAgenda(focus_date, days)
+        return merge_agenda(self.getCalendarSlots(focus_date, days), self.getTasks(), focus_date)
+
+    # ── Mutations ──
+
+    def add_calendar(self, summary, start_time, end_time, description="", all_day=False):
+        result = self.gc.add_calendar(summary, start_time, end_time, description, all_day)
+        event = {
+            "id": result["id"], "title": summary, "start": start_time, "end": end_time, "is_all_day": all_day,
+            "calendar_id": "primary", "calendar": _name(self.gc.calendars, "primary"),
+        }
+        first, last = event_days(start_time, end_time, all_day)
+        with self.lock:
+            if self.events:
+                for date_str, events in self.events[2].items():
+                    if first <= date_str <= last:
+                        bisect.insort(events, event, key=lambda e: e["start"])
+        self._changed()
+        return result
+
+    def delete_calendar(self, eventID, calendarID='primary'):
+        self.delete_events([(calendarID, eventID)])
+
+    def delete_events(self, eventIDs):
+        results = self.gc.delete_events(eventIDs)
+        gone = {item_ref(item, "primary") for item, error in results if error is None}
+        with self.lock:
+            if self.events:
+                for events in self.events[2].values():
+                    events[:] = [e for e in events if (e["calendar_id"], e["id"]) not in gone]
+        self._changed()
+        return results
+
+    def add_task(self, title, notes, due=None):
+        result = self.gc.add_task(title, notes, due)
+        task = {
+            "id": result["id"], "title": title, "notes": notes, "due": due, "status": "needsAction",
+            "tasklist": "@default", "tasklist_name": _name(self.gc.tasklists, "@default"),
+        }
+        with self.lock:
+            if self.tasks:
+                bisect.insort(self.tasks[1], task, key=lambda t: t["due"] or "9999-12-31")
+        self._changed()
+        return result
+
+    def complete_task(self, taskID, tasklistID='@default'):
+        self.complete_tasks([(tasklistID, taskID)])
+
+    def complete_tasks(self, taskIDs):
+        results = self.gc.complete_tasks(taskIDs)
+        done = {item_ref(item, "@default") for item, error in results if error is None}
+        with self.lock:
+            if self.tasks:
+                self.tasks[1][:] = [t for t in self.tasks[1] if (t["tasklist"], t["id"]) not in done]
+        self._changed()
+        return results
+
+    def _changed(self):
+        with self.lock:
+            self.generation += 1
+        self._schedule(reconcile=True)
+
+
+def _today():
+    return datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _name(sources, source_id):
+    return next((s["name"] for s in sources if s["id"] == source_id), source_id)
@@ -0,0 +1,156 @@
+import json
+import time
+import threading
+
+
+# The running profiler, None unless `--profile` or BOOKEY_PROFILE turned it on. Every hook checks this
+# first, so a normal run pays one attribute lookup per phase or request
+
+active = None
+
+
+class Profiler:
+    """Records phases (named spans of work, nested per thread) and every HTTP
+    request with its method, URL template, status, bytes received and duration."""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.phases = []
+        self.requests = []
+        self.templates = {}
+        self.threads = {}
+        self.lock = threading.Lock()
+        self._local = threading.local()
+
+    def add_templates(self, doc):
+        """Learn the URL template of every method in a discovery document, keyed by method id."""
+        def walk(resources):
+            for resource in resources.values():
+                for method in resource.get("methods", {}).values():
+                    self.templates[method["id"]] = doc["servicePath"] + method["path"]
+                walk(resource.get("resources", {}))
+        walk(doc.get("resources", {}))
+
+    def record_request(self, label, method, uri, status, size, started, error=None):
+        from urllib.parse import urlsplit
+
+        ended = time.perf_counter()
+        thread = self._thread()
+        self.requests.append({
+            "label": label,
+            "method": method,
+            "template": self.templates.get(label) or urlsplit(uri).path.lstrip("/"),
+            "status": status,
+            "error": error,
+            "bytes": size,
+            "start": started - self.origin,
+            "duration": ended - started,
+            "thread": thread,
+        })
+
+    def elapsed(self):
+        return time.perf_counter() - self.origin
+
+    def summary(self):
+        """(phases, requests) aggregated by name and by (method, template), in the order first seen."""
+        phases = {}
+        for name, _, start, duration, depth in self.phases:
+            row = phases.setdefault(name, {"name": name, "depth": depth, "first": start,
+                                           "count": 0, "total": 0.0, "max": 0.0})
+            row["count"] += 1
+            row["total"] += duration
+            row["max"] = max(row["max"], duration)
+            row["depth"] = min(row["depth"], depth)
+        requests = {}
+        for r in self.requests:
+            row = requests.setdefault((r["method"], r["template"]), {
+                "method": r["method"], "template": r["template"], "count": 0,
+                "statuses": {}, "bytes": 0, "total": 0.0, "max": 0.0,
+            })
+            status = r["status"] or r["error"]
+            row["count"] += 1
+            row["statuses"][status] = row["statuses"].get(status, 0) + 1
+            row["bytes"] += r["bytes"]
+            row["total"] += r["duration"]
+            row["max"] = max(row["max"], r["duration"])
+        return sorted(phases.values(), key=lambda p: p["first"]), list(requests.values())
+
+    def trace(self):
+        """The recording in Chrome's trace event format, for chrome://tracing or Perfetto."""
+        events = [
+            {"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": name}}
+            for name, tid in self.threads.items()
+        ]
+        for name, thread, start, duration, _ in self.phases:
+            events.append({"name": name, "cat": "phase", "ph": "X", "pid": 1, "tid": thread,
+                           "ts": start * 1e6, "dur": duration * 1e6})
+        for r in self.requests:
+            events.append({
+                "name": f"{r['method']} {r['template']}", "cat": "http", "ph": "X", "pid": 1,
+                "tid": r["thread"], "ts": r["start"] * 1e6, "dur": r["duration"] * 1e6,
+                "args": {"status": r["status"], "error": r["error"], "bytes": r["bytes"], "method_id": r["label"]},
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_trace(self, path):
+        with open(path, "w") as f:
+            json.dump(self.trace(), f)
+
+    def _thread(self):
+
+        # Small stable ids per thread read better in the trace viewer than OS thread idents
+
+        name = threading.current_thread().name
+        with self.lock:
+            if name not in self.threads:
+                self.threads[name] = len(self.threads) + 1
+            return self.threads[name]
+
+
+class _Phase:
+    __slots__ = ("profiler", "name", "started", "depth")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        local = self.profiler._local
+        self.depth = getattr(local, "depth", 0)
+        local.depth = self.depth + 1
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        ended = time.perf_counter()
+        profiler = self.profiler
+        profiler._local.depth = self.depth
+        profiler.phases.append((self.name, profiler._thread(), self.started - profiler.origin,
+                                ended - self.started, self.depth))
+        return False
+
+
+class _NoPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_PHASE = _NoPhase()
+
+
+def phase(name):
+    """Context manager timing `name` when profiling, a shared no-op otherwise."""
+    if active is None:
+        return _NO_PHASE
+    return _Phase(active, name)
+
+
+def start():
+    global active
+    active = Profiler()
+    return active
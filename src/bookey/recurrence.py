@@ -0,0 +1,306 @@
+import calendar
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from bookey.intervals import rfc3339_time
+
+
+WEEKDAYS = {"MO": 0, "TU": 1, "WE": 2, "TH": 3, "FR": 4, "SA": 5, "SU": 6}
+
+# The RRULE parts expanded here, which covers what Google Calendar's own recurrence editor writes.
+# Anything else (BYSETPOS, BYWEEKNO, hourly rules...) raises UnsupportedRule
+
+FREQUENCIES = {"DAILY", "WEEKLY", "MONTHLY", "YEARLY"}
+PARTS = {"FREQ", "INTERVAL", "COUNT", "UNTIL", "BYDAY", "BYMONTHDAY", "BYMONTH", "WKST"}
+
+
+class UnsupportedRule(ValueError):
+    """A recurrence this module can't expand, the caller asks Google for its instances instead."""
+
+
+def instances(master, window_start, window_end):
+    """Instances of the recurring event `master` (as Google sends it) that overlap
+    [window_start, window_end), naive local datetimes. Each is parsed like
+    GoogleCalendar._parse_event, with the id Google gives that instance
+    (master id, then the original start), so modified and cancelled instances
+    can be matched by id."""
+    start_info, end_info = master["start"], master["end"]
+    all_day = "dateTime" not in start_info
+    if all_day:
+        tz = None
+        dtstart = datetime.fromisoformat(start_info["date"])
+        duration = datetime.fromisoformat(end_info["date"]) - dtstart
+        lower, upper = window_start, window_end
+    else:
+        start = rfc3339_time(start_info["dateTime"])
+        tz = _zone(start_info.get("timeZone"), start.tzinfo)
+        dtstart = start.astimezone(tz).replace(tzinfo=None)
+        duration = rfc3339_time(end_info["dateTime"]).astimezone(tz).replace(tzinfo=None) - dtstart
+
+        # Recurrence is wall-clock time in the event's zone, so a 10:00 meeting stays at 10:00 across DST
+
+        lower = window_start.astimezone(tz).replace(tzinfo=None)
+        upper = window_end.astimezone(tz).replace(tzinfo=None)
+
+    rules, extra, excluded = _parse_recurrence(master.get("recurrence", []), dtstart, tz, all_day)
+    starts = set()
+    for rule in rules:
+        starts.update(_occurrences(rule, dtstart, lower - duration, upper))
+    starts.update(s for s in extra if lower - duration <= s < upper)
+
+    # The first start always counts as an instance, even when the rule wouldn't pick it
+
+    if lower - duration <= dtstart < upper:
+        starts.add(dtstart)
+
+    found = []
+    for wall in sorted(starts):
+        if wall in excluded or wall.date() in excluded or wall + duration <= lower:
+            continue
+        found.append(_instance(master, wall, duration, tz, all_day))
+    return found
+
+
+def _instance(master, wall, duration, tz, all_day):
+    if all_day:
+        return {
+            "id": f"{master['id']}_{wall:%Y%m%d}",
+            "title": master.get("summary", "(No Title)"),
+            "start": wall.date().isoformat(),
+            "end": (wall + duration).date().isoformat(),
+            "is_all_day": True,
+        }
+    start = wall.replace(tzinfo=tz)
+    return {
+        "id": f"{master['id']}_{start.astimezone(timezone.utc):%Y%m%dT%H%M%SZ}",
+        "title": master.get("summary", "(No Title)"),
+        "start": start.isoformat(),
+        "end": (wall + duration).replace(tzinfo=tz).isoformat(),
+        "is_all_day": False,
+    }
+
+
+# ── Parsing ─────────────────────────────────────────────────────
+
+
+def _zone(name, fallback):
+    if name:
+        try:
+            return ZoneInfo(name)
+        except (ZoneInfoNotFoundError, ValueError):
+            pass
+    return fallback
+
+
+def _parse_recurrence(lines, dtstart, tz, all_day):
+    """(rules, RDATE starts, EXDATE starts and dates) from an event's recurrence lines."""
+    rules, extra, excluded = [], set(), set()
+    for line in lines:
+        head, _, value = line.partition(":")
+        name, *params = head.split(";")
+        name = name.upper()
+        if name == "RRULE":
+            rules.append(_parse_rule(value, tz, all_day))
+        elif name in ("RDATE", "EXDATE"):
+            params = dict(p.split("=", 1) for p in params if "=" in p)
+            zone = _zone(params.get("TZID"), tz)
+            for item in value.split(","):
+                when = _parse_when(item, zone, tz, all_day)
+                if name == "RDATE":
+                    extra.add(when if isinstance(when, datetime) else datetime.combine(when, dtstart.time()))
+                else:
+                    excluded.add(when)
+        else:
+            raise UnsupportedRule(f"{name} isn't supported")
+    return rules, extra, excluded
+
+
+def _parse_when(value, zone, tz, all_day):
+    """A DATE or DATE-TIME value as wall-clock time in the event's zone. Plain dates
+    on a timed event stay dates and match any instance that day."""
+    if "T" not in value:
+        day = datetime.strptime(value, "%Y%m%d")
+        return day if all_day else day.date()
+    if value.endswith("Z"):
+        moment = datetime.strptime(value, "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc)
+    else:
+        moment = datetime.strptime(value, "%Y%m%dT%H%M%S")
+        if zone is None or all_day:
+            return moment
+        moment = moment.replace(tzinfo=zone)
+    if all_day:
+        return moment.replace(hour=0, minute=0, second=0, tzinfo=None)
+    return moment.astimezone(tz).replace(tzinfo=None)
+
+
+def _parse_rule(text, tz, all_day):
+    parts = dict(p.split("=", 1) for p in text.upper().split(";") if p)
+    unknown = set(parts) - PARTS
+    if unknown:
+        raise UnsupportedRule(f"RRULE parts {', '.join(sorted(unknown))} aren't supported")
+    if parts.get("FREQ") not in FREQUENCIES:
+        raise UnsupportedRule(f"FREQ={parts.get('FREQ')} isn't supported")
+
+    rule = {
+        "freq": parts["FREQ"],
+        "interval": int(parts.get("INTERVAL", 1)),
+        "count": int(parts["COUNT"]) if "COUNT" in parts else None,
+        "until": None,
+        "wkst": WEEKDAYS[parts.get("WKST", "MO")],
+        "bymonth": [int(m) for m in parts["BYMONTH"].split(",")] if "BYMONTH" in parts else [],
+        "bymonthday": [int(d) for d in parts["BYMONTHDAY"].split(",")] if "BYMONTHDAY" in parts else [],
+        "byday": [],
+    }
+    for item in parts["BYDAY"].split(",") if "BYDAY" in parts else []:
+        rule["byday"].append((int(item[:-2] or 0), WEEKDAYS[item[-2:]]))
+
+    # Ordinals (2TU, -1FR) only mean something within a month, and a yearly rule needs BYMONTH for that
+
+    ordinals = any(n for n, _ in rule["byday"])
+    if ordinals and (rule["freq"] in ("DAILY", "WEEKLY") or rule["freq"] == "YEARLY" and not rule["bymonth"]):
+        raise UnsupportedRule("BYDAY ordinals outside a month aren't supported")
+    if rule["freq"] == "YEARLY" and rule["byday"] and not rule["bymonth"]:
+        raise UnsupportedRule("yearly BYDAY without BYMONTH isn't supported")
+
+    if "UNTIL" in parts:
+        until = parts["UNTIL"]
+        if "T" not in until:
+
+            # A plain date is inclusive, so a timed event's last instance can be any time that day
+
+            rule["until"] = datetime.strptime(until, "%Y%m%d")
+            if not all_day:
+                rule["until"] += timedelta(days=1, microseconds=-1)
+        else:
+            rule["until"] = _parse_when(until, tz, tz, all_day)
+    return rule
+
+
+# ── Expansion ───────────────────────────────────────────────────
+
+
+def _occurrences(rule, dtstart, lower, upper):
+    """Starts (naive wall-clock) the rule generates in [lower, upper), honouring COUNT and UNTIL."""
+
+    # Without COUNT every period before the window can be skipped, with it they all have to be counted
+
+    period = 0 if rule["count"] else max(0, _period_index(rule, dtstart, lower) - 1)
+    seen = 0
+    clock = dtstart.time()
+    while True:
+        first = _period_start(rule, dtstart, period)
+        if datetime.combine(first, time.min) >= upper:
+            return
+        for day in _period_days(rule, dtstart, first):
+            start = datetime.combine(day, clock)
+            if start < dtstart:
+                continue
+            if rule["until"] is not None and start > rule["until"]:
+                return
+            seen += 1
+            if rule["count"] and seen > rule["count"]:
+                return
+            if start >= upper:
+                return
+            if start >= lower:
+                yield start
+        period += 1
+
+
+def _week_start(day, wkst):
+    return day - timedelta(days=(day.weekday() - wkst) % 7)
+
+
+def _add_months(year, month, months):
+    year, month = divmod(year * 12 + month - 1 + months, 12)
+    return year, month + 1
+
+
+def _period_index(rule, dtstart, moment):
+    step = rule["interval"]
+    if rule["freq"] == "DAILY":
+        return (moment.date() - dtstart.date()).days // step
+    if rule["freq"] == "WEEKLY":
+        return (_week_start(moment.date(), rule["wkst"]) - _week_start(dtstart.date(), rule["wkst"])).days // 7 // step
+    if rule["freq"] == "MONTHLY":
+        return ((moment.year - dtstart.year) * 12 + moment.month - dtstart.month) // step
+    return (moment.year - dtstart.year) // step
+
+
+def _period_start(rule, dtstart, period):
+    step = period * rule["interval"]
+    if rule["freq"] == "DAILY":
+        day = dtstart.date() + timedelta(days=step)
+    elif rule["freq"] == "WEEKLY":
+        day = _week_start(dtstart.date(), rule["wkst"]) + timedelta(weeks=step)
+    elif rule["freq"] == "MONTHLY":
+        day = date(*_add_months(dtstart.year, dtstart.month, step), 1)
+    else:
+        day = date(dtstart.year + step, 1, 1)
+    return day
+
+
+def _period_days(rule, dtstart, first):
+    """The days in the period (day, week, month or year) starting on `first` the rule picks, in order."""
+    if rule["freq"] == "DAILY":
+        days = [first]
+        if rule["byday"]:
+            days = [d for d in days if d.weekday() in {wd for _, wd in rule["byday"]}]
+        if rule["bymonthday"]:
+            days = [d for d in days if _matches_monthday(d, rule["bymonthday"])]
+    elif rule["freq"] == "WEEKLY":
+        days = [first + offset for offset in _week_offsets(rule, dtstart)]
+    elif rule["freq"] == "MONTHLY":
+        days = _month_days(first.year, first.month, rule, dtstart.day)
+    else:
+        if rule["bymonth"]:
+            months = sorted(rule["bymonth"])
+        elif rule["bymonthday"]:
+            months = range(1, 13)
+        else:
+            months = [dtstart.month]
+        days = [d for month in months for d in _month_days(first.year, month, rule, dtstart.day)]
+        return days
+    if rule["bymonth"]:
+        days = [d for d in days if d.month in rule["bymonth"]]
+    return days
+
+
+def _week_offsets(rule, dtstart):
+
+    # The same for every week of the rule, so worked out once
+
+    if "offsets" not in rule:
+        weekdays = {wd for _, wd in rule["byday"]} or {dtstart.weekday()}
+        rule["offsets"] = [timedelta(days=d) for d in sorted((wd - rule["wkst"]) % 7 for wd in weekdays)]
+    return rule["offsets"]
+
+
+def _matches_monthday(day, monthdays):
+    last = calendar.monthrange(day.year, day.month)[1]
+    return any(day.day == (d if d > 0 else last + d + 1) for d in monthdays)
+
+
+def _month_days(year, month, rule, default_day):
+    last = calendar.monthrange(year, month)[1]
+    if rule["bymonthday"]:
+        monthdays = {d if d > 0 else last + d + 1 for d in rule["bymonthday"]}
+        days = {d for d in monthdays if 1 <= d <= last}
+    else:
+        days = None
+
+    if rule["byday"]:
+        weekdays = set()
+        for ordinal, weekday in rule["byday"]:
+            matching = [d for d in range(1, last + 1) if calendar.weekday(year, month, d) == weekday]
+            if not ordinal:
+                weekdays.update(matching)
+            elif -len(matching) <= ordinal <= len(matching):
+                weekdays.add(matching[ordinal - 1 if ordinal > 0 else ordinal])
+        days = weekdays if days is None else days & weekdays
+
+    # A plain monthly rule repeats on the start's day, months without that day are skipped
+
+    if days is None:
+        days = {default_day} if default_day <= last else set()
+    return [date(year, month, d) for d in sorted(days)]
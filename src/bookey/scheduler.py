@@ -0,0 +1,289 @@
+import json
+import random
+import socket
+import threading
+import time
+import httplib2
+
+from bookey import profiler
+
+
+# Statuses worth another try, 403 only when Google says it's a rate limit
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+# Transport failures (timeouts, resets) get fewer retries than throttling, so being offline fails fast
+
+TRANSPORT_RETRIES = 2
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 32
+
+
+class TokenBucket:
+    """Allows `per_second` units on average with bursts up to `burst`. A request
+    bigger than the bucket waits for a full bucket and leaves it in debt."""
+
+    def __init__(self, per_second, burst):
+        self.per_second = per_second
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, units=1):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.per_second)
+                self.updated = now
+                needed = min(units, self.burst)
+                if self.tokens >= needed:
+                    self.tokens -= units
+                    return
+                wait = (needed - self.tokens) / self.per_second
+            time.sleep(wait)
+
+
+class AdaptiveLimit:
+    """Additive increase, multiplicative decrease between `minimum` and `maximum`."""
+
+    def __init__(self, maximum, minimum=1):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.value = maximum
+        self.lock = threading.Lock()
+
+    def increase(self):
+        with self.lock:
+            self.value = min(self.maximum, self.value + 1)
+
+    def decrease(self):
+        with self.lock:
+            self.value = max(self.minimum, self.value // 2)
+
+
+class MeteredHttp:
+    """Passes requests through to `http`, reporting every response to `on_response`,
+    and every request to the profiler under `label` when one is running."""
+
+    def __init__(self, http, on_response, label=None):
+        self.http = http
+        self.on_response = on_response
+        self.label = label
+
+    def request(self, uri, method="GET", *args, **kwargs):
+        run = profiler.active
+        if run is None:
+            resp, content = self.http.request(uri, method, *args, **kwargs)
+            self.on_response(resp, content)
+            return resp, content
+
+        started = time.perf_counter()
+        try:
+            resp, content = self.http.request(uri, method, *args, **kwargs)
+        except Exception as e:
+            run.record_request(self.label, method, uri, None, 0, started, error=type(e).__name__)
+            raise
+        run.record_request(self.label, method, uri, resp.status, len(content or b""), started)
+        self.on_response(resp, content)
+        return resp, content
+
+    def __getattr__(self, name):
+
+        # googleapiclient also reads `credentials` and friends off the transport
+
+        return getattr(self.http, name)
+
+
+class Scheduler:
+    """Every API call goes through here: token-bucket pacing per API, retries with
+    exponential backoff and full jitter, adaptive batch size and fan-out width, and
+    per-command counters of calls, units, retries, throttled responses and bytes received."""
+
+    def __init__(self, config, batch_limit):
+        self.max_retries = config["max_retries"]
+        self.buckets = {
+            api: TokenBucket(limits["per_second"], limits["burst"])
+            for api, limits in config["rate_limits"].items()
+        }
+        self.concurrency = AdaptiveLimit(config["max_concurrency"])
+        self.batch_size = AdaptiveLimit(batch_limit, minimum=5)
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def execute(self, request, http):
+        api = self._api(request)
+        http = self._metered(api, http, getattr(request, "methodId", None))
+        attempt = 0
+        while True:
+            self._acquire(api, 1)
+            self._count(api, calls=1, units=1)
+            try:
+                result = request.execute(http=http)
+            except Exception as e:
+                if not self._should_retry(e, attempt, request):
+                    raise
+                self._note_failure(api, e)
+                attempt += 1
+                self._count(api, retries=1)
+                time.sleep(self._backoff(attempt))
+                continue
+            self.concurrency.increase()
+            return result
+
+    def execute_batch(self, service, requests, http):
+        """Run `requests` in batches, returning {index: (exception or None, response)}.
+        Items the server throttled are retried in a later, smaller batch."""
+        if not requests:
+            return {}
+        api = self._api(requests[0])
+        http = self._metered(api, http, "batch")
+        outcomes = {}
+        pending = list(range(len(requests)))
+        attempt = 0
+
+        while pending:
+            retry = []
+            position = 0
+            while position < len(pending):
+                chunk = pending[position:position + self.batch_size.value]
+                position += len(chunk)
+                results = {}
+
+                def callback(request_id, response, exception, results=results):
+                    results[int(request_id)] = (exception, response)
+
+                batch = service.new_batch_http_request(callback=callback)
+                for i in chunk:
+                    batch.add(requests[i], request_id=str(i))
+
+                self._acquire(api, len(chunk))
+                self._count(api, calls=1, units=len(chunk))
+                try:
+                    batch.execute(http=http)
+                except Exception as e:
+
+                    # The whole round trip failed, so every item without a result shares its fate. Inserts
+                    # Google gives the id to only go again if the batch can't have reached it
+
+                    again = [i for i in chunk if self._should_retry(e, attempt, requests[i])]
+                    if again:
+                        self._note_failure(api, e)
+                        retry.extend(again)
+                    for i in chunk:
+                        if i not in again:
+                            outcomes[i] = results.get(i, (e, None))
+                    continue
+
+                throttled = [
+                    i for i in chunk if self._should_retry(results.get(i, (None, None))[0], attempt, requests[i])
+                ]
+                if throttled:
+                    self._note_failure(api, results[throttled[0]][0])
+                    self.batch_size.decrease()
+                else:
+                    self.batch_size.increase()
+                for i in chunk:
+                    if i in throttled:
+                        retry.append(i)
+                    else:
+                        outcomes[i] = results.get(i, (None, None))
+
+            if retry:
+                attempt += 1
+                self._count(api, retries=len(retry))
+                time.sleep(self._backoff(attempt))
+            pending = retry
+
+        return outcomes
+
+    def summary(self):
+        with self.lock:
+            return {api: dict(counts) for api, counts in self.stats.items()}
+
+    def _api(self, request):
+
+        # methodId looks like "calendar.events.list" or "tasks.tasks.patch"
+
+        return (getattr(request, "methodId", None) or "other").split(".")[0]
+
+    def _metered(self, api, http, label):
+
+        # httplib2 has already gunzipped the body, "-content-encoding" remembers that it came compressed
+
+        def on_response(resp, content):
+            self._count(api, bytes=len(content or b""), compressed=int("-content-encoding" in resp))
+
+        return MeteredHttp(http, on_response, label)
+
+    def _acquire(self, api, units):
+        bucket = self.buckets.get(api)
+        if bucket is not None:
+            bucket.acquire(units)
+
+    def _count(self, api, **counts):
+        with self.lock:
+            totals = self.stats.setdefault(api, {
+                "calls": 0, "units": 0, "retries": 0, "throttled": 0, "bytes": 0, "compressed": 0,
+            })
+            for name, value in counts.items():
+                totals[name] += value
+
+    def _note_failure(self, api, error):
+        if self._is_throttle(error):
+            self._count(api, throttled=1)
+            self.concurrency.decrease()
+
+    def _should_retry(self, error, attempt, request=None):
+        if error is None:
+            return False
+        status = getattr(getattr(error, "resp", None), "status", None)
+        if status is None:
+            if not (isinstance(error, (OSError, httplib2.HttpLib2Error)) and attempt < TRANSPORT_RETRIES):
+                return False
+            return _idempotent(request) or never_sent(error)
+        if attempt >= self.max_retries:
+            return False
+
+        # Throttling turns a request away before it does anything, a 5xx may come after it went through
+
+        if self._is_throttle(error):
+            return True
+        return status in RETRY_STATUSES and _idempotent(request)
+
+    def _is_throttle(self, error):
+        status = getattr(getattr(error, "resp", None), "status", None)
+        if status == 429:
+            return True
+        if status != 403:
+            return False
+        try:
+            details = json.loads(error.content)["error"]["errors"]
+        except (ValueError, KeyError, TypeError):
+            return False
+        return any(d.get("reason") in RATE_LIMIT_REASONS for d in details)
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+def _idempotent(request):
+
+    # An insert Google picks the id for (a task) makes another copy every time it lands, so after an answer
+    # that doesn't say whether it did (a timeout, a 5xx) it isn't sent again. Events carry a client-chosen id,
+    # so a repeat is a 409
+
+    method = getattr(request, "methodId", None) or ""
+    if not method.endswith(".insert"):
+        return True
+    try:
+        return "id" in json.loads(request.body or "{}")
+    except (TypeError, ValueError):
+        return False
+
+
+def never_sent(error):
+    """Whether a transport error happened before a connection was made, so the request can't have reached Google."""
+    return (isinstance(error, (ConnectionRefusedError, socket.gaierror))
+            or type(error).__name__ == "ServerNotFoundError")
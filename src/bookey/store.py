@@ -0,0 +1,292 @@
+import os
+import json
+import fcntl
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from bookey.auth import CONFIG_DIR
+
+
+STORE_PATH = os.path.join(CONFIG_DIR, "bookey.db")
+
+# How far back the first full event sync reaches, later syncs only ask for what changed since
+
+SYNC_PAST_DAYS = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    calendar_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    title TEXT,
+    start TEXT,
+    end TEXT,
+    is_all_day INTEGER,
+    start_date TEXT,
+    end_date TEXT,
+    PRIMARY KEY (calendar_id, id)
+);
+CREATE INDEX IF NOT EXISTS events_calendar_dates ON events (calendar_id, start_date, end_date);
+
+CREATE TABLE IF NOT EXISTS recurring (
+    calendar_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    body TEXT NOT NULL,
+    PRIMARY KEY (calendar_id, id)
+);
+
+CREATE TABLE IF NOT EXISTS overridden (
+    calendar_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    PRIMARY KEY (calendar_id, id)
+);
+
+CREATE TABLE IF NOT EXISTS tasks (
+    tasklist TEXT NOT NULL,
+    id TEXT NOT NULL,
+    title TEXT,
+    notes TEXT,
+    due TEXT,
+    status TEXT,
+    PRIMARY KEY (tasklist, id)
+);
+CREATE INDEX IF NOT EXISTS tasks_list_status_due ON tasks (tasklist, status, due);
+
+CREATE TABLE IF NOT EXISTS journal (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    op TEXT NOT NULL,
+    target TEXT NOT NULL,
+    item_id TEXT NOT NULL,
+    body TEXT,
+    sent INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class Store:
+    """Local SQLite copy of events and tasks, kept current with sync tokens."""
+
+    def __init__(self, path=STORE_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+
+        # One connection shared by worker threads, every statement runs under the lock
+
+        self.lock = threading.Lock()
+        with self.lock, self.db:
+            self.db.executescript(SCHEMA)
+
+    # ── Meta (sync tokens and watermarks) ──
+
+    def get_meta(self, key):
+        with self.lock:
+            row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    def set_meta(self, key, value):
+        with self.lock, self.db:
+            if value is None:
+                self.db.execute("DELETE FROM meta WHERE key = ?", (key,))
+            else:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value)
+                )
+
+    # ── Events ──
+
+    def upsert_events(self, calendar_id, events):
+        """`events` are parsed events with their covered days as `start_date` / `end_date`."""
+        with self.lock, self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO events "
+                "(calendar_id, id, title, start, end, is_all_day, start_date, end_date) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (calendar_id, e["id"], e["title"], e["start"], e["end"],
+                     int(e["is_all_day"]), e["start_date"], e["end_date"])
+                    for e in events
+                ],
+            )
+
+    def delete_events(self, calendar_id, event_ids):
+        with self.lock, self.db:
+            self.db.executemany(
+                "DELETE FROM events WHERE calendar_id = ? AND id = ?",
+                [(calendar_id, i) for i in event_ids],
+            )
+            self.db.executemany(
+                "DELETE FROM recurring WHERE calendar_id = ? AND id = ?",
+                [(calendar_id, i) for i in event_ids],
+            )
+
+            # Instance ids are the master's id, "_" and the original start. A deleted instance must not
+            # come back when its recurring event is expanded
+
+            self.db.executemany(
+                "INSERT OR IGNORE INTO overridden (calendar_id, id) VALUES (?, ?)",
+                [(calendar_id, i) for i in event_ids if "_" in i],
+            )
+
+    def clear_events(self, calendar_id):
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM events WHERE calendar_id = ?", (calendar_id,))
+            self.db.execute("DELETE FROM recurring WHERE calendar_id = ?", (calendar_id,))
+            self.db.execute("DELETE FROM overridden WHERE calendar_id = ?", (calendar_id,))
+
+    # ── Recurring events (when expanded locally) ──
+
+    def upsert_recurring(self, calendar_id, masters):
+        """`masters` are recurring events as Google sends them, with their recurrence lines."""
+        with self.lock, self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO recurring (calendar_id, id, body) VALUES (?, ?, ?)",
+                [(calendar_id, m["id"], json.dumps(m)) for m in masters],
+            )
+
+    def delete_recurring(self, calendar_id, event_ids):
+        with self.lock, self.db:
+            self.db.executemany(
+                "DELETE FROM recurring WHERE calendar_id = ? AND id = ?",
+                [(calendar_id, i) for i in event_ids],
+            )
+
+    def recurring(self, calendar_id):
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT body FROM recurring WHERE calendar_id = ?", (calendar_id,)
+            ).fetchall()
+        return [json.loads(r["body"]) for r in rows]
+
+    def override_instances(self, calendar_id, instance_ids):
+        """Instances modified on their own; they're stored as plain events and not generated from the master."""
+        with self.lock, self.db:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO overridden (calendar_id, id) VALUES (?, ?)",
+                [(calendar_id, i) for i in instance_ids],
+            )
+
+    def overridden(self, calendar_id):
+        with self.lock:
+            rows = self.db.execute("SELECT id FROM overridden WHERE calendar_id = ?", (calendar_id,)).fetchall()
+        return {r["id"] for r in rows}
+
+    def events_between(self, start_date, end_date, calendar_id):
+        """Events of one calendar touching any day in [start_date, end_date] (YYYY-MM-DD), ordered by start."""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT * FROM events WHERE calendar_id = ? AND start_date <= ? AND end_date >= ? "
+                "ORDER BY start",
+                (calendar_id, end_date, start_date),
+            ).fetchall()
+        return [
+            {
+                "id": r["id"],
+                "title": r["title"],
+                "start": r["start"],
+                "end": r["end"],
+                "is_all_day": bool(r["is_all_day"]),
+            }
+            for r in rows
+        ]
+
+    # ── Tasks ──
+
+    def upsert_tasks(self, tasklist, tasks):
+        with self.lock, self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO tasks (tasklist, id, title, notes, due, status) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(tasklist, t["id"], t["title"], t["notes"], t["due"], t["status"]) for t in tasks],
+            )
+
+    def delete_tasks(self, tasklist, task_ids):
+        with self.lock, self.db:
+            self.db.executemany(
+                "DELETE FROM tasks WHERE tasklist = ? AND id = ?",
+                [(tasklist, i) for i in task_ids],
+            )
+
+    def clear_tasks(self, tasklist):
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM tasks WHERE tasklist = ?", (tasklist,))
+
+    def tasks(self, tasklist, status="needsAction"):
+        """Tasks on one list with the given status, undated ones last."""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT * FROM tasks WHERE tasklist = ? AND status = ? ORDER BY due IS NULL, due",
+                (tasklist, status),
+            ).fetchall()
+        return [
+            {
+                "id": r["id"],
+                "title": r["title"],
+                "notes": r["notes"],
+                "due": r["due"],
+                "status": r["status"],
+            }
+            for r in rows
+        ]
+
+    # ── Journal (queued mutations) ──
+
+    def journal_add(self, key, op, target, item_id, body=None):
+        """Queue a mutation under its idempotency key. Returns False if that key is already queued."""
+        with self.lock, self.db:
+            cursor = self.db.execute(
+                "INSERT OR IGNORE INTO journal (key, op, target, item_id, body) VALUES (?, ?, ?, ?, ?)",
+                (key, op, target, item_id, body),
+            )
+        return cursor.rowcount == 1
+
+    def journal_entries(self):
+        """Queued mutations, oldest first."""
+        with self.lock:
+            rows = self.db.execute("SELECT * FROM journal ORDER BY seq").fetchall()
+        return [dict(r) for r in rows]
+
+    def journal_find(self, op, item_id):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT * FROM journal WHERE op = ? AND item_id = ?", (op, item_id)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def journal_update(self, key, body=None, sent=None, item_id=None):
+        with self.lock, self.db:
+            if item_id is not None:
+                self.db.execute("UPDATE journal SET item_id = ? WHERE key = ?", (item_id, key))
+            if body is not None:
+                self.db.execute("UPDATE journal SET body = ? WHERE key = ?", (body, key))
+            if sent is not None:
+                self.db.execute("UPDATE journal SET sent = ? WHERE key = ?", (int(sent), key))
+
+    def journal_remove(self, keys):
+        with self.lock, self.db:
+            self.db.executemany("DELETE FROM journal WHERE key = ?", [(k,) for k in keys])
+
+    @contextmanager
+    def journal_claim(self):
+        """Hold the journal for sending, waiting while another process does. The lock
+        file goes with the process, so one that dies mid-flush doesn't keep it."""
+        with open(self.path + ".lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def clear(self):
+        """Forget everything, used when switching accounts."""
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM events")
+            self.db.execute("DELETE FROM recurring")
+            self.db.execute("DELETE FROM overridden")
+            self.db.execute("DELETE FROM tasks")
+            self.db.execute("DELETE FROM journal")
+            self.db.execute("DELETE FROM meta")
@@ -0,0 +1,103 @@
+import socket
+import threading
+import httplib2
+
+
+# Idle transports kept open between requests. More than this are only opened while the fan-out is
+# that wide, and closed when they come back
+
+POOL_SIZE = 10
+
+# Seconds a request may sit without a byte from Google, as googleapiclient's build_http() sets it,
+# so a stalled network ends in a timeout the scheduler can retry instead of a hang
+
+HTTP_TIMEOUT = 60
+
+
+class _Http(httplib2.Http):
+    """httplib2.Http that tells its pool about every request and every connection it opens."""
+
+    def __init__(self, pool):
+        super().__init__(timeout=pool.timeout)
+        self.pool = pool
+
+        # Google's APIs answer resumable uploads with 308, which isn't a redirect to follow
+
+        self.redirect_codes = self.redirect_codes - {308}
+
+    def _conn_request(self, conn, request_uri, method, body, headers):
+
+        # httplib2 connects in here, on first use and again when a kept-alive socket has gone stale,
+        # so a request that leaves a different socket behind paid for a handshake
+
+        before = conn.sock
+        try:
+            return super()._conn_request(conn, request_uri, method, body, headers)
+        finally:
+            opened = conn.sock is not None and conn.sock is not before
+            self.pool._count(requests=1, connections=int(opened))
+
+
+class ConnectionPool:
+    """A keep-alive connection pool with httplib2's request interface, safe to share
+    between threads. Each request borrows an idle httplib2.Http (the most recently
+    used, so its connection is the warmest) and hands it back afterwards, so one
+    connection to googleapis.com serves the Calendar and Tasks clients and every
+    worker thread in turn."""
+
+    def __init__(self, size=POOL_SIZE):
+        self.size = size
+        self.timeout = socket.getdefaulttimeout() or HTTP_TIMEOUT
+        self.idle = []
+        self.counts = {"requests": 0, "connections": 0}
+        self.lock = threading.Lock()
+
+    def request(self, uri, method="GET", *args, **kwargs):
+        with self.lock:
+            http = self.idle.pop() if self.idle else _Http(self)
+        try:
+            response = http.request(uri, method, *args, **kwargs)
+        except Exception:
+
+            # The connection may be half way through a response, so it isn't handed to anyone else
+
+            http.close()
+            raise
+        with self.lock:
+            if len(self.idle) < self.size:
+                self.idle.append(http)
+                return response
+        http.close()
+        return response
+
+    def stats(self):
+        """Requests sent, connections opened (each one a TCP and TLS handshake) and
+        requests that went out on an already open connection."""
+        with self.lock:
+            counts = dict(self.counts)
+        counts["reused"] = counts["requests"] - counts["connections"]
+        return counts
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for http in idle:
+            http.close()
+
+    def _count(self, **counts):
+        with self.lock:
+            for name, value in counts.items():
+                self.counts[name] += value
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_pool():
+    """The process's connection pool, which every client and service shares."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = ConnectionPool()
+        return _shared
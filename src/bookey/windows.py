@@ -0,0 +1,87 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from bookey import profiler
+
+
+WINDOW_DAYS = 7
+
+# Loaded windows kept around: the one on screen, the one before it and the prefetched next one, plus a spare.
+# Paging further than that reloads, so memory stays the same however far the range goes
+
+WINDOW_CACHE = 4
+
+
+class EventWindows:
+    """A long date range of events split into week-sized windows that are only
+    fetched when asked for. Asking for window i also starts fetching i + 1 in the
+    background, and loaded windows live in a small LRU."""
+
+    def __init__(self, gc, start, days, window_days=WINDOW_DAYS, capacity=WINDOW_CACHE):
+        self.gc = gc
+        self.start = start
+        self.days = days
+        self.window_days = window_days
+        self.capacity = capacity
+        self.count = -(-days // window_days)
+        self.loaded = OrderedDict()
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bookey-prefetch")
+
+    def span(self, index):
+        """(first day, last day) of window `index`, the last one cut short at the end of the range."""
+        first = self.start + timedelta(days=index * self.window_days)
+        last = min(first + timedelta(days=self.window_days - 1), self.start + timedelta(days=self.days - 1))
+        return first, last
+
+    def get(self, index):
+        """Day buckets ({"YYYY-MM-DD": [events]}) of window `index`, waiting for it if it isn't loaded yet."""
+        with self.lock:
+            slots = self.loaded.get(index)
+            if slots is not None:
+                self.loaded.move_to_end(index)
+            future = self.pending.get(index)
+        if slots is None:
+            if future is not None:
+                with profiler.phase("window wait"):
+                    slots = future.result()
+            else:
+                slots = self._load(index)
+        if index + 1 < self.count:
+            self.prefetch(index + 1)
+        return slots
+
+    def prefetch(self, index):
+        with self.lock:
+            if index in self.loaded or index in self.pending:
+                return
+            self.pending[index] = self.pool.submit(self._load, index)
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def _load(self, index):
+        first, last = self.span(index)
+
+        # Always a whole week from getCalendarSlots (which reads 3 days as yesterday to tomorrow), trimmed after
+
+        try:
+            with profiler.phase("window load"):
+                slots = self.gc.getCalendarSlots(first, self.window_days)
+            end = last.strftime("%Y-%m-%d")
+            slots = {day: events for day, events in slots.items() if day <= end}
+            with self.lock:
+                self.loaded[index] = slots
+                self.loaded.move_to_end(index)
+                while len(self.loaded) > self.capacity:
+                    self.loaded.popitem(last=False)
+            return slots
+        finally:
+
+            # A failed prefetch is forgotten, so the next get() tries again in the foreground
+
+            with self.lock:
+                self.pending.pop(index, None)